@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the annotation database against a directory of annotation
+files: the box counts of the file list, reading every box for export
+and loading single images.
+
+    python benchmarks/benchAnnotationDb.py [files] [boxes per file]
+"""
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchVocBatch import writeFiles
+from libs.annotationDb import AnnotationDb, ANNOTATION_DB, dbKey
+from libs.pascal_voc_io import PascalVocReader, readVocBatch
+
+
+def timed(name, function, *args):
+    start = time.time()
+    result = function(*args)
+    print('%-28s %8.3f s' % (name, time.time() - start))
+    return result
+
+
+def main(files, boxes):
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = writeFiles(tmp, files, boxes)
+        db = AnnotationDb(os.path.join(tmp, ANNOTATION_DB))
+        timed('importVoc', db.importVoc, tmp)
+        keys = [dbKey(tmp, path) for path in paths]
+
+        batch = timed('files: readVocBatch', readVocBatch, paths)
+        columns = timed('db: readColumns', db.readColumns, keys)
+        counts = timed('db: boxCounts', db.boxCounts, keys)
+        assert counts == batch.counts().tolist() == columns.counts().tolist()
+        assert np.allclose(batch.corners, columns.corners)
+
+        sample = random.Random(0).sample(range(files), min(files, 1000))
+        timed('files: load %d' % len(sample),
+              lambda: [PascalVocReader(paths[i]).getShapes() for i in sample])
+        timed('db: load %d' % len(sample), lambda: [db.load(keys[i]).getShapes() for i in sample])
+        db.close()
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
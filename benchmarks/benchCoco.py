@@ -0,0 +1,55 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time COCO export of a directory of annotation files and import of
+the result, and check that the boxes survive the round trip.
+
+    python benchmarks/benchCoco.py [files] [boxes per file]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchVocBatch import writeFiles
+from libs.coco_io import exportCoco, importCoco, vocRecords
+from libs.pascal_voc_io import readVocBatch
+
+
+def main(files, boxes):
+    tmp = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp, 'src')
+        os.makedirs(src)
+        paths = writeFiles(src, files, boxes)
+        out = os.path.join(tmp, 'coco.json')
+
+        start = time.time()
+        errors = []
+        exportCoco(out, vocRecords(paths, errors))
+        print('%-12s %8.3f s %8.1f MB' % ('export', time.time() - start,
+                                          os.path.getsize(out) / 1e6))
+
+        start = time.time()
+        dst = os.path.join(tmp, 'dst')
+        written, skipped = importCoco(out, 'imgs', dst)
+        print('%-12s %8.3f s' % ('import', time.time() - start))
+
+        assert written == files and not skipped and not errors
+        before = readVocBatch(paths)
+        after = readVocBatch([os.path.join(dst, os.path.basename(path)) for path in paths])
+        assert before.classes == after.classes and (before.classId == after.classId).all()
+        assert np.allclose(before.corners, after.corners, atol=1e-3)
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
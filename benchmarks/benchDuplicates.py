@@ -0,0 +1,46 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the duplicate finder on one crowded image of rotated boxes,
+sparse and dense.
+
+    python benchmarks/benchDuplicates.py [count]
+"""
+from __future__ import print_function
+
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs import geometry
+from libs.duplicates import findDuplicates
+
+
+def boxes(rng, count, extent):
+    return np.column_stack([rng.uniform(0, extent, count), rng.uniform(0, extent, count),
+                            rng.uniform(10, 60, count), rng.uniform(10, 60, count),
+                            rng.uniform(0, 2 * np.pi, count)])
+
+
+def main(count):
+    rng = np.random.RandomState(0)
+    for name, extent in (('sparse', 4000), ('dense', 1000)):
+        rotated = boxes(rng, count, extent)
+        # Redraw one box in fifty with a little jitter.
+        copies = rotated[::50].copy()
+        copies[:, :2] += rng.uniform(-1, 1, (len(copies), 2))
+        corners = geometry.rotatedToCorners(np.vstack([rotated, copies]))
+        start = time.time()
+        pairs = geometry.aabbPairs(geometry.cornersToAABB(corners))
+        overlaps = findDuplicates(corners)
+        elapsed = time.time() - start
+        print('%-6s %d boxes, %d bbox pairs, %d overlaps (%d duplicates) in %.3f s'
+              % (name, len(corners), len(pairs), len(overlaps),
+                 sum(o.kind == 'duplicate' for o in overlaps), elapsed))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 10000)
@@ -0,0 +1,97 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time the batched box conversions of libs.geometry against the
+per-box Python loops they replaced.
+
+    python benchmarks/benchGeometry.py [count]
+"""
+from __future__ import print_function
+
+import math
+import os
+import sys
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs import geometry
+
+
+def loopBndBox(corners):
+    out = []
+    for points in corners:
+        xs = [p[0] for p in points]
+        ys = [p[1] for p in points]
+        out.append((int(max(1, min(xs))), int(max(1, min(ys))), int(max(xs)), int(max(ys))))
+    return out
+
+
+def loopRotated(corners, directions):
+    out = []
+    for points, direction in zip(corners, directions):
+        cx = (points[0][0] + points[2][0]) / 2
+        cy = (points[0][1] + points[2][1]) / 2
+        w = math.sqrt((points[0][0] - points[1][0]) ** 2 + (points[0][1] - points[1][1]) ** 2)
+        h = math.sqrt((points[2][0] - points[1][0]) ** 2 + (points[2][1] - points[1][1]) ** 2)
+        out.append((cx, cy, w, h, direction % (2 * math.pi)))
+    return out
+
+
+def loopCorners(boxes):
+    out = []
+    for cx, cy, w, h, angle in boxes:
+        c, s = math.cos(-angle), math.sin(-angle)
+        points = []
+        for x, y in ((-w / 2, -h / 2), (w / 2, -h / 2), (w / 2, h / 2), (-w / 2, h / 2)):
+            points.append((cx + c * x + s * y, cy - s * x + c * y))
+        out.append(points)
+    return out
+
+
+def loopYolo(aabbs, width, height):
+    dw, dh = 1. / width, 1. / height
+    return [((x0 + x1) / 2.0 * dw, (y0 + y1) / 2.0 * dh, (x1 - x0) * dw, (y1 - y0) * dh)
+            for x0, y0, x1, y1 in aabbs]
+
+
+def timed(name, fn, *args):
+    start = time.time()
+    result = fn(*args)
+    elapsed = time.time() - start
+    print('%-28s %8.3f s' % (name, elapsed))
+    return result, elapsed
+
+
+def main(count):
+    rng = np.random.RandomState(0)
+    boxes = np.column_stack([rng.uniform(0, 4000, count), rng.uniform(0, 3000, count),
+                             rng.uniform(4, 400, count), rng.uniform(4, 400, count),
+                             rng.uniform(0, 2 * np.pi, count)])
+    print('%d boxes' % count)
+
+    rows = [
+        ('rotated -> corners', loopCorners, (boxes.tolist(),),
+         geometry.rotatedToCorners, (boxes,)),
+    ]
+    corners = geometry.rotatedToCorners(boxes)
+    cornerList = corners.tolist()
+    aabbs = geometry.cornersToAABB(corners)
+    rows += [
+        ('corners -> bndbox', loopBndBox, (cornerList,),
+         geometry.cornersToBndBox, (corners,)),
+        ('corners -> rotated', loopRotated, (cornerList, boxes[:, 4].tolist()),
+         geometry.cornersToRotated, (corners, boxes[:, 4])),
+        ('bndbox -> yolo', loopYolo, (aabbs.tolist(), 4000, 3000),
+         geometry.aabbToYolo, (aabbs, 4000, 3000)),
+    ]
+    for name, loop, loopArgs, batched, batchedArgs in rows:
+        expected, slow = timed(name + ' (loop)', loop, *loopArgs)
+        result, fast = timed(name + ' (numpy)', batched, *batchedArgs)
+        assert np.allclose(np.asarray(expected, dtype=float), result)
+        print('%-28s %8.1fx' % ('', slow / fast))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 1000000)
@@ -0,0 +1,64 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Memory and time to build the Shape objects of one crowded image, the
+way MainWindow.loadLabels does.
+
+    python benchmarks/benchShapes.py [count]
+"""
+from __future__ import print_function
+
+import gc
+import os
+import sys
+import time
+import tracemalloc
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs.palette import Palette
+from libs.shape import Shape
+from libs.shapeStore import ShapeStore
+
+
+def build(count, labels):
+    rng = np.random.RandomState(0)
+    xy = rng.uniform(0, 4000, (count, 2))
+    wh = rng.uniform(4, 40, (count, 2))
+    points = np.stack([xy, xy + [1, 0] * wh, xy + wh, xy + [0, 1] * wh], axis=1)
+    names = [labels[i % len(labels)] for i in range(count)]
+
+    palette = Palette()
+    store = ShapeStore(count)
+    rows = store.extend(points, names)
+    shapes = []
+    for row, label in zip(rows, names):
+        shape = Shape.fromStore(store, row)
+        shape.close()
+        shape.line_color = palette.color(label)
+        shape.fill_color = palette.color(label)
+        shapes.append(shape)
+    return store, shapes
+
+
+def main(count):
+    labels = ['head', 'person', 'face', 'car']
+    gc.collect()
+    tracemalloc.start()
+    start = time.time()
+    store, shapes = build(count, labels)
+    elapsed = time.time() - start
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    colors = set(id(s.line_color) for s in shapes)
+    print('%d shapes in %.3f s' % (count, elapsed))
+    print('allocated %.1f MB (peak %.1f MB), %.0f bytes per shape'
+          % (current / 1e6, peak / 1e6, float(current) / count))
+    print('instance __dict__: %s, distinct QColors: %d'
+          % (hasattr(shapes[0], '__dict__'), len(colors)))
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
@@ -0,0 +1,70 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time readVocBatch over a directory of annotation files against
+reading them one PascalVocReader at a time.
+
+    python benchmarks/benchVocBatch.py [files] [boxes per file]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs.pascal_voc_io import PascalVocReader, PascalVocWriter, readVocBatch
+
+
+def writeFiles(directory, files, boxes):
+    rng = np.random.RandomState(0)
+    paths = []
+    for n in range(files):
+        writer = PascalVocWriter('imgs', '%06d.jpg' % n, [1080, 1920, 3])
+        for i in range(rng.randint(boxes // 2, boxes * 3 // 2 + 1)):
+            x, y = rng.randint(1, 1800), rng.randint(1, 1000)
+            if i % 5:
+                writer.addBndBox(x, y, x + 40, y + 60, 'label%d' % rng.randint(20), 0, None)
+            else:
+                writer.addRotatedBndBox(x, y, 40.0, 20.0, 0.5, 'rotated', 1, None)
+        path = os.path.join(directory, '%06d.xml' % n)
+        writer.save(path)
+        paths.append(path)
+    return paths
+
+
+def main(files, boxes):
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = writeFiles(tmp, files, boxes)
+
+        start = time.time()
+        shapes = [PascalVocReader(path).getShapes() for path in paths]
+        slow = time.time() - start
+        total = sum(len(s) for s in shapes)
+        print('%d files, %d boxes' % (files, total))
+        print('%-24s %8.3f s' % ('PascalVocReader loop', slow))
+
+        for processes in (1, None):
+            start = time.time()
+            batch = readVocBatch(paths, processes=processes)
+            fast = time.time() - start
+            print('%-24s %8.3f s %8.1fx' % ('readVocBatch (%s)' % (processes or 'all CPUs'),
+                                             fast, slow / fast))
+
+        assert len(batch) == total and not batch.errors
+        assert batch.counts().tolist() == [len(s) for s in shapes]
+        flat = [shape for s in shapes for shape in s]
+        assert [batch.classes[i] for i in batch.classId] == [s[0] for s in flat]
+        assert np.allclose(batch.corners, [s[1] for s in flat])
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,59 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time readVocCached with no cache, with a fresh one and with one file
+changed, against readVocBatch.
+
+    python benchmarks/benchVocCache.py [files] [boxes per file]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from benchVocBatch import writeFiles
+from libs import vocCache
+from libs.pascal_voc_io import PascalVocWriter, readVocBatch
+from libs.vocCache import readVocCached
+
+
+def timed(name, function, *args):
+    start = time.time()
+    result = function(*args)
+    print('%-28s %8.3f s' % (name, time.time() - start))
+    return result
+
+
+def main(files, boxes):
+    tmp = tempfile.mkdtemp()
+    try:
+        paths = writeFiles(tmp, files, boxes)
+        expected = timed('readVocBatch', readVocBatch, paths)
+        timed('readVocCached, no cache', readVocCached, paths)
+        # As a new process would, with the cache file only.
+        vocCache._memory.clear()
+        cached = timed('readVocCached, from file', readVocCached, paths)
+        timed('readVocCached, in memory', readVocCached, paths)
+
+        writer = PascalVocWriter('imgs', 'changed.jpg', [1080, 1920, 3])
+        writer.addBndBox(1, 1, 10, 10, 'changed', 0, None)
+        writer.save(paths[0])
+        changed = timed('readVocCached, 1 changed', readVocCached, paths)
+
+        assert cached.classes == expected.classes
+        assert (cached.classId == expected.classId).all()
+        assert np.array_equal(cached.corners, expected.corners)
+        assert changed.shapes(0)[0][0] == 'changed'
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 20)
@@ -0,0 +1,76 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time PascalVocReader on one crowded annotation file against the
+eval() based parsing it replaced.
+
+    python benchmarks/benchVocReader.py [count]
+"""
+from __future__ import print_function
+
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import numpy as np
+from lxml import etree
+from xml.etree import ElementTree
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs.pascal_voc_io import PascalVocReader, PascalVocWriter
+
+
+def evalParse(path):
+    parser = etree.XMLParser(encoding='utf-8')
+    root = ElementTree.parse(path, parser=parser).getroot()
+    size = root.find('size')
+    size = [eval(size.find(tag).text) for tag in ('width', 'height', 'depth')]
+    shapes = []
+    for obj in root.findall('object'):
+        bndbox = obj.find('bndbox')
+        if bndbox is None:
+            continue
+        xmin, ymin, xmax, ymax = [int(eval(bndbox.find(tag).text))
+                                  for tag in ('xmin', 'ymin', 'xmax', 'ymax')]
+        shapes.append((obj.find('name').text,
+                       [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]))
+    return size, shapes
+
+
+def write(path, count):
+    rng = np.random.RandomState(0)
+    xy = rng.randint(1, 3000, (count, 2))
+    wh = rng.randint(4, 400, (count, 2))
+    writer = PascalVocWriter('imgs', 'crowd.jpg', [4000, 4000, 3])
+    for i, ((x, y), (w, h)) in enumerate(zip(xy.tolist(), wh.tolist())):
+        writer.addBndBox(x, y, x + w, y + h, 'label%d' % (i % 20), i % 7 == 0, None)
+    writer.save(path)
+
+
+def main(count):
+    tmp = tempfile.mkdtemp()
+    try:
+        path = os.path.join(tmp, 'crowd.xml')
+        write(path, count)
+        print('%d objects, %.1f MB' % (count, os.path.getsize(path) / 1e6))
+
+        start = time.time()
+        _, expected = evalParse(path)
+        slow = time.time() - start
+        print('%-20s %8.3f s' % ('eval', slow))
+
+        start = time.time()
+        shapes = PascalVocReader(path).getShapes()
+        fast = time.time() - start
+        print('%-20s %8.3f s' % ('PascalVocReader', fast))
+
+        assert [s[:2] for s in shapes] == expected
+        print('%-20s %8.1fx' % ('', slow / fast))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 100000)
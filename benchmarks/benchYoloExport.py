@@ -0,0 +1,84 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Time cvt_lbidata_rotdet in this process against the process pool,
+and check both write the same files, then time the image modes that
+do not transcode.
+
+    python benchmarks/benchYoloExport.py [images] [size]
+"""
+from __future__ import print_function
+
+import filecmp
+import os
+import shutil
+import sys
+import tempfile
+import time
+
+import cv2
+import numpy as np
+
+sys.path.insert(0, os.path.join(os.path.dirname(os.path.abspath(__file__)), '..'))
+
+from libs.cvtlabels2yolo import cvt_lbidata_rotdet
+
+
+def writeImages(directory, count, size):
+    rng = np.random.RandomState(0)
+    shapes = {}
+    for n in range(count):
+        name = '%06d.jpg' % n
+        img = cv2.GaussianBlur(rng.randint(0, 256, (size, size, 3), np.uint8), (9, 9), 0)
+        cv2.imwrite(os.path.join(directory, name), img)
+        bboxes = []
+        for i in range(rng.randint(1, 10)):
+            x, y = rng.randint(1, size - 60, 2).tolist()
+            bboxes.append({'class': 'c%d' % (i % 3), 'is_rot': 0, 'x0': x, 'y0': y,
+                           'x1': x + 50, 'y1': y, 'x2': x + 50, 'y2': y + 40,
+                           'x3': x, 'y3': y + 40})
+        shapes[name] = {'width': size, 'height': size, 'bboxes': bboxes}
+    return shapes
+
+
+def sameTree(a, b):
+    cmp = filecmp.dircmp(a, b)
+    if cmp.left_only or cmp.right_only or \
+            filecmp.cmpfiles(a, b, cmp.common_files, shallow=False)[1:] != ([], []):
+        return False
+    return all(sameTree(os.path.join(a, d), os.path.join(b, d)) for d in cmp.common_dirs)
+
+
+def main(count, size):
+    tmp = tempfile.mkdtemp()
+    try:
+        src = os.path.join(tmp, 'src')
+        os.makedirs(src)
+        shapes = writeImages(src, count, size)
+        classes = {'c0': 0, 'c1': 1, 'c2': 2}
+        outputs = []
+        for processes in (1, None):
+            out = os.path.join(tmp, 'out%s' % processes)
+            start = time.time()
+            failures = cvt_lbidata_rotdet(src, shapes, classes, out, processes=processes)
+            elapsed = time.time() - start
+            print('%-16s %8.3f s %8.1f images/s' % ('processes=%s' % (processes or 'all'),
+                                                     elapsed, count / elapsed))
+            assert not failures
+            outputs.append(out)
+        assert sameTree(*outputs)
+
+        for mode in ('copy', 'hardlink', 'symlink'):
+            out = os.path.join(tmp, mode)
+            start = time.time()
+            failures = cvt_lbidata_rotdet(src, shapes, classes, out, image_mode=mode)
+            elapsed = time.time() - start
+            print('%-16s %8.3f s %8.1f images/s' % (mode, elapsed, count / elapsed))
+            assert not failures
+            assert sameTree(os.path.join(out, 'labels'), os.path.join(outputs[0], 'labels'))
+    finally:
+        shutil.rmtree(tmp)
+
+
+if __name__ == '__main__':
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else 500,
+         int(sys.argv[2]) if len(sys.argv) > 2 else 1024)
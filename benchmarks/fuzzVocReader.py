@@ -0,0 +1,102 @@
+#!/usr/bin/env python
+# -*- coding: utf-8 -*-
+"""Check that PascalVocReader fails on malformed files with a
+PascalVocError and nothing else.
+
+The files of vocCorpus/ named bad_* must be rejected and the ok_* ones
+read. Then rounds random mutations of a valid file, bytes flipped,
+dropped or repeated, are read and must either parse or raise
+PascalVocError.
+
+    python benchmarks/fuzzVocReader.py [rounds]
+"""
+from __future__ import print_function
+
+import os
+import random
+import shutil
+import sys
+import tempfile
+
+HERE = os.path.dirname(os.path.abspath(__file__))
+sys.path.insert(0, os.path.join(HERE, '..'))
+
+from libs.pascal_voc_io import PascalVocReader, PascalVocError, PascalVocWriter
+
+CORPUS = os.path.join(HERE, 'vocCorpus')
+
+
+def corpus():
+    failures = 0
+    for name in sorted(os.listdir(CORPUS)):
+        path = os.path.join(CORPUS, name)
+        try:
+            PascalVocReader(path)
+            error = None
+        except PascalVocError as e:
+            error = e
+        if name.startswith('bad_') and error is None:
+            print('FAIL %s was read' % name)
+            failures += 1
+        elif name.startswith('ok_') and error is not None:
+            print('FAIL %s' % error)
+            failures += 1
+        else:
+            print('ok   %s%s' % (name, '' if error is None else ': %s' % error.reason))
+    return failures
+
+
+def sample(path):
+    writer = PascalVocWriter('imgs', 'a.jpg', [480, 640, 3])
+    writer.addBndBox(10, 20, 120, 80, u'dög', 0, u'x')
+    writer.addBndBox(1, 1, 640, 480, 'cat', 1, None)
+    writer.addRotatedBndBox(50.5, 60.0, 30.0, 10.0, 1.25, 'plane', 0, None)
+    writer.save(path)
+    with open(path, 'rb') as f:
+        return bytearray(f.read())
+
+
+def mutate(data, rng):
+    data = bytearray(data)
+    for _ in range(rng.randint(1, 4)):
+        i = rng.randrange(len(data))
+        op = rng.randrange(3)
+        if op == 0:
+            data[i] = rng.choice(b'<>/&;.-e0123456789 \t\n\xff')
+        elif op == 1:
+            del data[i:i + rng.randint(1, 8)]
+        else:
+            data[i:i] = data[i:i + rng.randint(1, 8)]
+    return data
+
+
+def fuzz(rounds):
+    tmp = tempfile.mkdtemp()
+    rng = random.Random(0)
+    failures = rejected = 0
+    try:
+        path = os.path.join(tmp, 'fuzz.xml')
+        valid = sample(path)
+        for _ in range(rounds):
+            with open(path, 'wb') as f:
+                f.write(mutate(valid, rng))
+            try:
+                PascalVocReader(path)
+            except PascalVocError:
+                rejected += 1
+            except Exception as e:
+                failures += 1
+                print('FAIL %s: %r' % (type(e).__name__, e))
+    finally:
+        shutil.rmtree(tmp)
+    print('%d mutations, %d rejected, %d unexpected errors' % (rounds, rejected, failures))
+    return failures
+
+
+def main(rounds):
+    failures = corpus() + fuzz(rounds)
+    return 1 if failures else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main(int(sys.argv[1]) if len(sys.argv) > 1 else 20000))
@@ -3,12 +3,14 @@
 from __future__ import absolute_import
 
 import codecs
+import html
 import os
 import platform
 import re
 import sys
 import subprocess
 import yaml, yamlloader
+import numpy as np
 from functools import partial
 from collections import defaultdict, OrderedDict
 
@@ -19,18 +21,28 @@ from PyQt5.QtCore import QCollator, QLocale
 
 # Add internal libs
 from libs.constants import *
-from libs.lib import struct, newAction, newIcon, addActions, fmtShortcut, generateColorByText
+from libs.lib import struct, newAction, newIcon, addActions, fmtShortcut, LabelHist
 from libs.settings import Settings
+from libs.palette import Palette
 from libs.shape import Shape, DEFAULT_LINE_COLOR, DEFAULT_FILL_COLOR
+from libs.shapeStore import ShapeStore
+from libs.undoStack import UndoEntry, DEFAULT_UNDO_LIMIT
 from libs.canvas import Canvas
 from libs.zoomWidget import ZoomWidget
 from libs.labelDialog import LabelDialog
 from libs.labelFile import LabelFile, LabelFileError
-from libs.pascal_voc_io import PascalVocReader, XML_EXT
+from libs.annotationWriter import AnnotationWriter
+from libs.annotationDb import AnnotationDb, ANNOTATION_DB, dbKey, hasAnnotationDb
+from libs.coco_io import CocoError, exportCoco, importCoco
+from libs.vocCache import readCached, readVocCached
+from libs.pascal_voc_io import PascalVocError, XML_EXT
 
-from libs.labelView import CLabelView, HashableQStandardItem
+from libs.labelView import CLabelView, rowRanges
 from libs.fileView import CFileView
+from libs.miniMap import CMiniMap
 from libs.cvtlabels2yolo import cvt_lbidata_rotdet
+from libs.duplicates import findDuplicates, datasetReport
+from libs import geometry
 
 __appname__ = 'labelImg2'
 
@@ -83,12 +95,21 @@ class MainWindow(QMainWindow, WindowMixin):
 
         # For loading all image under a directory
         self.dirname = None
-        self.labelHist = []
+        self.labelHist = LabelHist()
         self.lastOpenDir = None
 
         # Whether we need to save or not.
         self.dirty = False
 
+        # Annotation files are written off the GUI thread.
+        self.annotationWriter = AnnotationWriter(self)
+        self.annotationWriter.failed.connect(self.annotationSaveFailed)
+        # PascalVocWriter.digest of what each annotation file holds, by
+        # absolute path, as loaded or last saved.
+        self.savedDigests = {}
+        # AnnotationDb of each save directory holding one, by path.
+        self.annotationDbs = {}
+
         self.back_sample = False
 
         self._noSelectionSlot = False
@@ -96,12 +117,13 @@ class MainWindow(QMainWindow, WindowMixin):
         # Load predefined classes to the list
         self.loadPredefinedClasses(defaultPrefdefClassFile)
 
+        # Class colours, computed once and shared by shapes and list rows
+        self.colorPalette = Palette(settings.get(SETTING_CLASS_COLORS, {}))
+        self.colorPalette.seed(self.labelHist)
+
         # Main widgets and related state.
         self.labelDialog = LabelDialog(parent=self, listItem=self.labelHist)
 
-        self.ShapeItemDict = {}
-        self.ItemShapeDict = {}
-
         labellistLayout = QVBoxLayout()
         labellistLayout.setContentsMargins(0, 0, 0, 0)
 
@@ -121,14 +143,15 @@ class MainWindow(QMainWindow, WindowMixin):
         labelListContainer = QWidget()
         labelListContainer.setLayout(labellistLayout)
 
-        self.labelList = CLabelView(self.labelHist)
+        self.labelList = CLabelView(self.labelHist, self.colorPalette)
         self.labelModel = self.labelList.model()
-        self.labelModel.dataChanged.connect(self.labelDataChanged)
+        self.labelModel.labelEdited.connect(self.labelEdited)
         
         self.labelList.extraEditing.connect(self.updateLabelShowing)
 
         self.labelsm = self.labelList.selectionModel()
         self.labelsm.currentChanged.connect(self.labelCurrentChanged)
+        self.labelsm.selectionChanged.connect(self.labelSelectionChanged)
 
         myHeader = self.labelList.verticalHeader()
         myHeader.clicked.connect(self.labelHeaderClicked)
@@ -197,11 +220,21 @@ class MainWindow(QMainWindow, WindowMixin):
         self.canvas.cancelDraw.connect(self.createCancel)
         self.canvas.toggleEdit.connect(self.toggleExtraEditing)
 
+        self.miniMap = CMiniMap(self.canvas, scroll)
+        # Every committed edit, add, remove, undo and redo goes through
+        # the history, not every frame of a drag.
+        self.canvas.history.changed.connect(self.miniMap.shapesChanged)
+        self.miniMapDock = QDockWidget(u'Overview', self)
+        self.miniMapDock.setObjectName(u'Overview')
+        self.miniMapDock.setWidget(self.miniMap)
+
         self.setCentralWidget(scroll)
         self.addDockWidget(Qt.RightDockWidgetArea, self.dock)
         self.addDockWidget(Qt.RightDockWidgetArea, self.filedock)
+        self.addDockWidget(Qt.RightDockWidgetArea, self.miniMapDock)
         self.dock.setFeatures(QDockWidget.DockWidgetFloatable)
         self.filedock.setFeatures(QDockWidget.DockWidgetFloatable)
+        self.miniMapDock.setFeatures(QDockWidget.DockWidgetFloatable | QDockWidget.DockWidgetClosable)
 
         self.displayTimer = QTimer(self)
         self.displayTimer.setInterval(1000)
@@ -264,6 +297,23 @@ class MainWindow(QMainWindow, WindowMixin):
                       'Ctrl+D', 'copy.svg', u'Create a duplicate of the selected Box',
                       enabled=False)
 
+        undo = action('&Undo', self.undo,
+                      'Ctrl+Z', None, u'Undo the last change to the boxes', enabled=False)
+        redo = action('&Redo', self.redo,
+                      'Ctrl+Y', None, u'Redo the last undone change', enabled=False)
+
+        selectAll = action('Select &All', self.selectAllShapes,
+                           'Ctrl+A', None, u'Select every box of the image', enabled=False)
+        classColor = action('Class &Colour...', self.changeClassColor,
+                            None, 'bucket.svg', u'Change the colour of the class of the selected Box',
+                            enabled=False)
+        findDups = action('Find &Duplicates', self.findDuplicateShapes,
+                          None, 'find.svg', u'Flag boxes drawn over the same object twice',
+                          enabled=False)
+        relabel = action('&Relabel Selected', self.relabelSelected,
+                         'Ctrl+L', 'tags.svg', u'Give all the selected boxes one label',
+                         enabled=False)
+
         showInfo = action('&About', self.showInfoDialog, None, 'info.svg', u'About')
 
         zoom = QWidgetAction(self)
@@ -319,24 +369,25 @@ class MainWindow(QMainWindow, WindowMixin):
 
         # Lavel list context menu.
         labelMenu = QMenu()
-        addActions(labelMenu, (edit, delete))
+        addActions(labelMenu, (edit, relabel, delete))
 
         # Store actions for further handling.
         self.actions = struct(save=save, saveAs=saveAs, open=open, close=close, resetAll = resetAll,
                               create=create, createSo=createSo, createRo=createRo, delete=delete, 
                               labelAsBack=labelAsBack, deleteLabel=deleteLabel, edit=edit, copy=copy,
+                              undo=undo, redo=redo, selectAll=selectAll, relabel=relabel, classColor=classColor, findDups=findDups,
                               zoom=zoom, zoomIn=zoomIn, zoomOut=zoomOut, zoomOrg=zoomOrg,
                               fitWindow=fitWindow, fitWidth=fitWidth, play=play,
                               zoomActions=zoomActions,
                               fileMenuActions=(
                                   open, opendir, save, saveAs, close, resetAll, quit),
                               beginner=(),
-                              editMenu=(edit, copy, delete,
-                                        None),
-                              beginnerContext=(create, createSo, createRo, copy, delete, labelAsBack, deleteLabel),
+                              editMenu=(undo, redo, None, selectAll, edit, relabel, classColor, copy, delete,
+                                        None, findDups),
+                              beginnerContext=(create, createSo, createRo, copy, relabel, delete, labelAsBack, deleteLabel),
                               onLoadActive=(
                                   close, create),
-                              onShapesPresent=(saveAs,))
+                              onShapesPresent=(saveAs, selectAll, findDups))
 
         self.menus = struct(
             file=self.menu('&File'),
@@ -363,6 +414,18 @@ class MainWindow(QMainWindow, WindowMixin):
         self.drawCorner.setCheckable(True)
         self.drawCorner.setChecked(settings.get(SETTING_DRAW_CORNER, False))
         self.drawCorner.triggered.connect(self.canvas.setDrawCornerState)
+
+        self.magnifier = QAction('Magnifier', self)
+        self.magnifier.setCheckable(True)
+        self.magnifier.setChecked(settings.get(SETTING_MAGNIFIER, False))
+        self.magnifier.triggered.connect(self.canvas.setLoupeEnabled)
+        self.canvas.setLoupeEnabled(self.magnifier.isChecked())
+
+        # Frame-time HUD, also enabled by the LABELIMG2_PROFILE environment variable
+        self.renderProfiler = QAction('Render Profiler', self)
+        self.renderProfiler.setCheckable(True)
+        self.renderProfiler.setChecked(self.canvas.profiler.enabled)
+        self.renderProfiler.triggered.connect(self.canvas.setProfiling)
         
         addActions(self.menus.file,
                    (open, opendir, changeSavedir, openAnnotation, self.menus.recentFiles, self.menus.exportAnnotations, 
@@ -373,12 +436,45 @@ class MainWindow(QMainWindow, WindowMixin):
 
         addActions(self.menus.exportAnnotations, (export_as_yolo, export_as_yolo_obb,))
 
+        # How YOLO exports write the images, one of YOLO_IMAGE_MODES.
+        yoloImages = self.menus.exportAnnotations.addMenu('YOLO Images')
+        self.yoloImageModes = QActionGroup(self)
+        yoloImageMode = settings.get(SETTING_YOLO_IMAGES, 'png')
+        for key, text in YOLO_IMAGE_MODES:
+            mode = QAction(text, self.yoloImageModes)
+            mode.setCheckable(True)
+            mode.setData(key)
+            mode.setChecked(key == yoloImageMode)
+            yoloImages.addAction(mode)
+        if self.yoloImageModes.checkedAction() is None:
+            self.yoloImageModes.actions()[0].setChecked(True)
+
+        duplicateReport = action('Duplicate &Report...', self.duplicateReport,
+                                 None, 'find.svg', u'List the duplicate boxes of every annotation file')
+        self.menus.file.insertAction(save, duplicateReport)
+
+        importDb = action('&Import into Database...', self.importAnnotationDb,
+                          None, 'open.svg', u'Store the annotation files of the save folder in %s' % ANNOTATION_DB)
+        exportDb = action('Annotation Files from Database', self.exportAnnotationDb,
+                          None, None, u'Write the annotations of %s as files' % ANNOTATION_DB)
+        self.menus.file.insertAction(save, importDb)
+        addActions(self.menus.exportAnnotations, (exportDb,))
+
+        importCocoAction = action('Import &COCO...', self.importCocoDialog,
+                                  None, 'open.svg', u'Write the annotations of a COCO JSON file to the save folder')
+        exportCocoAction = action('COCO JSON', self.exportCocoDialog)
+        self.menus.file.insertAction(save, importCocoAction)
+        addActions(self.menus.exportAnnotations, (exportCocoAction,))
+
         addActions(self.menus.help, (showInfo,))
         addActions(self.menus.view, (
             self.autoSaving,
             self.paintLabelsOption,
             self.drawCorner,
+            self.magnifier,
+            self.miniMapDock.toggleViewAction(),
             None,
+            self.renderProfiler,
             None,
             zoomIn, zoomOut, zoomOrg, None,
             fitWindow, fitWidth))
@@ -431,11 +527,11 @@ class MainWindow(QMainWindow, WindowMixin):
             self.statusBar().show()
 
         self.restoreState(settings.get(SETTING_WIN_STATE, QByteArray()))
-        Shape.line_color = self.lineColor = QColor(settings.get(SETTING_LINE_COLOR, DEFAULT_LINE_COLOR))
-        Shape.fill_color = self.fillColor = QColor(settings.get(SETTING_FILL_COLOR, DEFAULT_FILL_COLOR))
+        Shape.default_line_color = self.lineColor = QColor(settings.get(SETTING_LINE_COLOR, DEFAULT_LINE_COLOR))
+        Shape.default_fill_color = self.fillColor = QColor(settings.get(SETTING_FILL_COLOR, DEFAULT_FILL_COLOR))
         self.canvas.setDrawingColor(self.lineColor)
-        # Add chris
-        Shape.difficult = self.difficult
+        self.canvas.history.limit = settings.get(SETTING_UNDO_LIMIT, DEFAULT_UNDO_LIMIT)
+        self.canvas.history.changed.connect(self.updateUndoActions)
 
         # Populate the File menu dynamically.
         self.updateFileMenu()
@@ -466,7 +562,7 @@ class MainWindow(QMainWindow, WindowMixin):
             self.openDirDialog(dirpath=self.filePath)
 
     def noShapes(self):
-        return not self.ItemShapeDict
+        return not self.labelModel.rowCount()
 
     def populateModeActions(self):
         tool, menu = self.actions.beginner, self.actions.beginnerContext
@@ -526,41 +622,33 @@ class MainWindow(QMainWindow, WindowMixin):
 
     def resetState(self):
         self.labelModel.clear()
-        self.labelModel.setHorizontalHeaderLabels(["Label", "Extra Info"])
-        self.ShapeItemDict.clear()
-        self.ItemShapeDict.clear()
         self.filePath = None
         self.imageData = None
         self.labelFile = None
         self.canvas.resetState()
+        self.miniMap.reset()
         self.labelCoordinates.clear()
         self.imageDim.clear()
 
-    def labelDataChanged(self, topLeft, bottomRight):
-        item0 = self.labelModel.item(topLeft.row(), 0)
-        shape = self.ItemShapeDict[item0]
-        if topLeft.column() == 0:
-            shape.label = self.labelModel.data(topLeft)
-            if sys.version_info < (3, 0, 0):
-                shape.label = shape.label.toPyObject()
-            color = generateColorByText(shape.label)
-            item1 = self.labelModel.item(topLeft.row(), 1)
-            item0.setBackground(color)
-            item1.setBackground(color)
+    def labelEdited(self, shape, column, value):
+        self.canvas.history.begin([shape])
+        if column == 0:
+            shape.label = value
+            color = self.colorPalette.color(value)
             shape.line_color = color
             shape.fill_color = color
         else:
-            shape.extra_label = self.labelModel.data(topLeft)
-            if sys.version_info < (3, 0, 0):
-                shape.extra_label = shape.extra_label.toPyObject()
+            shape.extra_label = value
+        self.canvas.history.commit(key=('extra', shape) if column == 1 else None)
+        self.labelModel.refresh([shape])
         self.setDirty()
-        
-        return
 
     def updateLabelShowing(self, index, str):
-        item0 = self.labelModel.item(index.row(), 0)
-        shape = self.ItemShapeDict[item0]
+        shape = self.labelModel.shape(index.row())
+        # Typing into the extra column is one undo step.
+        self.canvas.history.begin([shape])
         shape.extra_label = str
+        self.canvas.history.commit(key=('extra', shape))
         self.canvas.update()
 
     def addRecentFile(self, filePath):
@@ -642,7 +730,8 @@ class MainWindow(QMainWindow, WindowMixin):
         res = self.labelDialog.popUp()
 
         if res is not None:
-            self.labelHist, self.default_label = res
+            labels, self.default_label = res
+            self.labelHist = LabelHist(labels)
             self.labelList.updateLabelList(self.labelHist)
 
 
@@ -668,8 +757,7 @@ class MainWindow(QMainWindow, WindowMixin):
             self.loadFile(filename)
 
         if self.canvas.selectedShape:
-            self.canvas.selectedShape.selected = False
-            self.canvas.selectedShape = None
+            self.canvas.clearSelection()
             self.canvas.setHiding(False)
         self.resetBackSample()
 
@@ -680,20 +768,23 @@ class MainWindow(QMainWindow, WindowMixin):
         if not self.canvas.editing():
             return
         
-        item0 = self.labelModel.itemFromIndex(self.labelModel.index(self.labelsm.currentIndex().row(), 0))
-        if item0 is None:
-            item0 = self.labelModel.item(self.labelModel.rowCount() - 1,0)
+        row = self.labelsm.currentIndex().row()
+        if row < 0:
+            row = self.labelModel.rowCount() - 1
 
         difficult = self.diffcButton.isChecked()
 
-        try:
-            shape = self.ItemShapeDict[item0]
-        except:
-            pass
+        if len(self.canvas.selectedShapes) > 1:
+            self.setShapesDifficult(self.canvas.selectedShapes, difficult)
+            return
+
+        shape = self.labelModel.shape(row)
         # Checked and Update
         try:
             if difficult != shape.difficult:
+                self.canvas.history.begin([shape])
                 shape.difficult = difficult
+                self.canvas.history.commit()
                 self.setDirty()
             else:  # User probably changed item visibility
                 #self.canvas.setShapeVisible(shape, item.checkState() == Qt.Checked)
@@ -701,113 +792,247 @@ class MainWindow(QMainWindow, WindowMixin):
         except:
             pass
 
+    def setShapesDifficult(self, shapes, difficult):
+        """Set the difficult flag of shapes as one undo step."""
+        store = self.canvas.store
+        rows = [shape.row for shape in shapes]
+        if (store.difficult[rows] == difficult).all():
+            return
+        self.canvas.history.begin(shapes)
+        store.difficult[rows] = difficult
+        self.canvas.history.commit()
+        self.setDirty()
+
     # React to canvas signals.
     def shapeSelectionChanged(self, selected=False):
         if self._noSelectionSlot:
             self._noSelectionSlot = False
         else:
-            shape = self.canvas.selectedShape
-            if shape and shape in self.ShapeItemDict:
-                item0 = self.ShapeItemDict[shape]
-                index = self.labelModel.indexFromItem(item0)
-                self.labelList.selectRow(index.row())
-                #self.labelsm.setCurrentIndex(index, QItemSelectionModel.SelectCurrent)
-
-            else:
-                
-                self.labelList.clearSelection()
+            self.selectLabelRows(self.canvas.selectedShapes)
         self.actions.delete.setEnabled(selected)
         self.actions.copy.setEnabled(selected)
+        self.actions.relabel.setEnabled(selected)
+        self.actions.classColor.setEnabled(selected)
+
+    def selectLabelRows(self, shapes):
+        """Select the list rows of shapes with a single selection update."""
+        rows = self.labelModel.rows(shapes)
+        if not rows:
+            self.labelList.clearSelection()
+            return
+        selection = QItemSelection()
+        lastColumn = self.labelModel.columnCount() - 1
+        for first, last in rowRanges(rows):
+            selection.select(self.labelModel.index(first, 0), self.labelModel.index(last, lastColumn))
+        primary = self.labelModel.index(self.labelModel.row(shapes[-1]), 0)
+        self.labelsm.blockSignals(True)
+        self.labelsm.setCurrentIndex(primary, QItemSelectionModel.NoUpdate)
+        self.labelsm.select(selection, QItemSelectionModel.ClearAndSelect | QItemSelectionModel.Rows)
+        self.labelsm.blockSignals(False)
+        self.labelList.viewport().update()
+        self.labelList.scrollTo(primary)
+        self.diffcButton.blockSignals(True)
+        self.diffcButton.setChecked(shapes[-1].difficult)
+        self.diffcButton.blockSignals(False)
 
     def addLabel(self, shape):
-        shape.paintLabel = self.paintLabelsOption.isChecked()
+        self.addLabels([shape])
 
-        item0 = HashableQStandardItem(shape.label)
-        item1 = QStandardItem(shape.extra_label)
-        color = generateColorByText(shape.label)
-        item0.setBackground(color)
-        item1.setBackground(color)
-        self.labelModel.appendRow([item0, item1])
+    def addLabels(self, shapes):
+        if not shapes:
+            return
+        paintLabel = self.paintLabelsOption.isChecked()
+        for shape in shapes:
+            shape.paintLabel = paintLabel
+        self.labelModel.appendShapes(shapes)
 
-        self.ShapeItemDict[shape] = item0
-        self.ItemShapeDict[item0] = shape
-        
         for action in self.actions.onShapesPresent:
             action.setEnabled(True)
 
     def remLabel(self, shape):
         if shape is None:
             return
+        self.labelModel.removeShapes([shape])
+
+    def remLabels(self, shapes):
+        self.labelModel.removeShapes(shapes)
+
+    def updateUndoActions(self):
+        self.actions.undo.setEnabled(self.canvas.history.canUndo())
+        self.actions.redo.setEnabled(self.canvas.history.canRedo())
+
+    def undo(self):
+        entry = self.canvas.history.undo()
+        if entry is not None:
+            self.applyHistory(entry, True)
+
+    def redo(self):
+        entry = self.canvas.history.redo()
+        if entry is not None:
+            self.applyHistory(entry, False)
+
+    def applyHistory(self, entry, undo):
+        """Revert (undo) or replay an entry of the canvas history."""
+        if entry.kind == UndoEntry.EDIT:
+            states = [(shape, before if undo else after)
+                      for shape, before, after in entry.changes]
+            self.canvas.setShapeStates(states)
+            self.refreshLabelItems([shape for shape, state in states
+                                    if 'label' in state or 'extra_label' in state])
+        elif (entry.kind == UndoEntry.ADD) == undo:
+            self.remLabels(entry.shapes)
+            self.canvas.removeShapes(entry.shapes)
+        else:
+            self.canvas.insertShapes(entry.shapes)
+            self.addLabels(entry.shapes)
+        for action in self.actions.onShapesPresent:
+            action.setEnabled(not self.noShapes())
+        self.setDirty()
 
-        item0 = self.ShapeItemDict[shape]
-        index = self.labelModel.indexFromItem(item0)
-        
-        self.labelModel.removeRows(index.row(), 1)
-        del self.ShapeItemDict[shape]
-        del self.ItemShapeDict[item0]
+    def refreshLabelItems(self, shapes):
+        """Colour shapes after their label and show their rows again."""
+        for shape in shapes:
+            color = self.colorPalette.color(shape.label)
+            shape.line_color = color
+            shape.fill_color = color
+        self.labelModel.refresh(shapes)
+
+    def selectAllShapes(self):
+        if self.canvas.editing():
+            self.canvas.selectShapes(self.canvas.visibleShapes())
+
+    def relabelSelected(self):
+        """Give every selected shape the same label, as one undo step."""
+        shapes = self.canvas.selectedShapes
+        if not shapes or not self.canvas.editing():
+            return
+        current = shapes[-1].label
+        items = list(self.labelHist)
+        if current not in items:
+            items.append(current)
+        text, ok = QInputDialog.getItem(self, 'Relabel', '%d boxes' % len(shapes),
+                                        items, items.index(current), True)
+        if not ok or not text:
+            return
+        self.canvas.history.begin(shapes)
+        store = self.canvas.store
+        store.classIds[[shape.row for shape in shapes]] = store.classId(text)
+        self.canvas.history.commit()
+        self.refreshLabelItems(shapes)
+        if self.labelHist.add(text):
+            self.labelList.updateLabelList(self.labelHist)
+        self.canvas.update()
+        self.setDirty()
+
+    def changeClassColor(self):
+        """Pick a colour for the class of the selected box."""
+        shape = self.canvas.selectedShape
+        if shape is None:
+            return
+        label = shape.label
+        color = QColorDialog.getColor(self.colorPalette.color(label), self, u'Colour of %s' % label,
+                                      QColorDialog.ShowAlphaChannel)
+        if not color.isValid():
+            return
+        self.colorPalette.setColor(label, color)
+        self.refreshLabelItems([s for s in self.canvas.shapes if s.label == label])
+        self.canvas.update()
+
+    def findDuplicateShapes(self):
+        """Flag and select the boxes that overlap an earlier one."""
+        shapes = self.canvas.shapes
+        store = self.canvas.store
+        overlaps = findDuplicates(store.points[[s.row for s in shapes]], [s.label for s in shapes])
+        flags = {}
+        for o in overlaps:
+            shape = shapes[o.second]
+            note = '%s of row %d %s (IoU %.2f)' % (o.kind, self.labelModel.row(shapes[o.first]) + 1,
+                                                   shapes[o.first].label, o.iou)
+            flags[shape] = flags[shape] + '\n' + note if shape in flags else note
+        self.labelModel.setFlags(flags)
+        if flags and self.canvas.editing():
+            self.canvas.selectShapes([s for s in shapes if s in flags])
+        self.status('%d possible duplicate boxes' % len(flags))
+
+    def duplicateReport(self, _value=False):
+        annDir = self.defaultSaveDir or self.dirname
+        if not annDir:
+            self.errorMessage(u'No annotations', u'Open a directory of annotations first.')
+            return
+        path, _ = QFileDialog.getSaveFileName(self, '%s - Save duplicate report' % __appname__,
+                                              os.path.join(annDir, 'duplicates.csv'), 'CSV (*.csv)')
+        if not path:
+            return
+        self.annotationWriter.flush()
+        with open(path, 'w', newline='') as out:
+            files, flagged, total = datasetReport(annDir, out, db=self.annotationDb(annDir))
+        QMessageBox.information(self, u'Duplicate report',
+                                u'%d files read, %d with overlapping boxes, %d overlaps.\nSaved to %s'
+                                % (files, flagged, total, path))
 
     def remAllLabels(self):
         self.canvas.deleteAll()
         self.labelModel.clear()
-        self.ShapeItemDict.clear()
-        self.ItemShapeDict.clear()
 
 
     def loadLabels(self, shapes):
-        s = []
+        labels, points, colors, difficult, rotated, directions, extras = [], [], [], [], [], [], []
         for shape_info in shapes:
             if len(shape_info) == 5:
-                label, points, line_color, fill_color, difficult = shape_info
+                label, pts, line_color, fill_color, isDifficult = shape_info
                 extra_label = ''
                 isRotated = False
                 direction = 0
             elif len(shape_info) == 6:
-                label, points, line_color, fill_color, difficult, extra_label = shape_info
+                label, pts, line_color, fill_color, isDifficult, extra_label = shape_info
                 isRotated = False
                 direction = 0
             elif len(shape_info) == 7:
-                label, points, line_color, fill_color, difficult, isRotated, direction = shape_info
+                label, pts, line_color, fill_color, isDifficult, isRotated, direction = shape_info
                 extra_label = ''
             elif len(shape_info) == 8:
-                label, points, line_color, fill_color, difficult, isRotated, direction, extra_label = shape_info
+                label, pts, line_color, fill_color, isDifficult, isRotated, direction, extra_label = shape_info
             else:
-                pass
-            shape = Shape(label=label)
-            for x, y in points:
-                shape.addPoint(QPointF(x, y))
-            shape.difficult = difficult
-            shape.direction = direction
-            shape.isRotated = isRotated
-            shape.extra_label = extra_label
+                continue
+            labels.append(label)
+            points.append(pts)
+            colors.append((line_color, fill_color))
+            difficult.append(isDifficult)
+            rotated.append(isRotated)
+            directions.append(direction)
+            extras.append(extra_label)
+
+        # Fill the store column by column, then wrap each row in a Shape.
+        store = ShapeStore(len(labels))
+        rows = store.extend(np.reshape(points, (-1, 4, 2)), labels, difficult,
+                            rotated, directions, extras)
+        s = []
+        drawCorner = self.drawCorner.isChecked()
+        palette = self.colorPalette
+        for row, label, (line_color, fill_color) in zip(rows, labels, colors):
+            shape = Shape.fromStore(store, row)
             shape.close()
             s.append(shape)
 
             if line_color:
                 shape.line_color = QColor(*line_color)
             else:
-                shape.line_color = generateColorByText(label)
+                shape.line_color = palette.color(label)
 
             if fill_color:
                 shape.fill_color = QColor(*fill_color)
             else:
-                shape.fill_color = generateColorByText(label)
+                shape.fill_color = palette.color(label)
             
-            shape.alwaysShowCorner = self.drawCorner.isChecked()
-
-            if not label in self.labelHist:
-                self.labelHist.append(label)
-                self.labelList.updateLabelList(self.labelHist)
-                
+            shape.alwaysShowCorner = drawCorner
 
-            self.addLabel(shape)
-
-        self.canvas.loadShapes(s)
+        if self.labelHist.extend(store.classes):
+            self.labelList.updateLabelList(self.labelHist)
+        self.addLabels(s)
 
-    def saveLabels(self, annotationFilePath):
-        if self.labelFile is None:
-            self.labelFile = LabelFile()
-            self.labelFile.verified = self.canvas.verified
+        self.canvas.loadShapes(s, store)
 
+    def formatShapes(self):
         def format_shape(s):
             return dict(label=s.label,
                         line_color=s.line_color.getRgb(),
@@ -820,14 +1045,35 @@ class MainWindow(QMainWindow, WindowMixin):
                         isRotated = s.isRotated,
                         extra_text = s.extra_label)
 
-        shapes = [format_shape(shape) for shape in self.canvas.shapes]
+        return [format_shape(shape) for shape in self.canvas.shapes]
+
+    def saveLabels(self, annotationFilePath):
+        if self.labelFile is None:
+            self.labelFile = LabelFile()
+            self.labelFile.verified = self.canvas.verified
+
+        shapes = self.formatShapes()
         # Can add differrent annotation formats here
         try:
             if annotationFilePath[-4:] != ".xml":
                 annotationFilePath += XML_EXT
+            imageShape = [self.image.height(), self.image.width(),
+                          1 if self.image.isGrayscale() else 3]
+            writer = self.labelFile.pascalVocWriter(shapes, self.filePath, imageShape)
+            # Leave the file and its mtime alone when it already holds
+            # these annotations.
+            key = os.path.abspath(annotationFilePath)
+            digest = writer.digest()
+            db, dbkey = self.annotationDbKey(annotationFilePath)
+            stored = db.contains(dbkey) if db is not None else os.path.isfile(annotationFilePath)
+            if self.savedDigests.get(key) == digest and stored:
+                return True
             print ('Img: ' + self.filePath + ' -> Its xml: ' + annotationFilePath)
-            self.labelFile.savePascalVocFormat(annotationFilePath, shapes, self.filePath, self.imageData,
-                                                self.lineColor.getRgb(), self.fillColor.getRgb())
+            self.savedDigests[key] = digest
+            if db is not None:
+                self.annotationWriter.call(annotationFilePath, partial(db.save, dbkey, writer))
+            else:
+                self.annotationWriter.save(annotationFilePath, writer)
             return True
         except LabelFileError as e:
             self.errorMessage(u'Error saving label data', u'<b>%s</b>' % e)
@@ -842,16 +1088,30 @@ class MainWindow(QMainWindow, WindowMixin):
     def labelCurrentChanged(self, current, previous):
         if current.row() < 0:
             return
-        item0 = self.labelModel.itemFromIndex(self.labelModel.index(current.row(), 0))
         if self.canvas.editing():
             self._noSelectionSlot =True
-            shape = self.ItemShapeDict[item0]
+            shape = self.labelModel.shape(current.row())
             self.canvas.selectShape(shape)
             self.diffcButton.setChecked(shape.difficult)
 
+    def labelSelectionChanged(self, selected, deselected):
+        """Mirror a multi-row selection of the list on the canvas."""
+        if not self.canvas.editing():
+            return
+        rows = sorted(index.row() for index in self.labelsm.selectedRows())
+        if len(rows) < 2:
+            return
+        shapes = [self.labelModel.shape(row) for row in rows]
+        current = self.labelsm.currentIndex()
+        if current.isValid() and current.row() in rows:
+            primary = self.labelModel.shape(current.row())
+            shapes.remove(primary)
+            shapes.append(primary)
+        self._noSelectionSlot = True
+        self.canvas.selectShapes(shapes)
+
     def labelHeaderClicked(self, index, checked):
-        item0 = self.labelModel.item(index, 0)
-        shape = self.ItemShapeDict[item0]
+        shape = self.labelModel.shape(index)
         self.canvas.setShapeVisible(shape, checked)
 
     # Callback functions:
@@ -859,7 +1119,7 @@ class MainWindow(QMainWindow, WindowMixin):
         text = self.default_label
         extra_text = ""
         if text is not None:
-            generate_color = generateColorByText(text)
+            generate_color = self.colorPalette.color(text)
             shape = self.canvas.setLastLabel(text, generate_color, generate_color, extra_text)
             shape.alwaysShowCorner=self.drawCorner.isChecked()
 
@@ -1006,7 +1266,8 @@ class MainWindow(QMainWindow, WindowMixin):
 
             self.image = image
             self.filePath = unicodeFilePath
-            self.canvas.loadPixmap(QPixmap.fromImage(image))
+            self.canvas.loadPixmap(QPixmap.fromImage(image), image)
+            self.miniMap.reset()
             self.imageDim.setText('%d x %d' % (self.image.width(), self.image.height()))
             if self.labelFile is not None:
                 self.loadLabels(self.labelFile.shapes)
@@ -1025,6 +1286,9 @@ class MainWindow(QMainWindow, WindowMixin):
                     relname = os.path.splitext(relname)[0]
                     # TODO: defaultSaveDir changed to another dir need mkdir for subdir
                     xmlPath = os.path.join(self.defaultSaveDir, relname + XML_EXT)
+                    # Annotations of the database are not files.
+                    if self.annotationDb() is not None:
+                        vocReader = self.loadPascalXMLByFilename(xmlPath)
                 else:
                     xmlPath = os.path.splitext(filePath)[0] + XML_EXT
                     if os.path.isfile(xmlPath):
@@ -1040,7 +1304,7 @@ class MainWindow(QMainWindow, WindowMixin):
                     self.saveFile()
 
             imglist = [self.filePath]
-            self.fileModel.setStringList(imglist)
+            self.fileModel.setStringList(imglist, db=self.annotationDb())
             if self.fileModel.rowCount() > 0:
                 curIndex = self.fileModel.index(0)
                 self.filesm.blockSignals(True)
@@ -1114,7 +1378,15 @@ class MainWindow(QMainWindow, WindowMixin):
         settings[SETTING_AUTO_SAVE] = self.autoSaving.isChecked()
         settings[SETTING_DRAW_CORNER] = self.drawCorner.isChecked()
         settings[SETTING_PAINT_LABEL] = self.paintLabelsOption.isChecked()
+        settings[SETTING_MAGNIFIER] = self.magnifier.isChecked()
+        settings[SETTING_CLASS_COLORS] = self.colorPalette.overrideNames()
+        settings[SETTING_YOLO_IMAGES] = self.yoloImageModes.checkedAction().data()
         settings.save()
+        # Finish the saves still queued.
+        self.annotationWriter.close()
+        for db in self.annotationDbs.values():
+            db.close()
+        self.annotationDbs = {}
     ## User Dialogs ##
 
     def loadRecent(self, filename):
@@ -1153,7 +1425,9 @@ class MainWindow(QMainWindow, WindowMixin):
             self.defaultSaveDir = dirpath
 
         imglist = self.scanAllImages(self.dirname)
-        self.fileModel.setStringList(imglist, self.dirname, self.defaultSaveDir)
+        self.annotationWriter.flush()
+        self.fileModel.setStringList(imglist, self.dirname, self.defaultSaveDir,
+                                     self.annotationDb())
 
         self.statusBar().showMessage('%s . Annotation will be saved to %s' %
                                      ('Change saved folder', self.defaultSaveDir))
@@ -1198,7 +1472,8 @@ class MainWindow(QMainWindow, WindowMixin):
         self.filePath = None
         
         imglist = self.scanAllImages(dirpath)
-        self.fileModel.setStringList(imglist)
+        self.annotationWriter.flush()
+        self.fileModel.setStringList(imglist, db=self.annotationDb(dirpath))
 
         self.defaultSaveDir = dirpath
         self.setWindowTitle(__appname__ + ' ' + self.dirname)
@@ -1284,8 +1559,12 @@ class MainWindow(QMainWindow, WindowMixin):
                 savedPath = self.saveFileDialog()
         if not savedPath.endswith(XML_EXT):
             savedPath += XML_EXT
-        if os.path.exists(savedPath):
-            os.remove(savedPath)
+        self.savedDigests.pop(os.path.abspath(savedPath), None)
+        db, dbkey = self.annotationDbKey(savedPath)
+        if db is not None:
+            self.annotationWriter.call(savedPath, partial(db.remove, dbkey), saves=False)
+        else:
+            self.annotationWriter.remove(savedPath)
 
     def saveFileAndRenderList(self, _value=False):
         self.saveFile(_value=_value)
@@ -1311,6 +1590,65 @@ class MainWindow(QMainWindow, WindowMixin):
             return os.path.splitext(fullFilePath)[0] # Return file path without the extension.
         return ''
 
+    def annotationSaveFailed(self, path, message):
+        self.savedDigests.pop(os.path.abspath(path), None)
+        self.errorMessage(u'Error saving label data',
+                          u'<p><b>%s</b></p><p><i>%s</i> was not changed.</p>'
+                          % (html.escape(message), html.escape(path)))
+        self.status("Error writing %s" % path)
+
+    def annotationDb(self, saveDir=None):
+        """The AnnotationDb of saveDir, by default the save folder, or
+        None when its annotations are files."""
+        saveDir = saveDir or self.defaultSaveDir
+        if not hasAnnotationDb(saveDir):
+            return None
+        path = os.path.abspath(os.path.join(saveDir, ANNOTATION_DB))
+        db = self.annotationDbs.get(path)
+        if db is None:
+            db = self.annotationDbs[path] = AnnotationDb(path)
+        return db
+
+    def annotationDbKey(self, annotationFilePath):
+        """The AnnotationDb holding annotationFilePath instead of the
+        file, and its key there; None, None when it is a file."""
+        db = self.annotationDb()
+        if db is None:
+            return None, None
+        key = dbKey(os.path.dirname(db.path), os.path.abspath(annotationFilePath))
+        return (db, key) if key is not None else (None, None)
+
+    def importAnnotationDb(self, _value=False):
+        saveDir = self.defaultSaveDir or self.dirname
+        if not saveDir:
+            self.errorMessage(u'No annotations', u'Open a directory of annotations first.')
+            return
+        self.annotationWriter.flush()
+        path = os.path.abspath(os.path.join(saveDir, ANNOTATION_DB))
+        db = self.annotationDbs.get(path) or AnnotationDb(path)
+        self.annotationDbs[path] = db
+        imported, errors = db.importVoc(saveDir)
+        if errors:
+            self.errorList(u'Skipped unreadable annotations', errors)
+        self.status('%d annotation files imported into %s' % (imported, path))
+        if self.dirname:
+            self.fileModel.setStringList(self.scanAllImages(self.dirname), self.dirname,
+                                         saveDir, db)
+
+    def exportAnnotationDb(self, _value=False):
+        db = self.annotationDb()
+        if db is None:
+            self.errorMessage(u'No annotation database',
+                              u'The save folder has no %s.' % ANNOTATION_DB)
+            return
+        annDir = QFileDialog.getExistingDirectory(self, '%s - Write annotation files to' % __appname__,
+                                                  self.defaultSaveDir, QFileDialog.ShowDirsOnly
+                                                  | QFileDialog.DontResolveSymlinks)
+        if not annDir:
+            return
+        self.annotationWriter.flush()
+        self.status('%d annotation files written to %s' % (db.exportVoc(annDir), annDir))
+
     def _saveFile(self, annotationFilePath):
         if annotationFilePath and self.saveLabels(annotationFilePath):
 
@@ -1345,11 +1683,18 @@ class MainWindow(QMainWindow, WindowMixin):
         return QMessageBox.critical(self, title,
                                     '<p><b>%s</b></p>%s' % (title, message))
 
+    def errorList(self, title, errors, shown=10):
+        """errorMessage listing the first shown of errors."""
+        message = u'<br>'.join(html.escape(str(e)) for e in errors[:shown])
+        if len(errors) > shown:
+            message += u'<br>and %d more' % (len(errors) - shown)
+        return self.errorMessage(title, message)
+
     def currentPath(self):
         return os.path.dirname(self.filePath) if self.filePath else '.'
 
     def deleteSelectedShape(self):
-        self.remLabel(self.canvas.deleteSelected())
+        self.remLabels(self.canvas.deleteSelected())
         self.setDirty()
         if self.noShapes():
             for action in self.actions.onShapesPresent:
@@ -1380,21 +1725,42 @@ class MainWindow(QMainWindow, WindowMixin):
             with codecs.open(predefClassesFile, 'r', 'utf8') as f:
                 for line in f:
                     line = line.strip()
-                    if self.labelHist is None:
-                        self.labelHist = [line]
-                    else:
-                        self.labelHist.append(line)
+                    self.labelHist.add(line)
 
     def loadPascalXMLByFilename(self, xmlPath):
         if self.filePath is None:
             return None
-        if os.path.isfile(xmlPath) is False:
+        # A save of this file may still be on its way to disk.
+        self.annotationWriter.wait(xmlPath)
+        db, dbkey = self.annotationDbKey(xmlPath)
+        if db is not None:
+            tVocParseReader = db.load(dbkey)
+            if tVocParseReader is None:
+                return None
+        elif os.path.isfile(xmlPath) is False:
             return None
-
-        tVocParseReader = PascalVocReader(xmlPath)
+        else:
+            try:
+                tVocParseReader = readCached(xmlPath)
+            except PascalVocError as e:
+                self.errorMessage(u'Error opening file',
+                                  u'<p><b>%s</b></p><p>Line %s of <i>%s</i>.</p>'
+                                  % (html.escape(e.reason), e.line if e.line is not None else '?',
+                                     html.escape(xmlPath)))
+                self.status("Error reading %s" % xmlPath)
+                return None
         shapes = tVocParseReader.getShapes()
         self.loadLabels(shapes)
         self.canvas.verified = tVocParseReader.verified
+
+        # What saving would write for the file as it was read: the shapes
+        # go through the same conversions, the size and flag are the file's.
+        labelFile = LabelFile()
+        labelFile.verified = tVocParseReader.verified
+        width, height, depth = tVocParseReader.getSize()
+        writer = labelFile.pascalVocWriter(self.formatShapes(), self.filePath,
+                                           [height, width, depth])
+        self.savedDigests[os.path.abspath(xmlPath)] = writer.digest()
         return tVocParseReader
 
     def togglePaintLabelsOption(self):
@@ -1403,74 +1769,51 @@ class MainWindow(QMainWindow, WindowMixin):
             shape.paintLabel = paintLabelsOptionChecked
 
     def exportAsYOLOImpl(self, obb=False):
-        xml_files = find_matching_files(self.defaultSaveDir, self.dirname)
+        self.annotationWriter.flush()
+        db = self.annotationDb()
+        if db is not None:
+            xml_files = find_matching_files(self.defaultSaveDir, self.dirname, set(db.keys()))
+            batch = db.readColumns([os.path.splitext(xfn)[0] for xfn in xml_files])
+        else:
+            xml_files = find_matching_files(self.defaultSaveDir, self.dirname)
+            batch = readVocCached([os.path.join(self.defaultSaveDir, xfn) for xfn in xml_files])
+        failed = [batch.errors[i] for i in sorted(batch.errors)]
+        # Class ids in order of first appearance.
+        label_map = dict((label, i) for i, label in enumerate(batch.classes))
+
+        corners = batch.corners.copy()
+        if not obb:
+            # The axis aligned box around each rotated one.
+            aabbs = geometry.cornersToAABB(corners[batch.rotated]).astype(int)
+            boxes = np.zeros((len(aabbs), 4, 2))
+            boxes[:, 0] = aabbs[:, :2]
+            boxes[:, 2] = aabbs[:, 2:]
+            corners[batch.rotated] = boxes
+        points = corners.reshape(-1, 8).tolist()
+        classes = [batch.classes[i] for i in batch.classId.tolist()]
+        rotated = batch.rotated.astype(int).tolist()
 
-        label_map = {}
         all_shapes_map = {}
-        label_count = 0
-        for xfn in xml_files:
-            xfn_full = os.path.join(self.defaultSaveDir, xfn)
-            tVocParseReader = PascalVocReader(xfn_full)
-            shapes = tVocParseReader.getShapes()
-            imgw, imgh, imgdepth = tVocParseReader.getSize()
-            img_fn = tVocParseReader.getImageFileName()
-
-            all_shapes_map[img_fn] = {
-                "height": imgh,
-                "width": imgw,
-                "bboxes": []
+        end = 0
+        for i, count in enumerate(batch.counts().tolist()):
+            start, end = end, end + count
+            if i in batch.errors:
+                continue
+            bboxes = []
+            for k in range(start, end):
+                si_dict = {"class": classes[k], "is_rot": rotated[k]}
+                for j in range(4):
+                    si_dict["x%d" % j] = points[k][2 * j]
+                    si_dict["y%d" % j] = points[k][2 * j + 1]
+                bboxes.append(si_dict)
+            all_shapes_map[batch.filenames[i]] = {
+                "height": int(batch.height[i]),
+                "width": int(batch.width[i]),
+                "bboxes": bboxes
             }
-            for si in shapes:
-                if si[0] not in label_map:
-                    label_map[si[0]] = label_count
-                    label_count += 1
-                is_rot = 0 if len(si) < 7 else int(si[5])
-                if obb:
-                    si_dict = {
-                        "class": si[0],
-                        "is_rot": is_rot,
-                        "x0": si[1][0][0],
-                        "y0": si[1][0][1],
-                        "x1": si[1][1][0],
-                        "y1": si[1][1][1],
-                        "x2": si[1][2][0],
-                        "y2": si[1][2][1],
-                        "x3": si[1][3][0],
-                        "y3": si[1][3][1],
-                    }
-                else:
-                    if is_rot:
-                        xmin = int(min(si[1][0][0], si[1][1][0], si[1][2][0], si[1][3][0]))
-                        ymin = int(min(si[1][0][1], si[1][1][1], si[1][2][1], si[1][3][1]))
-                        xmax = int(max(si[1][0][0], si[1][1][0], si[1][2][0], si[1][3][0]))
-                        ymax = int(max(si[1][0][1], si[1][1][1], si[1][2][1], si[1][3][1]))
-                        si_dict = {
-                            "class": si[0],
-                            "is_rot": is_rot,
-                            "x0": xmin,
-                            "y0": ymin,
-                            "x1": 0,
-                            "y1": 0,
-                            "x2": xmax,
-                            "y2": ymax,
-                            "x3": 0,
-                            "y3": 0,
-                        }
-                    else:
-                        si_dict = {
-                            "class": si[0],
-                            "is_rot": is_rot,
-                            "x0": si[1][0][0],
-                            "y0": si[1][0][1],
-                            "x1": si[1][1][0], # 0
-                            "y1": si[1][1][1], # 0
-                            "x2": si[1][2][0],
-                            "y2": si[1][2][1],
-                            "x3": si[1][3][0], # 0
-                            "y3": si[1][3][1], # 0
-                        }
-
-                all_shapes_map[img_fn]["bboxes"].append(si_dict)
+
+        if failed:
+            self.errorList(u'Skipped unreadable annotations', failed)
 
         defaultOpenDirPath = '.'
         save_dir_path = QFileDialog.getExistingDirectory(self,
@@ -1479,10 +1822,27 @@ class MainWindow(QMainWindow, WindowMixin):
         if save_dir_path is None:
             return
 
-        cvt_lbidata_rotdet(self.dirname, all_shapes_map, label_map,
-                           save_dir_path, tag='train', format='rotbox' if obb else 'box')
-        cvt_lbidata_rotdet(self.dirname, all_shapes_map, label_map,
-                           save_dir_path, tag='val', format='rotbox' if obb else 'box')
+        not_exported = []
+        for tag in ('train', 'val'):
+            progress = QProgressDialog('Exporting %s images...' % tag, 'Cancel',
+                                       0, len(all_shapes_map), self)
+            progress.setWindowModality(Qt.WindowModal)
+            progress.setMinimumDuration(500)
+
+            def report(done, total):
+                progress.setValue(done)
+                return not progress.wasCanceled()
+
+            not_exported += cvt_lbidata_rotdet(self.dirname, all_shapes_map, label_map,
+                                               save_dir_path, tag=tag,
+                                               format='rotbox' if obb else 'box', progress=report,
+                                               **yoloImageOptions(self.yoloImageModes.checkedAction().data()))
+            canceled = progress.wasCanceled()
+            progress.close()
+            if canceled:
+                return
+        if not_exported:
+            self.errorList(u'Images not exported', not_exported)
 
         yml_fn = os.path.join(save_dir_path, 'train.yaml')
 
@@ -1495,6 +1855,65 @@ class MainWindow(QMainWindow, WindowMixin):
         with open(yml_fn, 'w') as fy:
             yaml.dump(ydat, fy,
                     Dumper=yamlloader.ordereddict.CDumper)
+
+    def exportCocoDialog(self, _value=False):
+        if not self.dirname or not self.defaultSaveDir:
+            self.errorMessage(u'No annotations', u'Open a directory of annotations first.')
+            return
+        path, _ = QFileDialog.getSaveFileName(self, '%s - Export COCO' % __appname__,
+                                              os.path.join(self.defaultSaveDir, 'annotations.json'),
+                                              'COCO JSON (*.json)')
+        if not path:
+            return
+        self.annotationWriter.flush()
+        # Images named as in the file list, so that they import back.
+        fileNames, xmlPaths = [], []
+        for imgPath in self.scanAllImages(self.dirname):
+            relname = os.path.relpath(imgPath, self.dirname)
+            fileNames.append(relname.replace(os.sep, '/'))
+            xmlPaths.append(os.path.join(self.defaultSaveDir, os.path.splitext(relname)[0] + XML_EXT))
+        errors = []
+        db = self.annotationDb()
+        if db is not None:
+            def records():
+                for fileName, xmlPath in zip(fileNames, xmlPaths):
+                    stored = db.load(dbKey(self.defaultSaveDir, xmlPath))
+                    if stored is not None:
+                        width, height, _ = stored.getSize()
+                        yield fileName, width, height, stored.getShapes()
+            exportCoco(path, records())
+        else:
+            found = [i for i, xmlPath in enumerate(xmlPaths) if os.path.isfile(xmlPath)]
+            batch = readVocCached([xmlPaths[i] for i in found])
+            errors = [batch.errors[i] for i in sorted(batch.errors)]
+            exportCoco(path, ((fileNames[j], int(batch.width[i]), int(batch.height[i]),
+                               batch.shapes(i)) for i, j in enumerate(found)
+                              if i not in batch.errors))
+        if errors:
+            self.errorList(u'Skipped unreadable annotations', errors)
+        self.status('Exported to %s' % path)
+
+    def importCocoDialog(self, _value=False):
+        if not self.dirname or not self.defaultSaveDir:
+            self.errorMessage(u'No images', u'Open the directory of the images first.')
+            return
+        path, _ = QFileDialog.getOpenFileName(self, '%s - Import COCO' % __appname__,
+                                              self.defaultSaveDir, 'COCO JSON (*.json)')
+        if not path:
+            return
+        self.annotationWriter.flush()
+        db = self.annotationDb()
+        try:
+            written, skipped = importCoco(path, self.dirname, self.defaultSaveDir, db)
+        except (CocoError, IOError, OSError) as e:
+            self.errorMessage(u'Error opening file', u'<b>%s</b>' % html.escape(str(e)))
+            return
+        if skipped:
+            self.errorList(u'Skipped annotations', skipped)
+        self.fileModel.setStringList(self.scanAllImages(self.dirname), self.dirname,
+                                     self.defaultSaveDir, db)
+        self.status('%d annotations imported from %s' % (written, path))
+
     def exportAsYOLO(self, _value=False):
         self.exportAsYOLOImpl(obb=False)
 
@@ -1503,13 +1922,36 @@ class MainWindow(QMainWindow, WindowMixin):
         self.exportAsYOLOImpl(obb=True)
 
 
-def find_matching_files(dir_a, dir_b):
+# Choices of the YOLO Images menu.
+YOLO_IMAGE_MODES = (
+    ('png', 'Transcode to PNG'),
+    ('jpg', 'Transcode to JPEG'),
+    ('copy', 'Copy'),
+    ('hardlink', 'Hard Link'),
+    ('symlink', 'Symbolic Link'),
+)
+YOLO_JPEG_QUALITY = 95
+
+
+def yoloImageOptions(key):
+    """cvt_lbidata_rotdet arguments of a YOLO_IMAGE_MODES key."""
+    if key == 'png':
+        return dict(image_mode='transcode', image_format='png')
+    if key == 'jpg':
+        return dict(image_mode='transcode', image_format='jpg', image_quality=YOLO_JPEG_QUALITY)
+    return dict(image_mode=key)
+
+
+def find_matching_files(dir_a, dir_b, xml_files=None):
+    """xml_files: names of the annotations without extension, by
+    default those of the .xml files in dir_b."""
     supported_extensions = tuple(['.%s' % fmt.data().decode("ascii").lower() for fmt 
                                   in QImageReader.supportedImageFormats()])
-    xml_files = set()
-    for file in os.listdir(dir_b):
-        if file.endswith(".xml"):
-            xml_files.add(os.path.splitext(file)[0])
+    if xml_files is None:
+        xml_files = set()
+        for file in os.listdir(dir_b):
+            if file.endswith(".xml"):
+                xml_files.add(os.path.splitext(file)[0])
 
     result = []
     for file in os.listdir(dir_a):
@@ -0,0 +1,348 @@
+# -*- coding: utf-8 -*-
+"""All annotations of a dataset in one SQLite file.
+
+A save directory holding ANNOTATION_DB keeps its annotations there
+instead of in one XML file per image. Images are keyed by the path of
+their annotation relative to the save directory, without extension and
+with '/' separators: the XML of key 'a/b' would be a/b.xml.
+
+    python -m libs.annotationDb import <voc dir> [db]
+    python -m libs.annotationDb export <db> <voc dir>
+
+import reads every .xml below the directory into the database, by
+default <voc dir>/annotations.db; export writes them back.
+"""
+from __future__ import absolute_import, print_function
+
+import os
+import sqlite3
+import sys
+import threading
+
+from .annotationWriter import atomicWrite
+from .geometry import rotatedToCorners
+from .pascal_voc_io import PascalVocReader, PascalVocWriter, PascalVocError, VocColumns, XML_EXT
+
+ANNOTATION_DB = 'annotations.db'
+
+# Files imported per transaction.
+IMPORT_BATCH = 1000
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS images (
+    id INTEGER PRIMARY KEY,
+    key TEXT NOT NULL UNIQUE,
+    folder TEXT,
+    filename TEXT,
+    path TEXT,
+    source TEXT,
+    width INTEGER NOT NULL,
+    height INTEGER NOT NULL,
+    depth INTEGER NOT NULL,
+    verified INTEGER NOT NULL DEFAULT 0
+);
+CREATE TABLE IF NOT EXISTS classes (
+    id INTEGER PRIMARY KEY,
+    name TEXT NOT NULL UNIQUE
+);
+-- Plain boxes set xmin .. ymax, rotated ones cx .. angle.
+CREATE TABLE IF NOT EXISTS boxes (
+    image INTEGER NOT NULL REFERENCES images (id) ON DELETE CASCADE,
+    seq INTEGER NOT NULL,
+    class INTEGER NOT NULL REFERENCES classes (id),
+    rotated INTEGER NOT NULL,
+    difficult INTEGER NOT NULL,
+    xmin INTEGER, ymin INTEGER, xmax INTEGER, ymax INTEGER,
+    cx REAL, cy REAL, w REAL, h REAL, angle REAL,
+    extra TEXT,
+    PRIMARY KEY (image, seq)
+);
+CREATE INDEX IF NOT EXISTS boxes_class ON boxes (class);
+'''
+
+_BOX_COLUMNS = 'rotated, difficult, xmin, ymin, xmax, ymax, cx, cy, w, h, angle, extra'
+
+
+def dbKey(saveDir, annotationPath):
+    """Key of the annotation file annotationPath, with or without
+    extension, or None when it is not below saveDir."""
+    relname = os.path.relpath(os.path.splitext(annotationPath)[0], saveDir)
+    if relname.startswith(os.pardir):
+        return None
+    return relname.replace(os.sep, '/')
+
+
+def hasAnnotationDb(saveDir):
+    return bool(saveDir) and os.path.isfile(os.path.join(saveDir, ANNOTATION_DB))
+
+
+class StoredAnnotation(object):
+    """One image of the database, read the way PascalVocReader reads a
+    file: getShapes() gives the same shape tuples."""
+
+    def __init__(self, key, image, boxes):
+        self.filepath = key
+        self.foldername, self.filename, self.localImgPath, self.databaseSrc, \
+            self.width, self.height, self.depth, verified = image
+        self.verified = bool(verified)
+        self.shapes = []
+        rotated = []
+        for label, isRotated, difficult, xmin, ymin, xmax, ymax, cx, cy, w, h, angle, extra in boxes:
+            difficult = bool(difficult)
+            if isRotated:
+                rotated.append((len(self.shapes), (cx, cy, w, h, angle)))
+                shape = (label, None, None, None, difficult, True, angle)
+            else:
+                points = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
+                shape = (label, points, None, None, difficult)
+            self.shapes.append(shape if extra is None else shape + (extra,))
+        if rotated:
+            corners = rotatedToCorners([box for _, box in rotated]).tolist()
+            for (i, _), points in zip(rotated, corners):
+                shape = self.shapes[i]
+                self.shapes[i] = shape[:1] + ([tuple(p) for p in points],) + shape[2:]
+
+    def getShapes(self):
+        return self.shapes
+
+    def getSize(self):
+        return self.width, self.height, self.depth
+
+    def getImageFileName(self):
+        return self.filename
+
+
+class _RecordReader(PascalVocReader):
+    """PascalVocReader keeping the numbers of each box as written, for
+    import, rather than corners."""
+
+    def addShape(self, label, bndbox, difficult, extra=None):
+        box = self.children(bndbox)
+        self.shapes.append((label, False, difficult) +
+                           tuple(self.number(bndbox, box, tag, int)
+                                 for tag in ('xmin', 'ymin', 'xmax', 'ymax')) +
+                           (None,) * 5 + (extra,))
+
+    def addRotatedShape(self, label, robndbox, difficult, extra=None):
+        box = self.children(robndbox)
+        self.shapes.append((label, True, difficult) + (None,) * 4 +
+                           tuple(self.number(robndbox, box, tag)
+                                 for tag in ('cx', 'cy', 'w', 'h', 'angle')) + (extra,))
+
+    def resolveRotatedShapes(self):
+        pass
+
+
+class AnnotationDb(object):
+    """The SQLite database of a save directory.
+
+    Every change runs in a transaction of its own, so an image is always
+    stored whole. One connection is shared by the GUI thread and the
+    AnnotationWriter thread, behind a lock. The default rollback journal
+    is kept as WAL does not work on network file systems.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.lock = threading.RLock()
+        self.connection = sqlite3.connect(path, check_same_thread=False)
+        self.connection.execute('PRAGMA foreign_keys = ON')
+        with self.connection:
+            self.connection.executescript(_SCHEMA)
+
+    def close(self):
+        with self.lock:
+            self.connection.close()
+
+    def keys(self):
+        with self.lock:
+            return [key for key, in self.connection.execute('SELECT key FROM images ORDER BY key')]
+
+    def contains(self, key):
+        with self.lock:
+            return self.connection.execute('SELECT 1 FROM images WHERE key = ?',
+                                           (key,)).fetchone() is not None
+
+    def _classIds(self, names):
+        names = [(name,) for name in set(names)]
+        self.connection.executemany('INSERT OR IGNORE INTO classes (name) VALUES (?)', names)
+        return dict(self.connection.execute('SELECT name, id FROM classes'))
+
+    def _store(self, key, image, boxes):
+        """Replace the image key and its boxes, records as _RecordReader
+        makes them. Runs inside the caller's transaction."""
+        row = self.connection.execute('SELECT id FROM images WHERE key = ?', (key,)).fetchone()
+        if row is None:
+            imageId = self.connection.execute(
+                'INSERT INTO images (key, folder, filename, path, source, width, height, depth,'
+                ' verified) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)', (key,) + image).lastrowid
+        else:
+            imageId = row[0]
+            self.connection.execute(
+                'UPDATE images SET folder = ?, filename = ?, path = ?, source = ?, width = ?,'
+                ' height = ?, depth = ?, verified = ? WHERE id = ?', image + (imageId,))
+            self.connection.execute('DELETE FROM boxes WHERE image = ?', (imageId,))
+        classIds = self._classIds(box[0] for box in boxes)
+        self.connection.executemany(
+            'INSERT INTO boxes (image, seq, class, %s) VALUES (%s)'
+            % (_BOX_COLUMNS, ', '.join('?' * 15)),
+            [(imageId, seq, classIds[box[0]], int(box[1]), int(bool(box[2]))) + box[3:]
+             for seq, box in enumerate(boxes)])
+
+    def save(self, key, writer):
+        """Store the annotation held by the PascalVocWriter writer, in
+        the order a saved file lists it."""
+        self.saveMany([(key, writer)])
+
+    def saveMany(self, items):
+        """save() each of the (key, writer) pairs items, all in one
+        transaction."""
+        with self.lock, self.connection:
+            for key, writer in items:
+                size = writer.imgSize
+                image = (writer.foldername, writer.filename, writer.localImgPath,
+                         writer.databaseSrc, int(size[1]), int(size[0]),
+                         int(size[2]) if len(size) == 3 else 1, int(bool(writer.verified)))
+                boxes = [(b['name'], False, b['difficult'], b['xmin'], b['ymin'], b['xmax'],
+                          b['ymax']) + (None,) * 5 + (b['extra'],) for b in writer.boxlist]
+                boxes += [(b['name'], True, b['difficult']) + (None,) * 4
+                          + (b['cx'], b['cy'], b['w'], b['h'], b['angle'], b['extra'])
+                          for b in writer.roboxlist]
+                self._store(key, image, boxes)
+
+    def remove(self, key):
+        with self.lock, self.connection:
+            self.connection.execute('DELETE FROM images WHERE key = ?', (key,))
+
+    def _image(self, key):
+        return self.connection.execute(
+            'SELECT id, folder, filename, path, source, width, height, depth, verified'
+            ' FROM images WHERE key = ?', (key,)).fetchone()
+
+    def _boxes(self, imageId):
+        return self.connection.execute(
+            'SELECT classes.name, %s FROM boxes JOIN classes ON classes.id = boxes.class'
+            ' WHERE boxes.image = ? ORDER BY boxes.seq' % _BOX_COLUMNS, (imageId,)).fetchall()
+
+    def load(self, key):
+        """The StoredAnnotation of key, None when there is none."""
+        with self.lock:
+            image = self._image(key)
+            if image is None:
+                return None
+            return StoredAnnotation(key, image[1:], self._boxes(image[0]))
+
+    def boxCounts(self, keys):
+        """Number of boxes of each of keys, None for keys not stored."""
+        with self.lock:
+            counts = dict(self.connection.execute(
+                'SELECT images.key, COUNT(boxes.image) FROM images'
+                ' LEFT JOIN boxes ON boxes.image = images.id GROUP BY images.id'))
+        return [counts.get(key) for key in keys]
+
+    def readColumns(self, keys):
+        """The boxes of keys as readVocBatch gives them for their files;
+        keys not stored count as files that could not be read."""
+        columns = VocColumns(keys)
+        labels, boxes, rotated, difficult, extra, counts = [], [], [], [], [], []
+        with self.lock:
+            for i, key in enumerate(keys):
+                image = self._image(key)
+                if image is None:
+                    columns.errors[i] = PascalVocError(key, 'not in %s' % self.path)
+                    counts.append(0)
+                    continue
+                columns.filenames[i] = image[2]
+                columns.width[i], columns.height[i], columns.depth[i] = image[5:8]
+                columns.verified[i] = image[8]
+                rows = self._boxes(image[0])
+                for label, isRotated, hard, xmin, ymin, xmax, ymax, cx, cy, w, h, angle, text in rows:
+                    labels.append(label)
+                    boxes.append((cx, cy, w, h, angle) if isRotated else (xmin, ymin, xmax, ymax, 0.))
+                    rotated.append(isRotated)
+                    difficult.append(hard)
+                    extra.append(text)
+                counts.append(len(rows))
+        columns.setBoxes(counts, labels, boxes, rotated, difficult, extra)
+        return columns
+
+    def importVoc(self, annDir):
+        """Store every .xml below annDir, replacing images already there.
+        Returns the number imported and the PascalVocErrors of the files
+        that could not be read."""
+        paths = []
+        for root, dirs, files in os.walk(annDir):
+            dirs.sort()
+            paths.extend(os.path.join(root, name) for name in sorted(files)
+                         if name.endswith(XML_EXT))
+        imported = 0
+        errors = []
+        for start in range(0, len(paths), IMPORT_BATCH):
+            records = []
+            for path in paths[start:start + IMPORT_BATCH]:
+                try:
+                    reader = _RecordReader(path)
+                except PascalVocError as e:
+                    errors.append(e)
+                    continue
+                image = (reader.foldername, reader.filename, reader.localImgPath,
+                         reader.databaseSrc, reader.width, reader.height, reader.depth,
+                         int(reader.verified))
+                records.append((dbKey(annDir, path), image, reader.shapes))
+            with self.lock, self.connection:
+                for key, image, boxes in records:
+                    self._store(key, image, boxes)
+            imported += len(records)
+        return imported, errors
+
+    def writer(self, key):
+        """A PascalVocWriter of the image key, None when there is none."""
+        with self.lock:
+            image = self._image(key)
+            if image is None:
+                return None
+            boxes = self._boxes(image[0])
+        folder, filename, path, source, width, height, depth, verified = image[1:]
+        writer = PascalVocWriter(folder, filename, [height, width, depth],
+                                 databaseSrc=source or 'Unknown', localImgPath=path)
+        writer.verified = bool(verified)
+        for label, isRotated, difficult, xmin, ymin, xmax, ymax, cx, cy, w, h, angle, extra in boxes:
+            if isRotated:
+                writer.addRotatedBndBox(cx, cy, w, h, angle, label, difficult, extra)
+            else:
+                writer.addBndBox(xmin, ymin, xmax, ymax, label, difficult, extra)
+        return writer
+
+    def exportVoc(self, annDir):
+        """Write every image as annDir/<key>.xml, return how many."""
+        keys = self.keys()
+        for key in keys:
+            path = os.path.join(annDir, *key.split('/')) + XML_EXT
+            directory = os.path.dirname(path)
+            if not os.path.isdir(directory):
+                os.makedirs(directory)
+            atomicWrite(path, self.writer(key).write)
+        return len(keys)
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 2 or argv[0] not in ('import', 'export') or \
+            (argv[0] == 'export' and len(argv) < 3):
+        print(__doc__)
+        return 1
+    if argv[0] == 'import':
+        db = AnnotationDb(argv[2] if len(argv) > 2 else os.path.join(argv[1], ANNOTATION_DB))
+        imported, errors = db.importVoc(argv[1])
+        for e in errors:
+            print('skipped %s' % e, file=sys.stderr)
+        print('%d files imported into %s' % (imported, db.path), file=sys.stderr)
+    else:
+        db = AnnotationDb(argv[1])
+        print('%d files written to %s' % (db.exportVoc(argv[2]), argv[2]), file=sys.stderr)
+    db.close()
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
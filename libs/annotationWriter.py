@@ -0,0 +1,144 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from functools import partial
+
+from PyQt5.QtCore import *
+
+# Mode of newly created files, as open() would give them.
+_UMASK = os.umask(0)
+os.umask(_UMASK)
+
+
+def atomicWrite(path, write):
+    """Call write with a binary file in the directory of path, then move
+    that file over path. Readers see either the old file or the complete
+    new one, never a partial write."""
+    directory = os.path.dirname(os.path.abspath(path))
+    fd, tmp = tempfile.mkstemp(prefix='.%s.' % os.path.basename(path), suffix='.tmp',
+                               dir=directory)
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            write(f)
+            f.flush()
+            os.fsync(f.fileno())
+        try:
+            mode = os.stat(path).st_mode & 0o7777
+        except OSError:
+            mode = 0o666 & ~_UMASK
+        os.chmod(tmp, mode)
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+
+
+def _removeFile(path):
+    if os.path.exists(path):
+        os.remove(path)
+
+
+class _WriterSignals(QObject):
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
+
+class AnnotationWriter(QObject):
+    """Saves and removes annotation files on a background thread.
+
+    save() takes an object with a write(file) method, a PascalVocWriter,
+    holding a snapshot of the annotation. Jobs run one at a time in the
+    order queued; queueing another job for a path that is still waiting
+    replaces it, so only the latest state of a file is written. Files
+    are written with atomicWrite. call() queues any other function under
+    a key of its own, a database save for instance.
+
+    Call wait() before reading a file back, and close() before exiting.
+    """
+
+    saved = pyqtSignal(str)
+    failed = pyqtSignal(str, str)
+
+    def __init__(self, parent=None):
+        super(AnnotationWriter, self).__init__(parent)
+        # The thread emits through an object of its own, which outlives
+        # this one if the window goes away with writes still queued.
+        self.signals = _WriterSignals()
+        self.signals.saved.connect(self.saved)
+        self.signals.failed.connect(self.failed)
+        self.pending = OrderedDict()
+        self.busy = None
+        self.condition = threading.Condition()
+        self.thread = None
+        self.closing = False
+
+    def save(self, path, writer):
+        self.queue(path, partial(atomicWrite, path, writer.write), True)
+
+    def remove(self, path):
+        """Delete path, if it exists, once the saves queued before are done."""
+        self.queue(path, partial(_removeFile, path), False)
+
+    def call(self, key, function, saves=True):
+        """Run function() in turn; saved(key) is emitted after it when
+        saves is set, failed(key, message) if it raises."""
+        self.queue(key, function, saves)
+
+    def queue(self, path, function, saves):
+        with self.condition:
+            self.pending[path] = (function, saves)
+            if self.thread is None:
+                self.thread = threading.Thread(target=self.run, args=(self.signals,),
+                                               name='AnnotationWriter')
+                self.thread.daemon = True
+                self.thread.start()
+            self.condition.notify_all()
+
+    def wait(self, path):
+        """Block until the jobs queued for path are done."""
+        with self.condition:
+            while path in self.pending or self.busy == path:
+                self.condition.wait()
+
+    def flush(self):
+        """Block until every queued job is done."""
+        with self.condition:
+            while self.pending or self.busy is not None:
+                self.condition.wait()
+
+    def close(self):
+        self.flush()
+        with self.condition:
+            thread, self.thread = self.thread, None
+            self.closing = True
+            self.condition.notify_all()
+        if thread is not None:
+            thread.join()
+        self.closing = False
+
+    def run(self, signals):
+        while True:
+            with self.condition:
+                while not self.pending and not self.closing:
+                    self.condition.wait()
+                if not self.pending:
+                    return
+                path, (function, saves) = self.pending.popitem(last=False)
+                self.busy = path
+            try:
+                function()
+                if saves:
+                    signals.saved.emit(path)
+            except Exception as e:
+                signals.failed.emit(path, str(e))
+            finally:
+                with self.condition:
+                    self.busy = None
+                    self.condition.notify_all()
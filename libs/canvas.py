@@ -5,9 +5,14 @@ from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
-from .shape import Shape
+from .shape import Shape, moveShapes
+from .shapeStore import ShapeStore
+from .undoStack import UndoStack
 from .lib import distance
 from libs.labelFile import LabelFile
+from libs.frameProfiler import FrameProfiler
+from libs.mipmap import MipmapCache
+from libs.loupe import Loupe
 import math
 
 CURSOR_DEFAULT = Qt.ArrowCursor
@@ -17,6 +22,93 @@ CURSOR_MOVE = Qt.ClosedHandCursor
 CURSOR_GRAB = Qt.OpenHandCursor
 
 
+class CanvasOverlay(QWidget):
+    """Transparent child of the canvas that draws the drawing crosshair,
+    the rubber-band rect and the profiler HUD.
+
+    Cursor moves only invalidate the strips and rects that were painted
+    last time plus the ones to paint now, so the canvas below repaints
+    those regions instead of the whole image.
+    """
+
+    def __init__(self, canvas):
+        super(CanvasOverlay, self).__init__(canvas)
+        self.canvas = canvas
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setAttribute(Qt.WA_NoSystemBackground)
+        self.setFocusPolicy(Qt.NoFocus)
+        # Area painted since the last refresh, erased by the next one.
+        self._painted = QRegion()
+
+    def crosshairRegion(self, pos, bounds):
+        x, y = int(pos.x()), int(pos.y())
+        region = QRegion(QRect(x - 1, bounds.top(), 3, bounds.height()))
+        return region.united(QRegion(QRect(bounds.left(), y - 1, bounds.width(), 3)))
+
+    def bandRegion(self, rect):
+        # Room for the vertex handles and pen of the shape being drawn.
+        m = 2 * Shape.point_size + 4
+        return QRegion(rect.normalized().adjusted(-m, -m, m, m))
+
+    def refresh(self):
+        canvas = self.canvas
+        region = self._painted
+        cross = canvas.crosshairPos()
+        if cross is not None:
+            region = region.united(self.crosshairRegion(cross, canvas.pixmapRect()))
+        band = canvas.rubberBandRect()
+        if band is not None:
+            region = region.united(self.bandRegion(band))
+        band = canvas.selectionBandRect()
+        if band is not None:
+            region = region.united(self.bandRegion(band))
+        self._painted = QRegion()
+        if not region.isEmpty():
+            self.update(region)
+
+    def paintEvent(self, event):
+        canvas = self.canvas
+        if not canvas.pixmap or canvas.pixmap.isNull():
+            return
+        profiler = canvas.profiler
+        profiling = profiler.enabled
+        if profiling:
+            profiler.resume()
+
+        p = QPainter(self)
+        band = canvas.rubberBandRect()
+        if band is not None:
+            p.setPen(canvas.drawingRectColor)
+            p.setBrush(QBrush(Qt.BDiagPattern))
+            p.drawRect(band)
+            self._painted = self._painted.united(self.bandRegion(band))
+        band = canvas.selectionBandRect()
+        if band is not None:
+            p.setPen(QPen(canvas.drawingRectColor, 1, Qt.DashLine))
+            p.setBrush(QColor(0, 128, 255, 40))
+            p.drawRect(band)
+            self._painted = self._painted.united(self.bandRegion(band))
+        if profiling:
+            profiler.mark('overlays')
+
+        cross = canvas.crosshairPos()
+        if cross is not None:
+            bounds = canvas.pixmapRect()
+            x, y = int(cross.x()), int(cross.y())
+            p.setCompositionMode(QPainter.RasterOp_SourceXorDestination)
+            p.setPen(QPen(QColor(255, 255, 255), 1))
+            p.drawLine(x, bounds.top(), x, bounds.bottom())
+            p.drawLine(bounds.left(), y, bounds.right(), y)
+            p.setCompositionMode(QPainter.CompositionMode_SourceOver)
+            self._painted = self._painted.united(self.crosshairRegion(cross, bounds))
+        if profiling:
+            profiler.mark('crosshair')
+            profiler.endFrame()
+            hud = profiler.paint(p, self.visibleRegion().boundingRect().topLeft())
+            self._painted = self._painted.united(QRegion(hud))
+        p.end()
+
+
 class Canvas(QWidget):
     zoomRequest = pyqtSignal(int)
     scrollRequest = pyqtSignal(int, int)
@@ -45,8 +137,16 @@ class Canvas(QWidget):
         # Initialise local state.
         self.mode = self.EDIT
         self.shapes = []
+        # Geometry of self.shapes, in the same order.
+        self.store = ShapeStore()
+        self.history = UndoStack(parent=self)
         self.current = None
         self.selectedShape = None  # save the selected shape here
+        # Every selected shape, in selection order; selectedShape is the
+        # last one and the one mouse and key edits are anchored to.
+        self.selectedShapes = []
+        # Image points of a rubber-band selection in progress.
+        self.selectionBand = None
         self.selectedShapeCopy = None
         self.drawingLineColor = QColor(0, 0, 255)
         self.drawingRectColor = QColor(0, 0, 255) 
@@ -55,8 +155,6 @@ class Canvas(QWidget):
         self.offsets = QPointF(), QPointF()
         self.scale = 1.0
         self.pixmap = QPixmap()
-        
-        #self.localScalePixmap = QPixmap()
 
         self.visible = {}
         self._hideBackround = False
@@ -77,6 +175,12 @@ class Canvas(QWidget):
         self.hideNormal = False
         self.canOutOfBounding = True
         self.showCenter = False
+
+        self.profiler = FrameProfiler()
+        self.overlay = CanvasOverlay(self)
+        self.mipmaps = MipmapCache(self)
+        self.mipmaps.levelAdded.connect(self.update)
+        self.loupe = Loupe(self)
         
         #self.setAttribute(Qt.WA_PaintOnScreen)
 
@@ -99,6 +203,11 @@ class Canvas(QWidget):
     def isVisible(self, shape):
         return self.visible.get(shape, True)
 
+    def visibleShapes(self):
+        """Shapes that are shown and can be selected, in paint order."""
+        return [s for s in self.shapes if self.isVisible(s) and
+                ((s.isRotated and not self.hideRotated) or (not s.isRotated and not self.hideNormal))]
+
     def drawing(self):
         return self.mode == self.CREATE
 
@@ -114,6 +223,10 @@ class Canvas(QWidget):
         self.repaint()
         self.update()
 
+    def setProfiling(self, enabled):
+        self.profiler.setEnabled(enabled)
+        self.update()
+
     def setEditing(self, value=1):
         self.mode = value
         if value == self.CREATE or value == self.CONTINUECREATE:  # Create
@@ -130,26 +243,15 @@ class Canvas(QWidget):
     def selectedVertex(self):
         return self.hVertex is not None
 
-    # reserve function
+    def setLoupeEnabled(self, enabled):
+        self.loupe.setVisible(enabled)
+
     def updateLocalScaleMap(self, x, y):
-        pass
-        #if self.pixmap is None:
-        #    return
-
-        #rz = 15
-        #x0 = int(x) - rz
-        #x1 = int(x) + rz
-        #y0 = int(y) - rz
-        #y1 = int(y) + rz
-
-        #self.localScalePixmap = self.pixmap.copy(x0, y0, x1 - x0 + 1, y1 - y0 + 1) #self.grab(QRect(x0, y0, x1 - x0 + 1, y1 - y0 + 1))
-        ##self.localScalePixmap.grabWidget(self, pos.x(), pos.y(), 30, 30) # TODO: pyQt4
-        #w = self.localScalePixmap.width()
-        #h = self.localScalePixmap.height()
-        #self.localScalePixmap = self.localScalePixmap.scaled(w * 5, h * 5, Qt.KeepAspectRatio)
+        self.loupe.moveTo(QPointF(x, y))
 
     def mouseMoveEvent(self, ev):
         """Update line with last point and current coordinates."""
+        self.profiler.markInput()
         pos = self.transformPos(ev.pos())
 
         # Update coordinates in status bar if image is opened
@@ -183,12 +285,12 @@ class Canvas(QWidget):
             
             self.updateLocalScaleMap(pos.x(), pos.y())
             
-            self.repaint()
+            self.overlay.refresh()
             return
 
         if self.continueDrawing():
             self.prevPoint = pos
-            self.repaint()
+            self.overlay.refresh()
             return
 
         # Polygon copy moving.
@@ -211,6 +313,10 @@ class Canvas(QWidget):
 
         # Polygon/Vertex moving.
         if Qt.LeftButton & ev.buttons():
+            if self.selectionBand is not None:
+                self.selectionBand[1] = pos
+                self.overlay.refresh()
+                return
             if self.selectedVertex():
                 self.boundedMoveVertex(pos)
                 self.shapeMoved.emit()
@@ -229,11 +335,15 @@ class Canvas(QWidget):
         # - Highlight vertex
         # Update shape/vertex fill and tooltip value accordingly.
         self.setToolTip("Background")
-        for shape in reversed([s for s in self.shapes if self.isVisible(s)]):
+        epsilon = self.epsilon / self.scale if self.scale > 1 else self.epsilon
+        rows, vertices, inside = self.store.hitTest(pos.x(), pos.y(), epsilon)
+        for row, index, contains in zip(rows, vertices.tolist(), inside.tolist()):
+            shape = self.store.views[row]
+            if not self.isVisible(shape):
+                continue
             # Look for a nearby vertex to highlight. If that fails,
             # check if we happen to be inside a shape.
-            index = shape.nearestVertex(pos, self.epsilon / self.scale if self.scale > 1 else self.epsilon)
-            if index is not None:
+            if index >= 0:
                 if self.selectedVertex():
                     self.hShape.highlightClear()
                 self.hVertex, self.hShape = index, shape
@@ -248,7 +358,7 @@ class Canvas(QWidget):
 
                 self.update()
                 break
-            elif shape.containsPoint(pos):
+            elif contains:
                 if self.selectedVertex():
                     self.hShape.highlightClear()
                 self.hVertex, self.hShape = None, shape
@@ -285,12 +395,12 @@ class Canvas(QWidget):
                 self.update()
             else:
                 self.updateLocalScaleMap(pos.x(), pos.y())
-                self.repaint()
             self.hVertex, self.hShape = None, None
             self.overrideCursor(CURSOR_DEFAULT)
 
 
     def mousePressEvent(self, ev):
+        self.profiler.markInput()
         pos = self.transformPos(ev.pos())
 
         if ev.button() == Qt.LeftButton:
@@ -298,16 +408,27 @@ class Canvas(QWidget):
                 self.handleDrawing(pos)
             if self.continueDrawing():
                 pass
+            elif ev.modifiers() & Qt.ControlModifier and self.editing():
+                self.toggleShapePoint(pos)
             else:
                 self.selectShapePoint(pos)
+                if self.selectedShape is None and self.editing():
+                    self.selectionBand = [pos, pos]
+                self.beginEdit()
                 self.prevPoint = pos
                 self.repaint()
         elif ev.button() == Qt.RightButton and self.editing():
             self.selectShapePoint(pos)
+            self.beginEdit()
             self.prevPoint = pos
             self.repaint()
 
     def mouseReleaseEvent(self, ev):
+        # A whole drag is one undo step.
+        self.history.commit()
+        if self.selectionBand is not None and ev.button() == Qt.LeftButton:
+            self.endSelectionBand(ev.modifiers() & Qt.ControlModifier)
+            return
         if ev.button() == Qt.RightButton:
             if self.selectedVertex() and self.selectedShape.isRotated:
                 return
@@ -337,12 +458,18 @@ class Canvas(QWidget):
         #del shape.fill_color
         #del shape.line_color
         if copy:
+            shape.attach(self.store)
             self.shapes.append(shape)
-            self.selectedShape.selected = False
+            self.history.recordAdd([shape])
+            self.clearSelection()
+            shape.selected = True
+            self.selectedShapes = [shape]
             self.selectedShape = shape
             self.repaint()
         else:
+            self.beginEdit()
             self.selectedShape.points = [p for p in shape.points]
+            self.history.commit()
         self.selectedShapeCopy = None
 
     def hideBackroundShapes(self, value):
@@ -406,29 +533,93 @@ class Canvas(QWidget):
             self.finalise()
 
     def selectShape(self, shape):
-        self.deSelectShape()
-        shape.selected = True
-        self.selectedShape = shape
+        self.selectShapes([shape])
+
+    def selectShapes(self, shapes):
+        """Make shapes the selection, the last one becomes selectedShape."""
+        if not shapes:
+            self.deSelectShape()
+            return
+        self.clearSelection()
+        for shape in shapes:
+            shape.selected = True
+        self.selectedShapes = list(shapes)
+        self.selectedShape = self.selectedShapes[-1]
         self.setHiding()
         self.selectionChanged.emit(True)
         self.update()
 
+    def shapeAt(self, point):
+        """The topmost visible shape containing point, or None."""
+        rows, _, inside = self.store.hitTest(point.x(), point.y())
+        for row in rows[inside]:
+            shape = self.store.views[row]
+            if self.isVisible(shape):
+                return shape
+        return None
+
     def selectShapePoint(self, point):
         """Select the first shape created which contains this point."""
-        self.deSelectShape()
         if self.selectedVertex():  # A vertex is marked for selection.
             index, shape = self.hVertex, self.hShape
             shape.highlightVertex(index, shape.MOVE_VERTEX)
             self.selectShape(shape)
             return
-        for shape in reversed(self.shapes):
-            if self.isVisible(shape) and shape.containsPoint(point):
-                self.selectShape(shape)
-                self.calculateOffsets(shape, point)
-                return
+        shape = self.shapeAt(point)
+        if shape is None:
+            self.deSelectShape()
+            return
+        if shape in self.selectedShapes:
+            # Keep a multi-selection so that it can be dragged as a whole.
+            self.selectedShape = shape
+        else:
+            self.selectShape(shape)
+        self.calculateOffsets(shape, point)
+
+    def toggleShapePoint(self, point):
+        """Add the shape under point to the selection or take it out."""
+        shape = self.shapeAt(point)
+        if shape is None:
+            return
+        if shape in self.selectedShapes:
+            shape.selected = False
+            self.selectedShapes.remove(shape)
+            self.selectShapes(self.selectedShapes[:])
+        else:
+            self.selectShapes(self.selectedShapes + [shape])
+
+    def shapesInRect(self, rect):
+        """Visible shapes lying entirely inside rect, in paint order."""
+        rows = self.store.rows()
+        if not len(rows):
+            return []
+        boxes = self.store.boundingBoxes(rows)
+        inside = (boxes[:, 0] >= rect.left()) & (boxes[:, 2] <= rect.right()) & \
+                 (boxes[:, 1] >= rect.top()) & (boxes[:, 3] <= rect.bottom())
+        inside = set(self.store.views[row] for row in rows[inside])
+        return [s for s in self.visibleShapes() if s in inside]
+
+    def endSelectionBand(self, add=False):
+        start, end = self.selectionBand
+        self.selectionBand = None
+        self.overlay.refresh()
+        shapes = self.shapesInRect(QRectF(start, end).normalized())
+        if add:
+            shapes = self.selectedShapes + [s for s in shapes if not s.selected]
+        self.selectShapes(shapes)
+
+    def selectionRect(self):
+        """Bounding rect of every selected shape."""
+        boxes = self.store.boundingBoxes([s.row for s in self.selectedShapes])
+        x0, y0 = boxes[:, :2].min(axis=0)
+        x1, y1 = boxes[:, 2:].max(axis=0)
+        return QRectF(QPointF(x0, y0), QPointF(x1, y1))
 
     def calculateOffsets(self, shape, point):
-        rect = shape.boundingRect()
+        if shape is self.selectedShape and len(self.selectedShapes) > 1:
+            rect = self.selectionRect()
+        else:
+            rect = shape.boundingRect()
         x1 = rect.x() - point.x()
         y1 = rect.y() - point.y()
         x2 = (rect.x() + rect.width()) - point.x()
@@ -572,7 +763,10 @@ class Canvas(QWidget):
         # go outside of the shape's area for some reason. XXX
         #self.calculateOffsets(self.selectedShape, pos)
         if dp:
-            shape.moveBy(dp)
+            if shape is self.selectedShape and len(self.selectedShapes) > 1:
+                self.store.translate([s.row for s in self.selectedShapes], dp.x(), dp.y())
+            else:
+                shape.moveBy(dp)
             self.prevPoint = pos
             shape.close()
             return True
@@ -601,35 +795,48 @@ class Canvas(QWidget):
             return True
         return False
 
+    def clearSelection(self):
+        """Drop the selection without telling anyone."""
+        for shape in self.selectedShapes:
+            shape.selected = False
+        self.selectedShapes = []
+        self.selectedShape = None
+
     def deSelectShape(self):
         if self.selectedShape:
-            self.selectedShape.selected = False
-            self.selectedShape = None
+            self.clearSelection()
             self.setHiding(False)
             self.selectionChanged.emit(False)
             self.update()
 
     def deleteSelected(self):
-        if self.selectedShape:
-            shape = self.selectedShape
-            self.shapes.remove(self.selectedShape)
-            self.selectedShape = None
-            self.update()
-            return shape
+        """Delete every selected shape, return them."""
+        shapes = self.selectedShapes
+        if shapes:
+            self.clearSelection()
+            self.history.recordRemove(shapes)
+            self.removeShapes(shapes)
+        return shapes
         
     def deleteAll(self):
-        self.shapes.clear()
-        self.selectedShape = None
+        if self.shapes:
+            self.history.recordRemove(self.shapes)
+        self.shapes = []
+        self.store = ShapeStore()
+        self.clearSelection()
         self.update()
 
     def copySelectedShape(self):
         if self.selectedShape:
             shape = self.selectedShape.copy()
             self.deSelectShape()
+            shape.attach(self.store)
             self.shapes.append(shape)
             shape.selected = True
+            self.selectedShapes = [shape]
             self.selectedShape = shape
             self.boundedShiftShape(shape)
+            self.history.recordAdd([shape])
             return shape
 
     def boundedShiftShape(self, shape):
@@ -643,10 +850,14 @@ class Canvas(QWidget):
             self.boundedMoveShape(shape, point + offset)
 
     def paintEvent(self, event):
-        if not self.pixmap:
+        if not self.pixmap or self.pixmap.isNull():
             return super(Canvas, self).paintEvent(event)
 
         p = self._painter
+        profiler = self.profiler
+        profiling = profiler.enabled
+        if profiling:
+            profiler.beginFrame()
         
         #ur = event.rect()
         #tmppix = QPixmap(ur.size())
@@ -666,41 +877,54 @@ class Canvas(QWidget):
         p.scale(self.scale, self.scale)
         p.translate(self.offsetToCenter())
 
-        p.drawPixmap(0, 0, self.pixmap)
+        # Zoomed out, draw from a pre-reduced level so that the smooth
+        # transform only has to shrink it by less than half.
+        pixmap = self.mipmaps.levelFor(self.scale) or self.pixmap
+        fx = pixmap.width() / float(self.pixmap.width())
+        fy = pixmap.height() / float(self.pixmap.height())
+
+        # Overlay updates expose a few thin strips, only blit the pixels
+        # under each of them.
+        exposed = [self.exposedImageRect(r) for r in event.region().rects()]
+        bounds = QRectF(self.pixmap.rect())
+        for rect in exposed:
+            target = QRectF(rect.intersected(bounds).toAlignedRect())
+            if not target.isEmpty():
+                source = QRectF(target.x() * fx, target.y() * fy,
+                                target.width() * fx, target.height() * fy)
+                p.drawPixmap(target, pixmap, source)
+        if profiling:
+            profiler.mark('image')
+
         Shape.scale = self.scale
+        drawn = culled = 0
         for shape in self.shapes:
             if (shape.selected or not self._hideBackround) and self.isVisible(shape):
                 if (shape.isRotated and not self.hideRotated) or (not shape.isRotated and not self.hideNormal):
+                    # Labels are drawn outside the box, never cull those.
+                    if not (shape.paintLabel and shape.extra_label):
+                        shapeRect = shape.boundingRect()
+                        if not any(r.intersects(shapeRect) for r in exposed):
+                            culled += 1
+                            continue
                     shape.fill = shape.selected or shape == self.hShape
                     shape.paint(p)
+                    drawn += 1
                 elif self.showCenter:
                     shape.fill = shape.selected or shape == self.hShape
                     shape.paintNormalCenter(p) #shape.paint(p)
+                    drawn += 1
+        if profiling:
+            profiler.mark('shapes')
+
         if self.current:
             self.current.paint(p)
             self.line.paint(p)
         if self.selectedShapeCopy:
             self.selectedShapeCopy.paint(p)
-
-        # Paint rect
-        if self.current is not None and len(self.line) == 2:
-            leftTop = self.line[0]
-            rightBottom = self.line[1]
-            rectWidth = rightBottom.x() - leftTop.x()
-            rectHeight = rightBottom.y() - leftTop.y()
-            p.setPen(self.drawingRectColor)
-            brush = QBrush(Qt.BDiagPattern)
-            p.setBrush(brush)
-            p.drawRect(int(leftTop.x()), int(leftTop.y()), int(rectWidth), int(rectHeight))
-
-        if (self.drawing() or self.continueDrawing()) and not self.prevPoint.isNull() and not self.outOfPixmap(self.prevPoint):
-            oldmode = p.compositionMode()
-            p.setCompositionMode(QPainter.RasterOp_SourceXorDestination)
-            p.setPen(QPen(QColor(255,255,255), 1/self.scale)) # TODO : limit pen width
-
-            p.drawLine(int(self.prevPoint.x()), 0, int(self.prevPoint.x()), int(self.pixmap.height()))
-            p.drawLine(0, int(self.prevPoint.y()), int(self.pixmap.width()), int(self.prevPoint.y()))
-            p.setCompositionMode(oldmode)
+        # The rubber-band rect and the crosshair are drawn by self.overlay.
+        if profiling:
+            profiler.mark('overlays')
 
         self.setAutoFillBackground(True)
         if self.verified:
@@ -711,18 +935,9 @@ class Canvas(QWidget):
             pal = self.palette()
             pal.setColor(self.backgroundRole(), QColor(232, 232, 232, 255))
             self.setPalette(pal)
-
-        #p.translate(-self.offsetToCenter())
-        #p.scale(1/self.scale, 1/self.scale)
-        #if self.localScalePixmap is not None:
-        #    p0 = QPoint(0, 0)
-        #    p1 = self.mapFromParent(p0)
-        #    if p1.x() > 0:
-        #        p0.setX(p1.x())
-        #    if p1.y() > 0:
-        #        p0.setY(p1.y())
-            
-        #    p.drawPixmap(p0.x(), p0.y(), self.localScalePixmap)
+        if profiling:
+            profiler.mark('palette')
+            profiler.count(drawn, culled)
 
         p.end()
 
@@ -731,6 +946,52 @@ class Canvas(QWidget):
         #pp.drawPixmap(0,0,tmppix)
         #pp.end()
         
+    def resizeEvent(self, ev):
+        self.overlay.setGeometry(self.rect())
+        super(Canvas, self).resizeEvent(ev)
+
+    def exposedImageRect(self, rect):
+        """Map an exposed widget rect to image coordinates, padded so that
+        vertex handles and pen widths of shapes just outside still count."""
+        s = self.scale
+        offset = self.offsetToCenter()
+        margin = 4 * Shape.point_size / s
+        return QRectF(rect.x() / s - offset.x() - margin,
+                      rect.y() / s - offset.y() - margin,
+                      rect.width() / s + 2 * margin,
+                      rect.height() / s + 2 * margin)
+
+    def imageToWidget(self, point):
+        return (point + self.offsetToCenter()) * self.scale
+
+    def pixmapRect(self):
+        """The pixmap area in widget coordinates."""
+        topLeft = self.imageToWidget(QPointF(0, 0))
+        return QRect(int(topLeft.x()), int(topLeft.y()),
+                     int(self.pixmap.width() * self.scale),
+                     int(self.pixmap.height() * self.scale))
+
+    def crosshairPos(self):
+        """Widget position of the drawing crosshair, None when hidden."""
+        if (self.drawing() or self.continueDrawing()) and not self.prevPoint.isNull() \
+                and not self.outOfPixmap(self.prevPoint):
+            return self.imageToWidget(QPointF(int(self.prevPoint.x()), int(self.prevPoint.y())))
+        return None
+
+    def rubberBandRect(self):
+        """Widget rect of the box being drawn, None when not drawing."""
+        if self.current is not None and len(self.line) == 2:
+            leftTop = self.imageToWidget(self.line[0])
+            rightBottom = self.imageToWidget(self.line[1])
+            return QRectF(leftTop, rightBottom).toRect()
+        return None
+
+    def selectionBandRect(self):
+        """Widget rect of the rubber-band selection, None without one."""
+        if self.selectionBand is None:
+            return None
+        start, end = self.selectionBand
+        return QRectF(self.imageToWidget(start), self.imageToWidget(end)).normalized().toRect()
 
     def transformPos(self, point):
         """Convert from widget-logical coordinates to painter-logical coordinates."""
@@ -760,6 +1021,7 @@ class Canvas(QWidget):
 
         self.current.isRotated = self.canDrawRotatedRect
         self.current.close()
+        self.current.attach(self.store)
         self.shapes.append(self.current)
         self.current = None
         self.setHiding(False)
@@ -880,29 +1142,19 @@ class Canvas(QWidget):
             self.moveOnePixel('Down')
         elif key == Qt.Key_Z and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(0.1):
-            self.selectedShape.rotate(0.1)
-            self.shapeMoved.emit() 
-            self.update()  
+            self.rotateSelected(0.1)
         elif key == Qt.Key_X and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(0.01):
-            self.selectedShape.rotate(0.01) 
-            self.shapeMoved.emit()
-            self.update()  
+            self.rotateSelected(0.01)
         elif key == Qt.Key_C and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(-0.01):
-            self.selectedShape.rotate(-0.01) 
-            self.shapeMoved.emit()
-            self.update()  
+            self.rotateSelected(-0.01)
         elif key == Qt.Key_V and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(-0.1):
-            self.selectedShape.rotate(-0.1)
-            self.shapeMoved.emit()
-            self.update()
+            self.rotateSelected(-0.1)
         elif key == Qt.Key_F and self.selectedShape and\
              self.selectedShape.isRotated and not self.rotateOutOfBound(-math.pi/2):
-            self.selectedShape.rotate(-math.pi/2)
-            self.shapeMoved.emit()
-            self.update()
+            self.rotateSelected(-math.pi/2)
         elif key == Qt.Key_R:
             self.hideRotated = not self.hideRotated
             self.hideRRect.emit(self.hideRotated)
@@ -917,6 +1169,13 @@ class Canvas(QWidget):
             self.showCenter = not self.showCenter
             self.update()
 
+    def rotateSelected(self, angle):
+        self.beginEdit()
+        self.selectedShape.rotate(angle)
+        self.history.commit(key=('rotate', self.selectedShape))
+        self.shapeMoved.emit()
+        self.update()
+
     def rotateOutOfBound(self, angle):
         if self.canOutOfBounding:
             return False
@@ -926,41 +1185,19 @@ class Canvas(QWidget):
         return False
 
     def moveOnePixel(self, direction):
-        # print(self.selectedShape.points)
-        if direction == 'Left' and not self.moveOutOfBound(QPointF(-1.0, 0)):
-            # print("move Left one pixel")
-            self.selectedShape.points[0] += QPointF(-1.0, 0)
-            self.selectedShape.points[1] += QPointF(-1.0, 0)
-            self.selectedShape.points[2] += QPointF(-1.0, 0)
-            self.selectedShape.points[3] += QPointF(-1.0, 0)
-            self.selectedShape.center += QPointF(-1.0, 0)
-        elif direction == 'Right' and not self.moveOutOfBound(QPointF(1.0, 0)):
-            # print("move Right one pixel")
-            self.selectedShape.points[0] += QPointF(1.0, 0)
-            self.selectedShape.points[1] += QPointF(1.0, 0)
-            self.selectedShape.points[2] += QPointF(1.0, 0)
-            self.selectedShape.points[3] += QPointF(1.0, 0)
-            self.selectedShape.center += QPointF(1.0, 0)
-        elif direction == 'Up' and not self.moveOutOfBound(QPointF(0, -1.0)):
-            # print("move Up one pixel")
-            self.selectedShape.points[0] += QPointF(0, -1.0)
-            self.selectedShape.points[1] += QPointF(0, -1.0)
-            self.selectedShape.points[2] += QPointF(0, -1.0)
-            self.selectedShape.points[3] += QPointF(0, -1.0)
-            self.selectedShape.center += QPointF(0, -1.0)
-        elif direction == 'Down' and not self.moveOutOfBound(QPointF(0, 1.0)):
-            # print("move Down one pixel")
-            self.selectedShape.points[0] += QPointF(0, 1.0)
-            self.selectedShape.points[1] += QPointF(0, 1.0)
-            self.selectedShape.points[2] += QPointF(0, 1.0)
-            self.selectedShape.points[3] += QPointF(0, 1.0)
-            self.selectedShape.center += QPointF(0, 1.0)
+        step = {'Left': QPointF(-1.0, 0), 'Right': QPointF(1.0, 0),
+                'Up': QPointF(0, -1.0), 'Down': QPointF(0, 1.0)}[direction]
+        if not self.moveOutOfBound(step):
+            shapes = self.selectedShapes
+            self.beginEdit()
+            self.store.translate([s.row for s in shapes], step.x(), step.y())
+            self.history.commit(key=('move',) + tuple(shapes))
         self.shapeMoved.emit()
         self.repaint()
 
     def moveOutOfBound(self, step):
-        points = [p1+p2 for p1, p2 in zip(self.selectedShape.points, [step]*4)]
-        return True in map(self.outOfPixmap, points)
+        rect = self.selectionRect().translated(step)
+        return self.outOfPixmap(rect.topLeft()) or self.outOfPixmap(rect.bottomRight())
 
     def setLastLabel(self, text, line_color  = None, fill_color = None, extra_text=''):
         assert text
@@ -972,11 +1209,13 @@ class Canvas(QWidget):
         if fill_color:
             self.shapes[-1].fill_color = fill_color
 
+        self.history.recordAdd(self.shapes[-1:])
         return self.shapes[-1]
 
     def undoLastLine(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.current.detach()
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -984,6 +1223,7 @@ class Canvas(QWidget):
     def resetAllLines(self):
         assert self.shapes
         self.current = self.shapes.pop()
+        self.current.detach()
         self.current.setOpen()
         self.line.points = [self.current[-1], self.current[0]]
         self.drawingPolygon.emit(True)
@@ -991,16 +1231,57 @@ class Canvas(QWidget):
         self.drawingPolygon.emit(False)
         self.update()
 
-    def loadPixmap(self, pixmap):
+    def loadPixmap(self, pixmap, image=None):
         self.pixmap = pixmap
+        self.mipmaps.reset(image if image is not None else pixmap)
+        self.loupe.invalidate()
         self.shapes = []
+        self.store = ShapeStore()
+        self.history.clear()
         self.repaint()
 
-    def loadShapes(self, shapes):
+    def loadShapes(self, shapes, store=None):
+        """Show shapes. store is the ShapeStore holding them, in the same
+        order; without it the shapes are copied into a new one."""
         self.shapes = list(shapes)
+        if store is None:
+            store = ShapeStore(len(self.shapes))
+            moveShapes(self.shapes, store)
+        self.store = store
+        self.history.clear()
         self.current = None
         self.repaint()
 
+    def beginEdit(self):
+        """Start recording an undo step for the selected shapes."""
+        if self.selectedShapes:
+            self.history.begin(self.selectedShapes)
+
+    def setShapeStates(self, states):
+        """Write back (shape, state) pairs taken by the undo history."""
+        for shape, state in states:
+            shape.store.setRowState(shape.row, state)
+        self.update()
+
+    def insertShapes(self, shapes):
+        """Put removed shapes back, on top of the others."""
+        for shape in shapes:
+            shape.selected = False
+        moveShapes(shapes, self.store)
+        self.shapes.extend(shapes)
+        self.update()
+
+    def removeShapes(self, shapes):
+        removed = set(shapes)
+        if removed.intersection(self.selectedShapes):
+            self.deSelectShape()
+        if self.hShape in removed:
+            self.hVertex = self.hShape = None
+        self.shapes = [s for s in self.shapes if s not in removed]
+        # One store for all of them, kept by the undo history.
+        moveShapes(shapes, ShapeStore(len(shapes)))
+        self.update()
+
     def setShapeVisible(self, shape, value):
         self.visible[shape] = value
         self.repaint()
@@ -1024,5 +1305,6 @@ class Canvas(QWidget):
     def resetState(self):
         self.restoreCursor()
         self.pixmap = None
-        #self.localScalePixmap = None
+        self.mipmaps.reset()
+        self.loupe.invalidate()
         self.update()
@@ -0,0 +1,388 @@
+# -*- coding: utf-8 -*-
+"""COCO detection JSON, to and from VOC annotations.
+
+Export streams the images and annotations arrays to disk as the
+annotation files are read, import parses the JSON an element at a time;
+neither holds the whole document.
+
+Every annotation has a bbox and its four corners as a segmentation
+polygon. Rotated boxes also carry "rbox": [cx, cy, w, h, angle] as in
+<robndbox>, which import reads back as a rotated box. "difficult" and
+"extra" keep the fields of the same name.
+
+    python -m libs.coco_io export <annotation dir> <out.json>
+    python -m libs.coco_io import <in.json> <image dir> [save dir]
+"""
+from __future__ import absolute_import, print_function
+
+import json
+import os
+import re
+import sys
+import tempfile
+
+import numpy as np
+
+from .annotationWriter import atomicWrite
+from .geometry import cornersToAABB, cornersToRotated, rotatedToCorners
+from .labelFile import LabelFile
+from .pascal_voc_io import PascalVocReader, PascalVocError, BATCH_CHUNK, XML_EXT
+from .processPool import orderedMap
+
+# Annotations waiting for the images array to be written are kept in
+# memory up to this size, then in a temporary file.
+SPOOL_SIZE = 64 << 20
+
+_BLANK = re.compile(r'[ \t\n\r]*')
+
+
+class CocoError(Exception):
+    """A COCO file that can not be read."""
+
+    def __init__(self, filepath, reason):
+        super(CocoError, self).__init__(filepath, reason)
+        self.filepath = filepath
+        self.reason = reason
+
+    def __str__(self):
+        return '%s: %s' % (self.filepath, self.reason)
+
+
+class _JsonStream(object):
+    """A JSON document read from a text file a chunk at a time. Values
+    are decoded whole by json, the structure around them by hand."""
+
+    def __init__(self, f, chunkSize=1 << 20):
+        self.f = f
+        self.chunkSize = chunkSize
+        self.buffer = ''
+        self.pos = 0
+        # Characters of the file before buffer.
+        self.offset = 0
+        self.eof = False
+        self.decoder = json.JSONDecoder()
+
+    def more(self):
+        if self.eof:
+            return False
+        data = self.f.read(max(self.chunkSize, len(self.buffer) - self.pos))
+        if not data:
+            self.eof = True
+            return False
+        self.offset += self.pos
+        self.buffer = self.buffer[self.pos:] + data
+        self.pos = 0
+        return True
+
+    def peek(self):
+        """The next character that is not blank, '' at the end."""
+        while True:
+            self.pos = _BLANK.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.more():
+                return ''
+
+    def expect(self, chars):
+        c = self.peek()
+        if not c or c not in chars:
+            raise ValueError('expected %s at character %d, found %r'
+                             % (' or '.join(chars), self.offset + self.pos, c or 'the end'))
+        self.pos += 1
+        return c
+
+    def value(self):
+        self.peek()
+        while True:
+            try:
+                value, end = self.decoder.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError as e:
+                if self.more():
+                    continue
+                raise ValueError('%s at character %d' % (e.msg, self.offset + e.pos))
+            # A number may go on in the next chunk.
+            if end == len(self.buffer) and self.more():
+                continue
+            self.pos = end
+            return value
+
+
+def iterCoco(path, arrays=('images', 'annotations', 'categories')):
+    """Yield (key, value) for the members of the top level object of the
+    JSON file path, in file order. The members named in arrays are
+    yielded an element at a time. Raises CocoError."""
+    with open(path, encoding='utf-8') as f:
+        stream = _JsonStream(f)
+        try:
+            stream.expect('{')
+            if stream.peek() == '}':
+                return
+            while True:
+                key = stream.value()
+                if not isinstance(key, str):
+                    raise ValueError('expected a member name, found %r' % (key,))
+                stream.expect(':')
+                if key in arrays and stream.peek() == '[':
+                    stream.expect('[')
+                    if stream.peek() == ']':
+                        stream.pos += 1
+                    else:
+                        while True:
+                            yield key, stream.value()
+                            if stream.expect(',]') == ']':
+                                break
+                else:
+                    yield key, stream.value()
+                if stream.expect(',}') == '}':
+                    return
+        except ValueError as e:
+            raise CocoError(path, str(e))
+
+
+def _dumps(value):
+    return json.dumps(value, ensure_ascii=False, separators=(',', ':'))
+
+
+def cocoAnnotations(shapes):
+    """COCO annotations, without ids, of PascalVocReader shape tuples."""
+    if not shapes:
+        return []
+    corners = np.array([shape[1] for shape in shapes], dtype=float)
+    aabbs = cornersToAABB(corners).tolist()
+    rotated = [len(shape) > 6 for shape in shapes]
+    rboxes = cornersToRotated(corners, [shape[6] if r else 0. for shape, r in zip(shapes, rotated)])
+    annotations = []
+    for shape, isRotated, (xmin, ymin, xmax, ymax), points, rbox in zip(
+            shapes, rotated, aabbs, corners.reshape(-1, 8).tolist(), rboxes.tolist()):
+        if not isRotated:
+            # Integers as the file has them.
+            xmin, ymin = shape[1][0]
+            xmax, ymax = shape[1][2]
+        w, h = xmax - xmin, ymax - ymin
+        annotation = {'bbox': [xmin, ymin, w, h],
+                      'area': rbox[2] * rbox[3] if isRotated else w * h,
+                      'segmentation': [points], 'iscrowd': 0,
+                      'difficult': int(bool(shape[4]))}
+        if isRotated:
+            # Rounded as <robndbox> is written.
+            annotation['rbox'] = list(LabelFile.roundRotatedBndBox(rbox))
+        extra = shape[-1] if len(shape) in (6, 8) else None
+        if extra is not None:
+            annotation['extra'] = extra
+        annotations.append((shape[0], annotation))
+    return annotations
+
+
+def writeCoco(out, records):
+    """Write COCO JSON to the binary file out. records yields (file_name,
+    width, height, shapes) per image, shapes as PascalVocReader gives
+    them. Images and annotations are numbered from 1 in order, the
+    categories in order of first appearance."""
+    categories = {}
+    annotationId = 0
+    out.write(b'{"images":[')
+    with tempfile.SpooledTemporaryFile(SPOOL_SIZE) as spool:
+        for imageId, (fileName, width, height, shapes) in enumerate(records, 1):
+            if imageId > 1:
+                out.write(b',')
+            out.write(('\n' + _dumps({'id': imageId, 'file_name': fileName,
+                                      'width': width, 'height': height})).encode('utf-8'))
+            for label, annotation in cocoAnnotations(shapes):
+                categoryId = categories.setdefault(label, len(categories) + 1)
+                annotationId += 1
+                annotation.update(id=annotationId, image_id=imageId, category_id=categoryId)
+                spool.write(((',' if annotationId > 1 else '') + '\n'
+                             + _dumps(annotation)).encode('utf-8'))
+        out.write(b'\n],"annotations":[')
+        spool.seek(0)
+        while True:
+            data = spool.read(1 << 20)
+            if not data:
+                break
+            out.write(data)
+    out.write(b'\n],"categories":[')
+    out.write(','.join('\n' + _dumps({'id': i, 'name': name, 'supercategory': ''})
+                       for name, i in categories.items()).encode('utf-8'))
+    out.write(b'\n]}\n')
+
+
+def _readRecords(paths):
+    records = []
+    for path in paths:
+        try:
+            reader = PascalVocReader(path)
+        except PascalVocError as e:
+            records.append(e)
+        else:
+            width, height, _ = reader.getSize()
+            records.append((reader.getImageFileName(), width, height, reader.getShapes()))
+    return records
+
+
+def vocRecords(paths, errors, fileNames=None, processes=None, chunkSize=BATCH_CHUNK):
+    """writeCoco records of the annotation files paths, parsed in a pool
+    of processes workers. The images are named as the files' <filename>,
+    or by fileNames. The PascalVocErrors of files that can not be read
+    are appended to errors."""
+    paths = list(paths)
+    chunks = [paths[i:i + chunkSize] for i in range(0, len(paths), chunkSize)]
+    i = 0
+    for records in orderedMap(_readRecords, chunks, processes):
+        for record in records:
+            if isinstance(record, PascalVocError):
+                errors.append(record)
+            elif fileNames is not None:
+                yield (fileNames[i],) + record[1:]
+            else:
+                yield record
+            i += 1
+
+
+def exportCoco(path, records):
+    """writeCoco to the file path, replacing it only once complete."""
+    atomicWrite(path, lambda out: writeCoco(out, records))
+
+
+def readCoco(path):
+    """Images and their annotations in the COCO file path: a list of
+    (file_name, width, height, annotations), and the number of
+    annotations of images not listed. Annotations are (category name,
+    bbox, rbox or None, difficult, extra or None), in file order."""
+    images = []
+    imageIndex = {}
+    categories = {}
+    # Annotations may come before their images and categories.
+    byImage = {}
+    try:
+        for key, value in iterCoco(path):
+            if key == 'images':
+                imageIndex[value['id']] = len(images)
+                images.append((value['file_name'], int(value.get('width', 0)),
+                               int(value.get('height', 0)), []))
+            elif key == 'categories':
+                categories[value['id']] = value['name']
+            elif key == 'annotations':
+                rbox = value.get('rbox')
+                byImage.setdefault(value['image_id'], []).append(
+                    (value['category_id'], [float(v) for v in value['bbox']],
+                     None if rbox is None else [float(v) for v in rbox],
+                     bool(value.get('difficult')), value.get('extra')))
+    except (KeyError, TypeError, ValueError) as e:
+        raise CocoError(path, 'malformed %s' % e)
+    orphans = 0
+    for imageId, annotations in byImage.items():
+        i = imageIndex.get(imageId)
+        if i is None:
+            orphans += len(annotations)
+            continue
+        images[i][3].extend((categories.get(a[0], str(a[0])),) + a[1:] for a in annotations)
+    return images, orphans
+
+
+def cocoShapes(annotations):
+    """LabelFile shapes, as MainWindow.formatShapes gives them, of
+    annotations as readCoco lists them."""
+    rboxes = [rbox for _, _, rbox, _, _ in annotations if rbox is not None]
+    corners = iter(rotatedToCorners(rboxes).tolist() if rboxes else [])
+    shapes = []
+    for label, bbox, rbox, difficult, extra in annotations:
+        if rbox is not None:
+            points = [tuple(p) for p in next(corners)]
+            direction = rbox[4]
+        else:
+            x, y, w, h = bbox
+            points = [(x, y), (x + w, y), (x + w, y + h), (x, y + h)]
+            direction = 0.
+        shapes.append(dict(label=label, points=points, difficult=difficult,
+                           direction=direction, center=None, isRotated=rbox is not None,
+                           extra_text=extra))
+    return shapes
+
+
+def _writeVoc(jobs):
+    """Save the (xmlPath or None, imagePath, imageShape, annotations)
+    jobs. Returns, in order, None for those saved, the PascalVocWriter
+    of those without a path, or the message of a failure."""
+    results = []
+    for xmlPath, imagePath, imageShape, annotations in jobs:
+        try:
+            writer = LabelFile().pascalVocWriter(cocoShapes(annotations), imagePath, imageShape)
+            if xmlPath is None:
+                results.append(writer)
+                continue
+            directory = os.path.dirname(xmlPath)
+            if not os.path.isdir(directory):
+                os.makedirs(directory, exist_ok=True)
+            atomicWrite(xmlPath, writer.write)
+            results.append(None)
+        except Exception as e:
+            results.append('%s: %s' % (xmlPath or imagePath, e))
+    return results
+
+
+def importCoco(path, imageDir, saveDir, db=None, processes=None, chunkSize=BATCH_CHUNK):
+    """Write an annotation of every image of the COCO file path into
+    saveDir, or the AnnotationDb db, laid out as the images are below
+    imageDir. Images without annotations get empty ones, as background
+    samples. Files are written in a pool of processes workers.
+
+    Returns the number of images written and a list of messages about
+    what was skipped. Raises CocoError."""
+    images, orphans = readCoco(path)
+    messages = []
+    if orphans:
+        messages.append('%d annotations of images not listed' % orphans)
+    jobs = []
+    for fileName, width, height, annotations in images:
+        imagePath = os.path.join(imageDir, fileName)
+        relname = os.path.splitext(os.path.normpath(fileName))[0]
+        xmlPath = os.path.join(saveDir, relname + XML_EXT)
+        if relname.startswith(os.pardir) or os.path.isabs(relname):
+            messages.append('%s: outside of %s' % (fileName, imageDir))
+            continue
+        jobs.append((None if db is not None else xmlPath, imagePath, [height, width, 3],
+                     annotations, relname.replace(os.sep, '/')))
+    chunks = [[job[:4] for job in jobs[i:i + chunkSize]]
+              for i in range(0, len(jobs), chunkSize)]
+    written = 0
+    for i, results in enumerate(orderedMap(_writeVoc, chunks, processes)):
+        keys = [job[4] for job in jobs[i * chunkSize:(i + 1) * chunkSize]]
+        saves = []
+        for key, result in zip(keys, results):
+            if isinstance(result, str):
+                messages.append(result)
+            elif result is not None:
+                saves.append((key, result))
+            else:
+                written += 1
+        if saves:
+            db.saveMany(saves)
+            written += len(saves)
+    return written, messages
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if len(argv) < 3 or argv[0] not in ('import', 'export'):
+        print(__doc__)
+        return 1
+    if argv[0] == 'export':
+        annDir = argv[1]
+        paths = [os.path.join(annDir, name) for name in sorted(os.listdir(annDir))
+                 if name.endswith(XML_EXT)]
+        errors = []
+        exportCoco(argv[2], vocRecords(paths, errors))
+        for e in errors:
+            print('skipped %s' % e, file=sys.stderr)
+        print('%d files written to %s' % (len(paths) - len(errors), argv[2]), file=sys.stderr)
+    else:
+        saveDir = argv[3] if len(argv) > 3 else argv[2]
+        written, messages = importCoco(argv[1], argv[2], saveDir)
+        for message in messages:
+            print('skipped %s' % message, file=sys.stderr)
+        print('%d annotations written to %s' % (written, saveDir), file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
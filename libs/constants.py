@@ -13,5 +13,9 @@ SETTING_LAST_OPEN_DIR = 'lastOpenDir'
 SETTING_AUTO_SAVE = 'autosave'
 SETTING_DRAW_CORNER = 'drawcorner'
 SETTING_SINGLE_CLASS = 'singleclass'
+SETTING_MAGNIFIER = 'magnifier'
+SETTING_UNDO_LIMIT = 'undolimit'
+SETTING_CLASS_COLORS = 'classcolors'
+SETTING_YOLO_IMAGES = 'yolo/images'
 FORMAT_PASCALVOC='PscalVOC'
 FORMAT_YOLO='YOLO'
\ No newline at end of file
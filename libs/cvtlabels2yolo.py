@@ -1,64 +1,155 @@
+import csv
 import os
 import shutil
 import random
 import cv2
 import numpy as np
+
+from .geometry import asCorners, aabbToYolo, cornersToObb
+from .processPool import orderedMap
+
 def make_yolo_dirs(basedir, tag = 'train'):
     os.makedirs(os.path.join(basedir, 'images', tag), exist_ok=True)
     os.makedirs(os.path.join(basedir, 'labels', tag), exist_ok=True)
 
-def cvt_lbidata_rotdet(lbi_data_dir, all_shapes_map, yolo_class_map, yolo_data_dir, tag = 'train', format = 'box'):
-    make_yolo_dirs(yolo_data_dir, tag=tag)
+# Images converted by one task of the process pool.
+CONVERT_CHUNK = 16
 
-    f_train_list = open(os.path.join(os.path.join(yolo_data_dir, '{}_list.txt'.format(tag,))), 'w', encoding='utf8')
-    
+# How images get into the export: re-encoded in image_format, or the
+# source file itself, copied or linked.
+IMAGE_MODES = ('transcode', 'copy', 'hardlink', 'symlink')
 
-    for i, (anno_img_fn, img_anno) in enumerate(all_shapes_map.items()):
-        anno_fn = anno_img_fn
-        anno_img_h = img_anno['height']
-        anno_img_w = img_anno['width']
-        anno_bboxes = img_anno['bboxes']
+# cv2.imwrite parameter taking image_quality, by format.
+_QUALITY_PARAMS = {
+    'jpg': cv2.IMWRITE_JPEG_QUALITY,
+    'jpeg': cv2.IMWRITE_JPEG_QUALITY,
+    'webp': cv2.IMWRITE_WEBP_QUALITY,
+}
 
-        f_train_list.write('./images/{}/{}.png\n'.format(tag, i))
 
-        src_fn = os.path.join(lbi_data_dir, anno_fn)
-        dst_fn = os.path.join(yolo_data_dir, 'images', tag, '{}.png'.format(i))
-        # shutil.copy(os.path.join(lbi_data_dir, anno_fn), os.path.join(yolo_data_dir, 'images', tag, '{}.png'.format(i)))
+def _place_image(src_fn, dst_fn, image_mode, image_format, image_quality):
+    # Left by an earlier export, perhaps as a link to the source, which
+    # writing through would overwrite.
+    if os.path.lexists(dst_fn):
+        os.remove(dst_fn)
+    if image_mode == 'transcode':
         decbuf = np.fromfile(src_fn, dtype=np.uint8)
         img = cv2.imdecode(decbuf, cv2.IMREAD_COLOR)
+        if img is None:
+            raise IOError('can not decode the image')
+        params = []
+        if image_quality is not None and image_format in _QUALITY_PARAMS:
+            params = [_QUALITY_PARAMS[image_format], int(image_quality)]
+        ok, buf = cv2.imencode('.' + image_format, img, params)
+        if not ok:
+            raise IOError('can not encode the image as %s' % image_format)
+        buf.tofile(dst_fn)
+    elif image_mode == 'symlink':
+        # A link to a missing file would be made without complaint.
+        if not os.path.isfile(src_fn):
+            raise IOError('no such image file')
+        os.symlink(os.path.abspath(src_fn), dst_fn)
+    elif image_mode == 'hardlink':
+        try:
+            os.link(src_fn, dst_fn)
+        except OSError:
+            # Across file systems, or where links are not supported.
+            shutil.copyfile(src_fn, dst_fn)
+    else:
+        shutil.copyfile(src_fn, dst_fn)
+
+
+def _convert_image(src_fn, dst_fn, label_fn, classes, corners, width, height, format,
+                   image_mode, image_format, image_quality):
+    _place_image(src_fn, dst_fn, image_mode, image_format, image_quality)
+
+    if format == 'box':
+        corners = asCorners(corners)
+        rows = aabbToYolo(np.concatenate([corners[:, 0], corners[:, 2]], axis=1),
+                          width, height)
+    else:
+        rows = cornersToObb(corners, width, height)
+    with open(label_fn, 'w') as f_anno:
+        for bc, row in zip(classes, rows.tolist()):
+            f_anno.write(' '.join(str(v) for v in [bc] + row) + '\n')
+
+
+def _convert_chunk(jobs):
+    """Convert the images of jobs, return the message of each failure
+    or None, in order."""
+    results = []
+    for job in jobs:
+        try:
+            _convert_image(*job)
+            results.append(None)
+        except Exception as e:
+            results.append('%s: %s' % (job[0], e))
+    return results
 
-        cv2.imencode('.png', img)[1].tofile(dst_fn)
-
-        f_anno = open(os.path.join(yolo_data_dir, 'labels', tag, '{}.txt'.format(i)), 'w')
-
-        dw = 1./anno_img_w
-        dh = 1./anno_img_h
-
-        if format == 'box':
-            for b in anno_bboxes:
-                xmin = b['x0']
-                xmax = b['x2']
-                ymin = b['y0']
-                ymax = b['y2']
-                bc = b['class']
-
-                yolo_x = (xmin + xmax) / 2.0
-                yolo_y = (ymin + ymax) / 2.0
-                yolo_w = xmax - xmin
-                yolo_h = ymax - ymin
-                yolo_x *= dw
-                yolo_w *= dw
-                yolo_y *= dh
-                yolo_h *= dh
-
-                f_anno.write("{} {} {} {} {}\n".format(yolo_class_map[bc], yolo_x, yolo_y, yolo_w, yolo_h))
-        elif format == 'rotbox':
-            for b in anno_bboxes:
-                bc = b['class']
-                f_anno.write("{} {} {} {} {} {} {} {} {}\n".format(yolo_class_map[bc],
-                                                                b['x0'] * dw, b['y0'] * dh, b['x1'] * dw, b['y1'] * dh, 
-                                                                b['x2'] * dw, b['y2'] * dh, b['x3'] * dw, b['y3'] * dh
-                                                                ))
+
+def cvt_lbidata_rotdet(lbi_data_dir, all_shapes_map, yolo_class_map, yolo_data_dir, tag = 'train', format = 'box',
+                       processes=None, progress=None, image_mode='transcode', image_format='png',
+                       image_quality=None):
+    """Write the images of all_shapes_map, numbered, with their YOLO
+    label files. Images are converted in a pool of processes worker
+    processes, all CPUs when None, a few chunks at a time. The list file
+    names them in the order of all_shapes_map, leaving out those that
+    failed, and <tag>_sources.csv maps each back to its source.
+
+    image_mode is one of IMAGE_MODES. transcode writes image_format
+    files, with image_quality for JPEG and WebP; copy, hardlink and
+    symlink keep the source file and its extension. Hard links fall back
+    to copies where they can not be made.
+
+    progress(done, total) is called as images are done; returning False
+    from it stops the export. Returns the messages of the failures.
+    """
+    if format not in ('box', 'rotbox'):
+        raise NotImplementedError()
+    if image_mode not in IMAGE_MODES:
+        raise ValueError('image_mode must be one of %s' % ', '.join(IMAGE_MODES))
+    image_format = image_format.lower().lstrip('.')
+    make_yolo_dirs(yolo_data_dir, tag=tag)
+
+    jobs = []
+    for i, (anno_img_fn, img_anno) in enumerate(all_shapes_map.items()):
+        anno_bboxes = img_anno['bboxes']
+        classes = [yolo_class_map[b['class']] for b in anno_bboxes]
+        corners = [[(b['x0'], b['y0']), (b['x1'], b['y1']), (b['x2'], b['y2']), (b['x3'], b['y3'])]
+                   for b in anno_bboxes]
+        if image_mode == 'transcode':
+            ext = '.' + image_format
         else:
-            raise NotImplementedError()
-        f_anno.close()
+            ext = os.path.splitext(anno_img_fn)[1]
+        jobs.append((os.path.join(lbi_data_dir, anno_img_fn),
+                     os.path.join(yolo_data_dir, 'images', tag, '{}{}'.format(i, ext)),
+                     os.path.join(yolo_data_dir, 'labels', tag, '{}.txt'.format(i)),
+                     classes, corners, img_anno['width'], img_anno['height'], format,
+                     image_mode, image_format, image_quality))
+    chunks = [jobs[i:i + CONVERT_CHUNK] for i in range(0, len(jobs), CONVERT_CHUNK)]
+
+    done = []
+    failures = []
+    results = orderedMap(_convert_chunk, chunks, processes)
+    try:
+        for results_chunk in results:
+            for result in results_chunk:
+                if result is not None:
+                    failures.append(result)
+                done.append(result is None)
+            if progress is not None and progress(len(done), len(jobs)) is False:
+                break
+    finally:
+        results.close()
+
+    with open(os.path.join(yolo_data_dir, '{}_list.txt'.format(tag)), 'w', encoding='utf8') as f_train_list, \
+            open(os.path.join(yolo_data_dir, '{}_sources.csv'.format(tag)), 'w', encoding='utf8',
+                 newline='') as f_sources:
+        sources = csv.writer(f_sources)
+        sources.writerow(['id', 'image', 'source'])
+        for i, ok in enumerate(done):
+            if ok:
+                image = 'images/{}/{}'.format(tag, os.path.basename(jobs[i][1]))
+                f_train_list.write('./{}\n'.format(image))
+                sources.writerow([i, image, os.path.abspath(jobs[i][0])])
+    return failures
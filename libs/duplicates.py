@@ -0,0 +1,123 @@
+# -*- coding: utf-8 -*-
+"""Find boxes drawn twice over the same object.
+
+Boxes whose rotated IoU reaches DUPLICATE_IOU are reported as
+duplicates, the ones from NEAR_DUPLICATE_IOU on as near duplicates.
+Runs from the Edit menu on the current image, and over a directory of
+annotations as a batch report:
+
+    python -m libs.duplicates <annotation dir> [report.csv]
+
+A directory holding an annotation database is reported from it.
+"""
+from __future__ import absolute_import, print_function
+
+import csv
+import os
+import sys
+
+import numpy as np
+
+from .annotationDb import AnnotationDb, ANNOTATION_DB, hasAnnotationDb
+from .geometry import asCorners, cornersToAABB, aabbPairs, polygonArea, rotatedIoU
+from .pascal_voc_io import PascalVocReader, PascalVocError, XML_EXT
+
+DUPLICATE_IOU = 0.95
+NEAR_DUPLICATE_IOU = 0.7
+
+
+class Overlap(object):
+    """Boxes first and second of an image overlap by iou."""
+
+    __slots__ = ('first', 'second', 'iou')
+
+    def __init__(self, first, second, iou):
+        self.first = first
+        self.second = second
+        self.iou = iou
+
+    @property
+    def kind(self):
+        return 'duplicate' if self.iou >= DUPLICATE_IOU else 'near duplicate'
+
+
+def findDuplicates(corners, labels=None, threshold=NEAR_DUPLICATE_IOU, sameLabel=False):
+    """Overlaps with an IoU of at least threshold among (M, 4, 2) boxes,
+    by first box then second box. With sameLabel only boxes of the same
+    label are compared."""
+    corners = asCorners(corners)
+    boxes = cornersToAABB(corners)
+    pairs = aabbPairs(boxes)
+    if sameLabel and labels is not None and len(pairs):
+        labels = np.asarray(labels, dtype=object)
+        pairs = pairs[labels[pairs[:, 0]] == labels[pairs[:, 1]]]
+    # The intersection is at most that of the bounding boxes and at most
+    # the smaller box, which bounds the IoU from above: only pairs that
+    # could reach threshold are clipped.
+    areas = polygonArea(corners)
+    first, second = boxes[pairs[:, 0]], boxes[pairs[:, 1]]
+    size = np.minimum(first[:, 2:], second[:, 2:]) - np.maximum(first[:, :2], second[:, :2])
+    a, b = areas[pairs[:, 0]], areas[pairs[:, 1]]
+    inter = np.minimum(size.prod(axis=1), np.minimum(a, b))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        pairs = pairs[inter >= threshold * (a + b - inter)]
+    iou = rotatedIoU(corners[pairs[:, 0]], corners[pairs[:, 1]])
+    hit = iou >= threshold
+    pairs, iou = pairs[hit], iou[hit]
+    order = np.lexsort((pairs[:, 1], pairs[:, 0]))
+    return [Overlap(int(i), int(j), float(v))
+            for (i, j), v in zip(pairs[order].tolist(), iou[order].tolist())]
+
+
+def annotationFiles(annDir):
+    return sorted(f for f in os.listdir(annDir) if f.endswith(XML_EXT))
+
+
+def datasetReport(annDir, out, threshold=NEAR_DUPLICATE_IOU, sameLabel=False, db=None):
+    """Write the overlaps of every annotation file in annDir as CSV rows
+    to the file object out, return (files read, files with overlaps,
+    overlaps). Files that can not be read are skipped with a warning.
+    With an AnnotationDb db its images are read instead of files."""
+    writer = csv.writer(out)
+    writer.writerow(['file', 'kind', 'iou', 'first', 'first label', 'second', 'second label'])
+    files = flagged = total = 0
+    for name in (annotationFiles(annDir) if db is None else db.keys()):
+        try:
+            if db is None:
+                shapes = PascalVocReader(os.path.join(annDir, name)).getShapes()
+            else:
+                shapes = db.load(name).getShapes()
+        except PascalVocError as e:
+            print('skipped %s' % e, file=sys.stderr)
+            continue
+        files += 1
+        if len(shapes) < 2:
+            continue
+        labels = [s[0] for s in shapes]
+        overlaps = findDuplicates([s[1] for s in shapes], labels, threshold, sameLabel)
+        if overlaps:
+            flagged += 1
+            total += len(overlaps)
+        for o in overlaps:
+            writer.writerow([name, o.kind, '%.4f' % o.iou,
+                             o.first, labels[o.first], o.second, labels[o.second]])
+    return files, flagged, total
+
+
+def main(argv=None):
+    argv = sys.argv[1:] if argv is None else argv
+    if not argv:
+        print(__doc__)
+        return 1
+    db = AnnotationDb(os.path.join(argv[0], ANNOTATION_DB)) if hasAnnotationDb(argv[0]) else None
+    if len(argv) > 1:
+        with open(argv[1], 'w', newline='') as out:
+            counts = datasetReport(argv[0], out, db=db)
+    else:
+        counts = datasetReport(argv[0], sys.stdout, db=db)
+    print('%d files, %d with overlapping boxes, %d overlaps' % counts, file=sys.stderr)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -6,7 +6,9 @@ import sys
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
-from .pascal_voc_io import PascalVocReader, XML_EXT
+from .pascal_voc_io import XML_EXT
+from .vocCache import readVocCached
+from .annotationDb import dbKey
 
 class CFileListModel(QStringListModel):
     def __init__(self, parent = None):
@@ -14,27 +16,34 @@ class CFileListModel(QStringListModel):
         
         self.dispList = []
     
-    def parseOne(self, s, openedDir = None, defaultSaveDir = None):
+    def xmlPathOf(self, s, openedDir = None, defaultSaveDir = None):
         if openedDir is not None and defaultSaveDir is not None:
             relname = os.path.relpath(s, openedDir)
             relname = os.path.splitext(relname)[0]
-            xmlPath = os.path.join(defaultSaveDir, relname + XML_EXT)
-        else:
-            xmlPath = os.path.splitext(s)[0] + XML_EXT
-        if os.path.exists(xmlPath) and os.path.isfile(xmlPath):
-            tVocParser = PascalVocReader(xmlPath)
-            shapes = tVocParser.getShapes()
-            info = [os.path.split(s)[1], len(shapes), False]
-        else:
-            info = [os.path.split(s)[1], None, False]
-        return info
-
-    def setStringList(self, strings, openedDir = None, defaultSaveDir = None):
-        self.dispList = []
-
-        for s in strings:
-            info = self.parseOne(s, openedDir, defaultSaveDir)
-            self.dispList.append(info)
+            return os.path.join(defaultSaveDir, relname + XML_EXT)
+        return os.path.splitext(s)[0] + XML_EXT
+
+    def setStringList(self, strings, openedDir = None, defaultSaveDir = None, db = None):
+        self.dispList = [[os.path.split(s)[1], None, False, None] for s in strings]
+
+        xmlPaths = [self.xmlPathOf(s, openedDir, defaultSaveDir) for s in strings]
+        if db is not None:
+            # The annotations are rows of the AnnotationDb db.
+            saveDir = os.path.dirname(db.path)
+            counts = db.boxCounts([dbKey(saveDir, os.path.abspath(p)) for p in xmlPaths])
+            for info, count in zip(self.dispList, counts):
+                info[1] = count
+            return super(CFileListModel, self).setStringList(strings)
+
+        # Read every annotation in one batch, only the box counts are kept.
+        found = [i for i, xmlPath in enumerate(xmlPaths) if os.path.isfile(xmlPath)]
+        batch = readVocCached([xmlPaths[i] for i in found])
+        for i, count in zip(found, batch.counts().tolist()):
+            self.dispList[i][1] = count
+        for j, e in batch.errors.items():
+            # Flagged rather than shown as unlabelled.
+            self.dispList[found[j]][1] = None
+            self.dispList[found[j]][3] = e
 
         return super(CFileListModel, self).setStringList(strings)
 
@@ -42,7 +51,9 @@ class CFileListModel(QStringListModel):
         item = self.dispList[index.row()]
         pathname, count = item[0], item[1]
         if role == Qt.DisplayRole:
-            if count is None:
+            if item[3] is not None:
+                res_str = '%s [!]' % (pathname,)
+            elif count is None:
                 res_str = '%s [0]' % (pathname,)
             else:
                 if count == 0:
@@ -51,12 +62,16 @@ class CFileListModel(QStringListModel):
                     res_str = '%s [%d]' % (pathname, count)
             return res_str
         elif role == Qt.ToolTipRole:
+            if item[3] is not None:
+                return Qt.convertFromPlainText(str(item[3]))
             return super(CFileListModel, self).data(index, Qt.EditRole)
         elif role == Qt.BackgroundRole:
             if item[1] is None: # or item[1] == 0:
                 brush = QBrush(Qt.transparent)
             else:
                 brush = QBrush(Qt.lightGray)
+            if item[3] is not None:
+                brush = QBrush(Qt.red)
             if item[2]:
                 brush = QBrush(Qt.green)
             return brush
@@ -73,6 +88,7 @@ class CFileListModel(QStringListModel):
                 info = self.dispList[index.row()]
                 info[1] = value
                 info[2] = True
+                info[3] = None
                 self.dispList[index.row()] = info
 
         return super(CFileListModel, self).setData(index, value, role)
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import os
+import time
+from collections import deque
+
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+
+# Set LABELIMG2_PROFILE=1 to start with the render profiler enabled.
+PROFILE_ENV = 'LABELIMG2_PROFILE'
+
+
+class FrameProfiler(object):
+    """Per-frame timing of Canvas.paintEvent, broken down by phase.
+
+    The canvas calls beginFrame() at the start of a paint and mark(phase)
+    after each phase. Its overlay paints right after it, so it calls
+    resume() to skip the time spent between the two widgets and
+    endFrame() once done. Input events call markInput() so the next frame
+    can report the delay between the mouse event and the paint that
+    shows it.
+    """
+
+    PHASES = ('image', 'shapes', 'overlays', 'crosshair', 'palette')
+
+    def __init__(self, window=60):
+        self.enabled = os.environ.get(PROFILE_ENV, '') not in ('', '0')
+        self.frameStamps = deque(maxlen=window)
+        self.frameTimes = deque(maxlen=window)
+        self.phaseTimes = dict.fromkeys(self.PHASES, 0.0)
+        self.drawn = 0
+        self.culled = 0
+        self.latency = None
+        self._inputStamp = None
+        self._frameStart = None
+        self._phaseStart = None
+
+    def setEnabled(self, enabled):
+        self.enabled = enabled
+        self.frameStamps.clear()
+        self.frameTimes.clear()
+        self._inputStamp = None
+        self.latency = None
+
+    def markInput(self):
+        # Keep the oldest pending event: latency is measured from the
+        # first input the user is still waiting to see.
+        if self.enabled and self._inputStamp is None:
+            self._inputStamp = time.perf_counter()
+
+    def beginFrame(self):
+        now = time.perf_counter()
+        self._frameStart = self._phaseStart = now
+        for phase in self.PHASES:
+            self.phaseTimes[phase] = 0.0
+
+    def resume(self):
+        self._phaseStart = time.perf_counter()
+
+    def mark(self, phase):
+        now = time.perf_counter()
+        self.phaseTimes[phase] += now - self._phaseStart
+        self._phaseStart = now
+
+    def count(self, drawn, culled):
+        self.drawn = drawn
+        self.culled = culled
+
+    def endFrame(self):
+        if self._frameStart is None:
+            return
+        now = time.perf_counter()
+        self.frameTimes.append(now - self._frameStart)
+        self.frameStamps.append(now)
+        if self._inputStamp is not None:
+            self.latency = now - self._inputStamp
+            self._inputStamp = None
+        self._frameStart = None
+
+    def fps(self):
+        if len(self.frameStamps) < 2:
+            return 0.0
+        span = self.frameStamps[-1] - self.frameStamps[0]
+        if span <= 0:
+            return 0.0
+        return (len(self.frameStamps) - 1) / span
+
+    def summary(self):
+        ms = lambda t: t * 1000.0
+        frame = self.frameTimes[-1] if self.frameTimes else 0.0
+        lines = ['fps %.1f' % self.fps(),
+                 'frame %.2fms' % ms(frame)]
+        lines += ['%s %.2fms' % (phase, ms(self.phaseTimes[phase]))
+                  for phase in self.PHASES]
+        lines.append('shapes %d drawn / %d culled' % (self.drawn, self.culled))
+        if self.latency is not None:
+            lines.append('input->paint %.2fms' % ms(self.latency))
+        return lines
+
+    def paint(self, painter, origin):
+        """Draw the HUD in widget coordinates with its top-left at origin."""
+        lines = self.summary()
+        font = QFont('monospace')
+        font.setStyleHint(QFont.TypeWriter)
+        font.setPointSize(9)
+        metrics = QFontMetrics(font)
+        lineHeight = metrics.height()
+        width = max(metrics.width(l) for l in lines) + 12
+        height = lineHeight * len(lines) + 8
+        rect = QRect(origin.x() + 4, origin.y() + 4, width, height)
+
+        painter.save()
+        painter.resetTransform()
+        painter.setCompositionMode(QPainter.CompositionMode_SourceOver)
+        painter.fillRect(rect, QColor(0, 0, 0, 170))
+        painter.setFont(font)
+        painter.setPen(QColor(255, 255, 255))
+        y = rect.y() + 4 + metrics.ascent()
+        for l in lines:
+            painter.drawText(rect.x() + 6, y, l)
+            y += lineHeight
+        painter.restore()
+        return rect
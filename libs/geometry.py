@@ -0,0 +1,224 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import numpy as np
+
+# Batched box conversions. Corners are (M, 4, 2) arrays ordered as
+# Shape.points: p0 top-left, p1 top-right, p2 bottom-right, p3
+# bottom-left before rotation. Rotated boxes are (M, 5) arrays of
+# cx, cy, w, h, angle, with angle in radians as stored in robndbox.
+
+TWO_PI = 2 * np.pi
+
+
+def asCorners(points):
+    """points as a float (M, 4, 2) array."""
+    return np.asarray(points, dtype=float).reshape(-1, 4, 2)
+
+
+def rotatePoints(points, centers, theta):
+    """Rotate (M, K, 2) points about (M, 2) centers by theta, a scalar
+    or one angle per box, the same way as Shape.rotatePoint."""
+    points = np.asarray(points, dtype=float)
+    centers = np.asarray(centers, dtype=float)[:, None, :]
+    theta = np.asarray(theta, dtype=float)
+    if theta.ndim:
+        theta = theta[:, None]
+    offset = points - centers
+    c, s = np.cos(theta), np.sin(theta)
+    x = c * offset[..., 0] + s * offset[..., 1]
+    y = -s * offset[..., 0] + c * offset[..., 1]
+    return centers + np.stack([x, y], axis=-1)
+
+
+def pointInRects(corners, x, y):
+    """Whether (x, y) lies inside each of (M, 4, 2) rectangles, rotated
+    or not, edges included. The point is projected on the p0-p1 and
+    p0-p3 edges, so no path is built."""
+    corners = asCorners(corners)
+    origin = corners[:, 0]
+    u = corners[:, 1] - origin
+    v = corners[:, 3] - origin
+    d = np.array([x, y], dtype=float) - origin
+    du = (d * u).sum(axis=1)
+    dv = (d * v).sum(axis=1)
+    return (du >= 0) & (du <= (u * u).sum(axis=1)) & (dv >= 0) & (dv <= (v * v).sum(axis=1))
+
+
+def vertexWithin(points, x, y, epsilon):
+    """Index of the first of each row of (M, K, 2) points that lies
+    within epsilon of (x, y), -1 where there is none."""
+    points = np.asarray(points, dtype=float)
+    near = ((points - [x, y]) ** 2).sum(axis=-1) <= epsilon * epsilon
+    if not near.shape[1]:
+        return np.full(len(near), -1)
+    return np.where(near.any(axis=1), near.argmax(axis=1), -1)
+
+
+def cornersToAABB(corners):
+    """(M, 4) array of xmin, ymin, xmax, ymax."""
+    corners = asCorners(corners)
+    return np.concatenate([corners.min(axis=1), corners.max(axis=1)], axis=1)
+
+
+def cornersToBndBox(corners):
+    """Integer VOC bndboxes, as LabelFile.convertPoints2BndBox: the
+    minimum is clamped to 1 and every value truncated."""
+    boxes = cornersToAABB(corners)
+    boxes[:, :2] = np.maximum(boxes[:, :2], 1)
+    return boxes.astype(np.int64)
+
+
+def cornersToRotated(corners, directions, centers=None):
+    """(M, 5) array of cx, cy, w, h, angle. w is the p0-p1 edge, h the
+    p1-p2 edge; centers default to the midpoint of p0 and p2."""
+    corners = asCorners(corners)
+    if centers is None:
+        centers = (corners[:, 0] + corners[:, 2]) / 2
+    centers = np.asarray(centers, dtype=float).reshape(-1, 2)
+    w = np.sqrt(((corners[:, 0] - corners[:, 1]) ** 2).sum(axis=1))
+    h = np.sqrt(((corners[:, 2] - corners[:, 1]) ** 2).sum(axis=1))
+    angle = np.mod(directions, TWO_PI)
+    return np.column_stack([centers, w, h, angle])
+
+
+def rotatedToCorners(boxes):
+    """Corners of (M, 5) cx, cy, w, h, angle boxes, as read back from
+    robndbox."""
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 5)
+    cx, cy, w, h, angle = boxes.T
+    x0, x1 = cx - w / 2, cx + w / 2
+    y0, y1 = cy - h / 2, cy + h / 2
+    corners = np.stack([np.column_stack([x0, y0]), np.column_stack([x1, y0]),
+                        np.column_stack([x1, y1]), np.column_stack([x0, y1])], axis=1)
+    return rotatePoints(corners, boxes[:, :2], -angle)
+
+
+def aabbToYolo(boxes, width, height):
+    """Normalised YOLO cx, cy, w, h from (M, 4) xmin, ymin, xmax, ymax."""
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    dw = 1. / width
+    dh = 1. / height
+    xmin, ymin, xmax, ymax = boxes.T
+    return np.column_stack([(xmin + xmax) / 2.0 * dw, (ymin + ymax) / 2.0 * dh,
+                            (xmax - xmin) * dw, (ymax - ymin) * dh])
+
+
+def cornersToObb(corners, width, height):
+    """(M, 8) corners normalised by the image size, YOLO OBB order."""
+    corners = asCorners(corners)
+    return (corners * [1. / width, 1. / height]).reshape(-1, 8)
+
+
+def polygonArea(points, counts=None):
+    """Area of each of (M, K, 2) polygons whose first counts[i] points
+    are set, all K when counts is None."""
+    points = np.asarray(points, dtype=float)
+    k = points.shape[1]
+    if counts is None:
+        nxt = np.broadcast_to((np.arange(k) + 1) % k, points.shape[:2])
+    else:
+        idx = np.arange(k)
+        counts = np.asarray(counts)[:, None]
+        nxt = np.where(idx + 1 < counts, idx + 1, 0)
+        points = np.where((idx < counts)[..., None], points, 0)
+    following = np.take_along_axis(points, nxt[..., None], axis=1)
+    cross = points[..., 0] * following[..., 1] - following[..., 0] * points[..., 1]
+    return np.abs(cross.sum(axis=1)) / 2
+
+
+def _cross(u, v):
+    return u[..., 0] * v[..., 1] - u[..., 1] * v[..., 0]
+
+
+# Two convex quadrilaterals intersect in at most eight vertices; the
+# slack absorbs points repeated when a corner lies on a clip edge.
+_CLIP_WIDTH = 16
+
+
+def clipConvex(subject, clip):
+    """Sutherland-Hodgman clipping of (M, 4, 2) convex quads subject by
+    the convex quads clip, all pairs at once.
+
+    Returns the (M, K, 2) vertices of each intersection and how many of
+    them are set.
+    """
+    subject = asCorners(subject)
+    clip = asCorners(clip)
+    m = len(subject)
+    poly = subject
+    counts = np.full(m, 4)
+    # Whichever way a clip quad winds, inside is on the same side of
+    # all of its edges as its second corner is of the first edge.
+    orient = np.sign(_cross(clip[:, 1] - clip[:, 0], clip[:, 2] - clip[:, 0]))
+    orient[orient == 0] = 1
+    rows = np.arange(m)[:, None]
+    for e in range(4):
+        a = clip[:, e][:, None]
+        edge = clip[:, (e + 1) % 4][:, None] - a
+        k = poly.shape[1]
+        idx = np.arange(k)
+        valid = idx < counts[:, None]
+        nxt = np.where(idx + 1 < counts[:, None], idx + 1, 0)
+        following = poly[rows, nxt]
+        s0 = _cross(edge, poly - a) * orient[:, None]
+        s1 = _cross(edge, following - a) * orient[:, None]
+        inside0 = s0 >= 0
+        crossing = valid & (inside0 != (s1 >= 0))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = np.where(crossing, s0 / (s0 - s1), 0)
+        between = poly + t[..., None] * (following - poly)
+        # Vertex i, then where edge i crosses the clip line, if at all.
+        candidates = np.stack([poly, between], axis=2).reshape(m, 2 * k, 2)
+        keep = np.stack([valid & inside0, crossing], axis=2).reshape(m, 2 * k)
+        order = np.argsort(~keep, axis=1, kind='stable')[:, :_CLIP_WIDTH]
+        poly = candidates[rows, order]
+        counts = np.minimum(keep.sum(axis=1), _CLIP_WIDTH)
+    return poly, counts
+
+
+def rotatedIoU(a, b):
+    """Intersection over union of the (M, 4, 2) boxes a[i] and b[i]."""
+    a = asCorners(a)
+    b = asCorners(b)
+    if not len(a):
+        return np.zeros(0)
+    inter = polygonArea(*clipConvex(a, b))
+    union = polygonArea(a) + polygonArea(b) - inter
+    with np.errstate(divide='ignore', invalid='ignore'):
+        return np.where(union > 0, inter / union, 0.)
+
+
+def aabbPairs(boxes, chunk=1 << 20):
+    """Index pairs (i, j), i < j, of the (M, 4) xmin, ymin, xmax, ymax
+    boxes that overlap.
+
+    Sweep and prune: the boxes are sorted by xmin, so the ones that can
+    overlap box i on x follow it up to the first xmin beyond its xmax;
+    those are checked on y. Pairs are generated chunk at a time.
+    """
+    boxes = np.asarray(boxes, dtype=float).reshape(-1, 4)
+    order = np.argsort(boxes[:, 0], kind='stable')
+    ordered = boxes[order]
+    ends = np.searchsorted(ordered[:, 0], ordered[:, 2], side='right')
+    # How many boxes after each one overlap it on x.
+    spans = np.maximum(ends - np.arange(len(boxes)) - 1, 0)
+    total = np.cumsum(spans)
+    firsts, seconds = [], []
+    start = 0
+    while start < len(boxes):
+        done = total[start - 1] if start else 0
+        stop = max(int(np.searchsorted(total, done + chunk, side='right')), start + 1)
+        counts = spans[start:stop]
+        i = np.repeat(np.arange(start, stop), counts)
+        # j runs over i + 1 ... i + spans[i] for each i.
+        j = i + 1 + np.arange(len(i)) - np.repeat(np.cumsum(counts) - counts, counts)
+        hit = (ordered[j, 1] <= ordered[i, 3]) & (ordered[i, 1] <= ordered[j, 3])
+        firsts.append(order[i[hit]])
+        seconds.append(order[j[hit]])
+        start = stop
+    if not firsts:
+        return np.zeros((0, 2), dtype=np.int64)
+    pairs = np.column_stack([np.concatenate(firsts), np.concatenate(seconds)])
+    pairs.sort(axis=1)
+    return pairs
@@ -8,9 +8,10 @@ from PyQt5.QtGui import QImageReader
 from base64 import b64encode, b64decode
 from .pascal_voc_io import PascalVocWriter
 from .pascal_voc_io import XML_EXT
+from .annotationWriter import atomicWrite
+from . import geometry
 import os
 import sys
-import math
 
 class LabelFileError(Exception):
     pass
@@ -29,6 +30,14 @@ class LabelFile(object):
 
     def savePascalVocFormat(self, filename, shapes, imagePath, imageData,
                             lineColor=None, fillColor=None, databaseSrc=None):
+        writer = self.pascalVocWriter(shapes, imagePath)
+        atomicWrite(filename, writer.write)
+
+    def pascalVocWriter(self, shapes, imagePath, imageShape=None):
+        """A PascalVocWriter holding shapes, ready to be saved. It only
+        refers to plain values, so it may be written from another thread
+        while the shapes change. imageShape is [height, width, depth];
+        when it is not given the image is read to find it."""
         imgFolderPath = os.path.dirname(imagePath)
         imgFolderName = os.path.split(imgFolderPath)[-1]
         imgFileName = os.path.basename(imagePath)
@@ -36,37 +45,41 @@ class LabelFile(object):
         # Read from file path because self.imageData might be empty if saving to
         # Pascal format
 
-        reader0 = QImageReader(imagePath)
-        reader0.setAutoTransform(True)
+        if imageShape is None:
+            reader0 = QImageReader(imagePath)
+            reader0.setAutoTransform(True)
 
-        image = reader0.read()
-        
-        imageShape = [image.height(), image.width(),
-                      1 if image.isGrayscale() else 3]
+            image = reader0.read()
+
+            imageShape = [image.height(), image.width(),
+                          1 if image.isGrayscale() else 3]
         
         writer = PascalVocWriter(imgFolderName, imgFileName,
                                  imageShape, localImgPath=imagePath)
         writer.verified = self.verified
 
-        for shape in shapes:
-            points = shape['points']
+        # Convert every box in one go, then add them in the original order.
+        corners = geometry.asCorners([shape['points'] for shape in shapes])
+        bndboxes = geometry.cornersToBndBox(corners).tolist()
+        robndboxes = geometry.cornersToRotated(
+            corners, [shape['direction'] for shape in shapes],
+            [LabelFile.centerOf(shape) for shape in shapes]).tolist()
+
+        for shape, bndbox, robndbox in zip(shapes, bndboxes, robndboxes):
             label = shape['label']
             # Add Chris
             difficult = int(shape['difficult'])
-            direction = shape['direction']
             isRotated = shape['isRotated']
             extra_text = shape['extra_text']
             if not isRotated:
-                bndbox = LabelFile.convertPoints2BndBox(points)
                 writer.addBndBox(bndbox[0], bndbox[1], bndbox[2], 
                     bndbox[3], label, difficult, extra_text)
             else: #if shape is rotated box, save as rotated bounding box
-                robndbox = LabelFile.convertPoints2RotatedBndBox(shape)
+                robndbox = LabelFile.roundRotatedBndBox(robndbox)
                 writer.addRotatedBndBox(robndbox[0],robndbox[1],
                     robndbox[2],robndbox[3],robndbox[4],label,difficult, extra_text)
 
-        writer.save(targetFile=filename)
-        return
+        return writer
 
     def toggleVerify(self):
         self.verified = not self.verified
@@ -107,44 +120,26 @@ class LabelFile(object):
 
     @staticmethod
     def convertPoints2BndBox(points):
-        xmin = float('inf')
-        ymin = float('inf')
-        xmax = float('-inf')
-        ymax = float('-inf')
-        for p in points:
-            x = p[0]
-            y = p[1]
-            xmin = min(x, xmin)
-            ymin = min(y, ymin)
-            xmax = max(x, xmax)
-            ymax = max(y, ymax)
-
         # Martin Kersner, 2015/11/12
         # 0-valued coordinates of BB caused an error while
-        # training faster-rcnn object detector.
-        if xmin < 1:
-            xmin = 1
-
-        if ymin < 1:
-            ymin = 1
-
-        return (int(xmin), int(ymin), int(xmax), int(ymax))
+        # training faster-rcnn object detector, so the minimum is 1.
+        return tuple(geometry.cornersToBndBox([points])[0].tolist())
 
     @staticmethod
-    def convertPoints2RotatedBndBox(shape):
-        points = shape['points']
+    def centerOf(shape):
         center = shape['center']
-        direction = shape['direction']
-
-        cx = center.x()
-        cy = center.y()
-        
-        w = math.sqrt((points[0][0]-points[1][0]) ** 2 +
-            (points[0][1]-points[1][1]) ** 2)
-
-        h = math.sqrt((points[2][0]-points[1][0]) ** 2 +
-            (points[2][1]-points[1][1]) ** 2)
+        if center is None:
+            points = shape['points']
+            return ((points[0][0] + points[2][0]) / 2, (points[0][1] + points[2][1]) / 2)
+        return (center.x(), center.y())
 
-        angle = direction % (2*math.pi)
+    @staticmethod
+    def roundRotatedBndBox(robndbox):
+        cx, cy, w, h, angle = robndbox
+        return (round(cx,4),round(cy,4),round(w,4),round(h,4),round(angle,6))
 
-        return (round(cx,4),round(cy,4),round(w,4),round(h,4),round(angle,6))
\ No newline at end of file
+    @staticmethod
+    def convertPoints2RotatedBndBox(shape):
+        robndbox = geometry.cornersToRotated([shape['points']], [shape['direction']],
+                                             [LabelFile.centerOf(shape)])
+        return LabelFile.roundRotatedBndBox(robndbox[0].tolist())
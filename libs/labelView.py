@@ -6,12 +6,139 @@ from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 from PyQt5.QtWidgets import *
 
-class HashableQStandardItem(QStandardItem):
-    def __init__(self, text):
-        super(HashableQStandardItem, self).__init__(text)
+from .lib import generateColorByText, newIcon
 
-    def __hash__(self):
-        return hash(id(self))
+
+def rowRanges(rows):
+    """Sorted row numbers as a list of (first, last) runs."""
+    ranges = []
+    for row in rows:
+        if ranges and ranges[-1][1] == row - 1:
+            ranges[-1][1] = row
+        else:
+            ranges.append([row, row])
+    return [tuple(r) for r in ranges]
+
+
+class CLabelModel(QAbstractTableModel):
+    """Label and extra text of the shapes of an image, one row per shape.
+
+    The model keeps only a list of the shapes and reads everything else
+    from them, so a row costs no Qt objects. Edits are not applied here:
+    setData emits labelEdited(shape, column, value) for the owner to
+    apply, who then calls refresh() for the rows it changed.
+
+    Rows can be flagged with a note, e.g. by the duplicate finder; they
+    get a warning icon and the note as tooltip until the next setFlags.
+    """
+
+    labelEdited = pyqtSignal(object, int, object)
+
+    HEADERS = ["Label", "Extra Info"]
+
+    def __init__(self, palette=None, parent=None):
+        super(CLabelModel, self).__init__(parent)
+        self.palette = palette
+        self.shapes = []
+        self.notes = {}
+        self._flagIcon = None
+        self._rowOf = None
+
+    def rowCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.shapes)
+
+    def columnCount(self, parent=QModelIndex()):
+        return 0 if parent.isValid() else len(self.HEADERS)
+
+    def data(self, index, role=Qt.DisplayRole):
+        if not index.isValid():
+            return None
+        shape = self.shapes[index.row()]
+        if role in (Qt.DisplayRole, Qt.EditRole):
+            return shape.label if index.column() == 0 else shape.extra_label
+        if role == Qt.BackgroundRole:
+            if self.palette is not None:
+                return self.palette.brush(shape.label)
+            return QBrush(generateColorByText(shape.label))
+        if role == Qt.ToolTipRole:
+            return self.notes.get(shape)
+        if role == Qt.DecorationRole and index.column() == 0 and shape in self.notes:
+            if self._flagIcon is None:
+                self._flagIcon = newIcon('warning.svg')
+            return self._flagIcon
+        return None
+
+    def setData(self, index, value, role=Qt.EditRole):
+        if not index.isValid() or role != Qt.EditRole:
+            return False
+        self.labelEdited.emit(self.shapes[index.row()], index.column(), value)
+        return True
+
+    def headerData(self, section, orientation, role=Qt.DisplayRole):
+        if orientation == Qt.Horizontal and role == Qt.DisplayRole:
+            return self.HEADERS[section]
+        return super(CLabelModel, self).headerData(section, orientation, role)
+
+    def flags(self, index):
+        if not index.isValid():
+            return Qt.NoItemFlags
+        return Qt.ItemIsEnabled | Qt.ItemIsSelectable | Qt.ItemIsEditable
+
+    def shape(self, row):
+        return self.shapes[row] if 0 <= row < len(self.shapes) else None
+
+    def row(self, shape):
+        """Row of shape, -1 if it has none."""
+        if self._rowOf is None:
+            self._rowOf = dict((s, i) for i, s in enumerate(self.shapes))
+        return self._rowOf.get(shape, -1)
+
+    def rows(self, shapes):
+        """Sorted rows of those of shapes that have one."""
+        return sorted(set(r for r in (self.row(s) for s in shapes) if r >= 0))
+
+    def appendShapes(self, shapes):
+        if not shapes:
+            return
+        start = len(self.shapes)
+        self.beginInsertRows(QModelIndex(), start, start + len(shapes) - 1)
+        self.shapes.extend(shapes)
+        if self._rowOf is not None:
+            self._rowOf.update((s, start + i) for i, s in enumerate(shapes))
+        self.endInsertRows()
+
+    def removeShapes(self, shapes):
+        """Remove the rows of shapes, one contiguous run at a time."""
+        for shape in shapes:
+            self.notes.pop(shape, None)
+        for first, last in reversed(rowRanges(self.rows(shapes))):
+            self.beginRemoveRows(QModelIndex(), first, last)
+            del self.shapes[first:last + 1]
+            self._rowOf = None
+            self.endRemoveRows()
+
+    def clear(self):
+        self.beginResetModel()
+        self.shapes = []
+        self.notes = {}
+        self._rowOf = None
+        self.endResetModel()
+
+    def setFlags(self, flags):
+        """Flag the shapes in {shape: note}, unflag all others."""
+        changed = list(self.notes) + list(flags)
+        self.notes = dict(flags)
+        last = self.columnCount() - 1
+        for first, end in rowRanges(self.rows(changed)):
+            self.dataChanged.emit(self.index(first, 0), self.index(end, last),
+                                  [Qt.DecorationRole, Qt.ToolTipRole])
+
+    def refresh(self, shapes):
+        """Tell the views that the rows of shapes changed."""
+        last = self.columnCount() - 1
+        for first, end in rowRanges(self.rows(shapes)):
+            self.dataChanged.emit(self.index(first, 0), self.index(end, last),
+                                  [Qt.DisplayRole, Qt.EditRole, Qt.BackgroundRole])
 
 
 class CComboBoxDelegate(QStyledItemDelegate):
@@ -96,13 +223,17 @@ class CHeaderView(QHeaderView):
         self.isChecked = []
 
     def rowsInserted(self, parent, start, end):
-        self.isChecked.insert(start, 1)
+        self.isChecked[start:start] = [1] * (end - start + 1)
         return super(CHeaderView, self).rowsInserted(parent, start, end)
 
     def rowsAboutToBeRemoved(self, parent, start, end):
-        del self.isChecked[start]
+        del self.isChecked[start:end + 1]
         return super(CHeaderView, self).rowsAboutToBeRemoved(parent, start, end)
 
+    def reset(self):
+        self.isChecked = [1] * (self.model().rowCount() if self.model() else 0)
+        return super(CHeaderView, self).reset()
+
     def paintSection(self, painter, rect, logicalIndex):
         self._y_offset = int((rect.height()-self._width)/2.)
         
@@ -142,7 +273,7 @@ class CHeaderView(QHeaderView):
 class CLabelView(QTableView):
     extraEditing = pyqtSignal(QModelIndex, str)
     toggleEdit = pyqtSignal(bool)
-    def __init__(self, labelHist, parent = None):
+    def __init__(self, labelHist, palette=None, parent = None):
         super(CLabelView, self).__init__(parent)
         
         header = CHeaderView(Qt.Vertical, self)
@@ -156,9 +287,7 @@ class CLabelView(QTableView):
         self.setSelectionBehavior(QAbstractItemView.SelectRows)
         self.setStyleSheet("selection-background-color: rgb(0,90,140)")
 
-        model = QStandardItemModel(self)
-        model.setColumnCount(2)
-        model.setHorizontalHeaderLabels(["Label", "Extra Info"])
+        model = CLabelModel(palette, self)
 
         self.setModel(model)
         
@@ -67,6 +67,37 @@ def distance(p):
     return sqrt(p.x() * p.x() + p.y() * p.y())
 
 
+class LabelHist(list):
+    """Class names in the order first seen, without duplicates.
+
+    A list, so it can be handed to Qt as is, with an index beside it for
+    constant time membership tests. Grow it with append, extend or add.
+    """
+
+    def __init__(self, labels=()):
+        super(LabelHist, self).__init__()
+        self._index = set()
+        self.extend(labels)
+
+    def __contains__(self, label):
+        return label in self._index
+
+    def append(self, label):
+        self.add(label)
+
+    def add(self, label):
+        """Append label unless present, return whether it was new."""
+        if label in self._index:
+            return False
+        self._index.add(label)
+        super(LabelHist, self).append(label)
+        return True
+
+    def extend(self, labels):
+        """Append the new labels, return how many there were."""
+        return sum(self.add(label) for label in labels)
+
+
 def fmtShortcut(text):
     mod, key = text.split('+', 1)
     return '<b>%s</b>+<b>%s</b>' % (mod, key)
@@ -0,0 +1,124 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import numpy as np
+
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+
+
+class Loupe(QWidget):
+    """Magnified inset of the image around the cursor.
+
+    The inset is an opaque child of the canvas, so redrawing it never
+    repaints the canvas below. It samples a cached crop of the source
+    pixmap, three windows wide, and only crops again once the cursor
+    leaves it.
+    """
+
+    SIZE = 160
+    MARGIN = 8
+
+    def __init__(self, canvas):
+        super(Loupe, self).__init__(canvas)
+        self.canvas = canvas
+        self.setAttribute(Qt.WA_OpaquePaintEvent)
+        self.setAttribute(Qt.WA_TransparentForMouseEvents)
+        self.setFocusPolicy(Qt.NoFocus)
+        self.resize(self.SIZE, self.SIZE)
+        self.center = QPointF()
+        self.crop = None
+        self.cropRect = QRect()
+        self.hide()
+
+    def invalidate(self):
+        self.crop = None
+        self.cropRect = QRect()
+
+    def zoom(self):
+        """Screen pixels per image pixel inside the loupe."""
+        return max(2.0, 4.0 * self.canvas.scale)
+
+    def sourceWindow(self):
+        half = self.SIZE / (2.0 * self.zoom())
+        return QRectF(self.center.x() - half, self.center.y() - half, 2 * half, 2 * half)
+
+    def moveTo(self, pos):
+        """Centre the loupe on pos, given in image coordinates."""
+        if not self.isVisible() or not self.canvas.pixmap or self.canvas.pixmap.isNull():
+            return
+        self.center = QPointF(pos)
+        window = self.sourceWindow().toAlignedRect()
+        if self.crop is None or not self.cropRect.contains(window):
+            w, h = window.width(), window.height()
+            self.cropRect = window.adjusted(-w, -h, w, h)
+            self.crop = self.canvas.pixmap.copy(self.cropRect)
+        self.place()
+        self.update()
+
+    def place(self):
+        """Keep the loupe in a top corner of the visible canvas area, away
+        from the cursor."""
+        visible = self.canvas.visibleRegion().boundingRect()
+        cursor = self.canvas.imageToWidget(self.center).toPoint()
+        topLeft = QPoint(visible.left() + self.MARGIN, visible.top() + self.MARGIN)
+        if QRect(topLeft, self.size()).adjusted(-self.MARGIN, -self.MARGIN,
+                                                self.MARGIN, self.MARGIN).contains(cursor):
+            topLeft.setX(visible.right() - self.MARGIN - self.width())
+        if topLeft != self.pos():
+            self.move(topLeft)
+
+    @staticmethod
+    def shapesIn(store, window):
+        """Shapes of store with two corners or more whose bounding box
+        meets window, in paint order."""
+        n = store.size
+        xs = store.points[:n, :, 0]
+        # Narrowed on x corner by corner first, as hitCandidates does;
+        # unset corners are 0 and can only widen the box.
+        near = store.alive[:n] & \
+            (np.minimum(np.minimum(xs[:, 0], xs[:, 1]), np.minimum(xs[:, 2], xs[:, 3])) <= window.right()) & \
+            (np.maximum(np.maximum(xs[:, 0], xs[:, 1]), np.maximum(xs[:, 2], xs[:, 3])) >= window.left())
+        rows = np.flatnonzero(near)
+        boxes = store.boundingBoxes(rows)
+        keep = (store.npoints[rows] >= 2) & \
+               (boxes[:, 0] <= window.right()) & (boxes[:, 2] >= window.left()) & \
+               (boxes[:, 1] <= window.bottom()) & (boxes[:, 3] >= window.top())
+        return [store.views[row] for row in rows[keep].tolist()]
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.fillRect(self.rect(), QColor(0, 0, 0))
+        if self.crop is not None:
+            zoom = self.zoom()
+            window = self.sourceWindow()
+            p.save()
+            p.scale(zoom, zoom)
+            p.translate(-window.topLeft())
+            p.drawPixmap(self.cropRect.topLeft(), self.crop)
+
+            canvas = self.canvas
+            shapes = [s for s in self.shapesIn(canvas.store, window) if canvas.isVisible(s)]
+            if canvas.current is not None:
+                # Being drawn, each in a private store.
+                for shape in (canvas.current, canvas.line):
+                    shapes += self.shapesIn(shape.store, window)
+            for shape in shapes:
+                pen = QPen(shape.line_color)
+                pen.setCosmetic(True)
+                p.setPen(pen)
+                p.setBrush(Qt.NoBrush)
+                if shape.isClosed():
+                    p.drawPolygon(QPolygonF(list(shape.points)))
+                else:
+                    p.drawPolyline(QPolygonF(list(shape.points)))
+            p.restore()
+
+        c = self.SIZE // 2
+        p.setPen(QColor(255, 255, 255, 160))
+        p.drawLine(c, 0, c, self.SIZE)
+        p.drawLine(0, c, self.SIZE, c)
+        p.setPen(QColor(0, 0, 0))
+        p.drawRect(self.rect().adjusted(0, 0, -1, -1))
+        p.end()
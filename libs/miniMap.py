@@ -0,0 +1,154 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import numpy as np
+
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+from PyQt5.QtWidgets import *
+
+from .mipmap import MIN_LEVEL_SIZE
+
+
+class CMiniMap(QWidget):
+    """Overview of the whole image with the visible part of the canvas
+    outlined and a heat map of where the shapes are.
+
+    The thumbnail is the canvas' coarsest mipmap level, scaled once per
+    widget size, so painting the overview never touches the full
+    resolution pixmap. Click or drag to scroll the canvas there.
+    """
+
+    GRID = 32
+
+    def __init__(self, canvas, scrollArea, parent=None):
+        super(CMiniMap, self).__init__(parent)
+        self.canvas = canvas
+        self.scrollArea = scrollArea
+        self.setMinimumSize(120, 90)
+        self.setCursor(Qt.PointingHandCursor)
+
+        self._thumb = None
+        self._density = None
+
+        canvas.mipmaps.levelAdded.connect(self.thumbnailChanged)
+        for bar in (scrollArea.horizontalScrollBar(), scrollArea.verticalScrollBar()):
+            bar.valueChanged.connect(self.update)
+            bar.rangeChanged.connect(self.update)
+
+    def sizeHint(self):
+        return QSize(200, 150)
+
+    def reset(self):
+        """Forget the thumbnail and density of the previous image."""
+        self._thumb = None
+        self._density = None
+        self.update()
+
+    def thumbnailChanged(self):
+        self._thumb = None
+        self.update()
+
+    def shapesChanged(self):
+        self._density = None
+        self.update()
+
+    def imageRect(self):
+        """Where the image is drawn in this widget, None without an image."""
+        pixmap = self.canvas.pixmap
+        if not pixmap or pixmap.isNull():
+            return None
+        size = QSizeF(pixmap.size()).scaled(QSizeF(self.size()), Qt.KeepAspectRatio)
+        return QRectF(QPointF((self.width() - size.width()) / 2,
+                              (self.height() - size.height()) / 2), size)
+
+    def thumbnail(self, target):
+        if self._thumb is None or self._thumb.size() != target.size():
+            source = self.canvas.mipmaps.thumbnail()
+            if source is None:
+                if max(self.canvas.pixmap.width(), self.canvas.pixmap.height()) > MIN_LEVEL_SIZE:
+                    # Wait for the background build rather than scaling
+                    # the full image on the GUI thread.
+                    self.canvas.mipmaps.build()
+                    return None
+                source = self.canvas.pixmap
+            self._thumb = source.scaled(target.size(), Qt.IgnoreAspectRatio,
+                                        Qt.SmoothTransformation)
+        return self._thumb
+
+    def density(self):
+        """Shape centres binned on a GRID x GRID raster of the image,
+        indexed [x, y]."""
+        if self._density is None:
+            pixmap = self.canvas.pixmap
+            w, h = float(pixmap.width()), float(pixmap.height())
+            store = self.canvas.store
+            centers = store.centers[store.rows()]
+            centers = centers[~np.isnan(centers).any(axis=1)]
+            # Centres off the image count in the border cells.
+            x = np.clip(centers[:, 0], 0, w)
+            y = np.clip(centers[:, 1], 0, h)
+            self._density, _, _ = np.histogram2d(x, y, bins=self.GRID, range=[[0, w], [0, h]])
+        return self._density
+
+    def viewportRect(self):
+        """The visible part of the canvas, in image coordinates."""
+        viewport = self.scrollArea.viewport()
+        x = self.scrollArea.horizontalScrollBar().value()
+        y = self.scrollArea.verticalScrollBar().value()
+        topLeft = self.canvas.transformPos(QPointF(x, y))
+        bottomRight = self.canvas.transformPos(QPointF(x + viewport.width(), y + viewport.height()))
+        return QRectF(topLeft, bottomRight)
+
+    def paintEvent(self, event):
+        p = QPainter(self)
+        p.fillRect(self.rect(), self.palette().color(QPalette.Window))
+        target = self.imageRect()
+        if target is None or target.isEmpty():
+            return
+
+        thumb = self.thumbnail(target.toRect())
+        if thumb is None:
+            p.fillRect(target, QColor(0, 0, 0))
+        else:
+            p.drawPixmap(target.topLeft(), thumb)
+
+        cells = self.density()
+        most = cells.max()
+        if most:
+            cw = target.width() / self.GRID
+            ch = target.height() / self.GRID
+            for cx, cy in zip(*np.nonzero(cells)):
+                n = cells[cx, cy]
+                p.fillRect(QRectF(target.x() + cx * cw, target.y() + cy * ch, cw, ch),
+                           QColor(255, 0, 0, int(40 + 160 * n / most)))
+
+        pixmap = self.canvas.pixmap
+        sx = target.width() / pixmap.width()
+        sy = target.height() / pixmap.height()
+        view = self.viewportRect().intersected(QRectF(pixmap.rect()))
+        p.setPen(QPen(QColor(255, 255, 0), 2))
+        p.setBrush(Qt.NoBrush)
+        p.drawRect(QRectF(target.x() + view.x() * sx, target.y() + view.y() * sy,
+                          view.width() * sx, view.height() * sy))
+        p.end()
+
+    def centerOn(self, pos):
+        target = self.imageRect()
+        if target is None or target.isEmpty():
+            return
+        pixmap = self.canvas.pixmap
+        imagePos = QPointF((pos.x() - target.x()) * pixmap.width() / target.width(),
+                           (pos.y() - target.y()) * pixmap.height() / target.height())
+        widgetPos = self.canvas.imageToWidget(imagePos)
+        viewport = self.scrollArea.viewport()
+        self.scrollArea.horizontalScrollBar().setValue(int(widgetPos.x() - viewport.width() / 2))
+        self.scrollArea.verticalScrollBar().setValue(int(widgetPos.y() - viewport.height() / 2))
+
+    def mousePressEvent(self, ev):
+        if ev.button() == Qt.LeftButton:
+            self.centerOn(ev.pos())
+
+    def mouseMoveEvent(self, ev):
+        if ev.buttons() & Qt.LeftButton:
+            self.centerOn(ev.pos())
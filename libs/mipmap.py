@@ -0,0 +1,109 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import math
+
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+
+# Stop halving once the longest side of a level gets this small.
+MIN_LEVEL_SIZE = 256
+
+
+class _BuilderSignals(QObject):
+    levelReady = pyqtSignal(int, int, QImage)
+
+
+class _MipmapBuilder(QRunnable):
+    """Halve the image repeatedly off the GUI thread.
+
+    QPixmap may only be touched by the GUI thread, so levels travel back
+    as QImages and are converted by MipmapCache on arrival.
+    """
+
+    def __init__(self, generation, image, signals):
+        super(_MipmapBuilder, self).__init__()
+        self.generation = generation
+        self.image = image
+        self.signals = signals
+        self.cancelled = False
+
+    def run(self):
+        image = self.image
+        level = 0
+        while max(image.width(), image.height()) > MIN_LEVEL_SIZE:
+            if self.cancelled:
+                return
+            image = image.scaled(max(1, image.width() // 2),
+                                 max(1, image.height() // 2),
+                                 Qt.IgnoreAspectRatio, Qt.SmoothTransformation)
+            level += 1
+            self.signals.levelReady.emit(self.generation, level, image)
+        self.image = None
+
+
+class MipmapCache(QObject):
+    """Power-of-two reductions of the canvas pixmap.
+
+    Level k is the image at 1/2**k of its size. Levels are built lazily
+    in the global thread pool the first time a zoomed-out frame asks for
+    one, and thrown away when the image changes.
+    """
+
+    levelAdded = pyqtSignal()
+
+    def __init__(self, parent=None):
+        super(MipmapCache, self).__init__(parent)
+        self.signals = _BuilderSignals()
+        self.signals.levelReady.connect(self.addLevel)
+        self.levels = {}
+        self.generation = 0
+        self.source = None
+        self.builder = None
+
+    def reset(self, source=None):
+        """Drop every level. source is the QImage or QPixmap to reduce on
+        the next build; a QPixmap is only converted once a level is needed."""
+        if self.builder is not None:
+            self.builder.cancelled = True
+            self.builder = None
+        self.generation += 1
+        self.levels = {}
+        self.source = source
+
+    def addLevel(self, generation, level, image):
+        if generation != self.generation:
+            return
+        self.levels[level] = QPixmap.fromImage(image)
+        self.levelAdded.emit()
+
+    def build(self):
+        if self.builder is not None or self.source is None or self.source.isNull():
+            return
+        image = self.source
+        if isinstance(image, QPixmap):
+            image = image.toImage()
+        self.builder = _MipmapBuilder(self.generation, image, self.signals)
+        QThreadPool.globalInstance().start(self.builder)
+
+    def levelFor(self, scale):
+        """Return the smallest ready level that still has at least `scale`
+        times the source resolution, or None to draw the source itself."""
+        if scale > 0.5 or scale <= 0:
+            return None
+        self.build()
+        wanted = int(math.floor(math.log(1.0 / scale, 2)))
+        for level in range(wanted, 0, -1):
+            if level in self.levels:
+                return self.levels[level]
+        return None
+
+    def thumbnail(self):
+        """The last level, at most MIN_LEVEL_SIZE on its longest side, or
+        None while it is still being built."""
+        if not self.levels:
+            return None
+        pixmap = self.levels[max(self.levels)]
+        if max(pixmap.width(), pixmap.height()) > MIN_LEVEL_SIZE:
+            return None
+        return pixmap
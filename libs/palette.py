@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+from PyQt5.QtGui import *
+from PyQt5.QtCore import *
+
+from .lib import generateColorByText
+
+
+class Palette(object):
+    """Colour of every class, worked out once per session.
+
+    color() and brush() hand out the same QColor and QBrush objects for
+    a label every time, so shapes and label rows share them and callers
+    must not modify them. Colours set with setColor() take precedence
+    over the ones hashed from the label text.
+    """
+
+    def __init__(self, overrides=None):
+        self._colors = {}
+        self._brushes = {}
+        self.overrides = {}
+        for label, color in (overrides or {}).items():
+            self.setColor(label, color)
+
+    def seed(self, labels):
+        """Compute the colours of labels ahead of time."""
+        for label in labels:
+            self.color(label)
+
+    def color(self, label):
+        color = self._colors.get(label)
+        if color is None:
+            color = self._colors[label] = generateColorByText(label)
+        return color
+
+    def brush(self, label):
+        brush = self._brushes.get(label)
+        if brush is None:
+            brush = self._brushes[label] = QBrush(self.color(label))
+        return brush
+
+    def setColor(self, label, color):
+        """Use color, a QColor or a colour name, for label from now on."""
+        color = QColor(color)
+        if not color.isValid():
+            return
+        self.overrides[label] = color
+        self._colors[label] = color
+        self._brushes.pop(label, None)
+
+    def resetColor(self, label):
+        """Go back to the hashed colour of label."""
+        if self.overrides.pop(label, None) is not None:
+            self._colors.pop(label, None)
+            self._brushes.pop(label, None)
+
+    def overrideNames(self):
+        """The user colours as {label: '#aarrggbb'}, for the settings."""
+        return dict((label, color.name(QColor.HexArgb))
+                    for label, color in self.overrides.items())
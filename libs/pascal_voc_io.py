@@ -1,11 +1,15 @@
 #!/usr/bin/env python
 # -*- coding: utf8 -*-
+import hashlib
+import math
 import sys
-from xml.etree import ElementTree
-from xml.etree.ElementTree import Element, SubElement
+from contextlib import contextmanager
+
+import numpy as np
 from lxml import etree
-import codecs
-import math
+
+from .geometry import rotatedToCorners
+from .processPool import orderedMap
 
 XML_EXT = '.xml'
 ENCODE_METHOD = 'utf-8'
@@ -22,60 +26,6 @@ class PascalVocWriter:
         self.localImgPath = localImgPath
         self.verified = False
 
-    def prettify(self, elem):
-        """
-            Return a pretty-printed XML string for the Element.
-        """
-        rough_string = ElementTree.tostring(elem, 'utf8')
-        root = etree.fromstring(rough_string)
-        return etree.tostring(root, pretty_print=True, encoding=ENCODE_METHOD).replace("  ".encode(), "\t".encode())
-        # minidom does not support UTF-8
-        '''reparsed = minidom.parseString(rough_string)
-        return reparsed.toprettyxml(indent="\t", encoding=ENCODE_METHOD)'''
-
-    def genXML(self):
-        """
-            Return XML root
-        """
-        # Check conditions
-        if self.filename is None or \
-                self.foldername is None or \
-                self.imgSize is None:
-            return None
-
-        top = Element('annotation')
-        if self.verified:
-            top.set('verified', 'yes')
-
-        folder = SubElement(top, 'folder')
-        folder.text = self.foldername
-
-        filename = SubElement(top, 'filename')
-        filename.text = self.filename
-
-        if self.localImgPath is not None:
-            localImgPath = SubElement(top, 'path')
-            localImgPath.text = self.localImgPath
-
-        source = SubElement(top, 'source')
-        database = SubElement(source, 'database')
-        database.text = self.databaseSrc
-
-        size_part = SubElement(top, 'size')
-        width = SubElement(size_part, 'width')
-        height = SubElement(size_part, 'height')
-        depth = SubElement(size_part, 'depth')
-        width.text = str(self.imgSize[1])
-        height.text = str(self.imgSize[0])
-        if len(self.imgSize) == 3:
-            depth.text = str(self.imgSize[2])
-        else:
-            depth.text = '1'
-
-        segmented = SubElement(top, 'segmented')
-        segmented.text = '0'
-        return top
-
     def addBndBox(self, xmin, ymin, xmax, ymax, name, difficult, extra):
         bndbox = {'xmin': xmin, 'ymin': ymin, 'xmax': xmax, 'ymax': ymax}
         bndbox['name'] = name
@@ -90,110 +40,125 @@ class PascalVocWriter:
         robndbox['extra'] = extra
         self.roboxlist.append(robndbox)
 
-    def appendObjects(self, top):
-        for each_object in self.boxlist:
-            object_item = SubElement(top, 'object')
-            name = SubElement(object_item, 'name')
-            try:
-                name.text = unicode(each_object['name'])
-            except NameError:
-                # Py3: NameError: name 'unicode' is not defined
-                name.text = each_object['name']
-            pose = SubElement(object_item, 'pose')
-            pose.text = "Unspecified"
-            truncated = SubElement(object_item, 'truncated')
-            if int(each_object['ymax']) == int(self.imgSize[0]) or (int(each_object['ymin'])== 1):
-                truncated.text = "1" # max == height or min
-            elif (int(each_object['xmax'])==int(self.imgSize[1])) or (int(each_object['xmin'])== 1):
-                truncated.text = "1" # max == width or min
-            else:
-                truncated.text = "0"
-            difficult = SubElement(object_item, 'difficult')
-            difficult.text = str( bool(each_object['difficult']) & 1 )
-            bndbox = SubElement(object_item, 'bndbox')
-            xmin = SubElement(bndbox, 'xmin')
-            xmin.text = str(each_object['xmin'])
-            ymin = SubElement(bndbox, 'ymin')
-            ymin.text = str(each_object['ymin'])
-            xmax = SubElement(bndbox, 'xmax')
-            xmax.text = str(each_object['xmax'])
-            ymax = SubElement(bndbox, 'ymax')
-            ymax.text = str(each_object['ymax'])
-            extra = SubElement(object_item, 'extra')
-            try:
-                extra.text = unicode(each_object['extra'])
-            except NameError:
-                # Py3: NameError: extra 'unicode' is not defined
-                extra.text = each_object['extra']
-
-        for each_object in self.roboxlist:
-            object_item = SubElement(top, 'object')
-            name = SubElement(object_item, 'name')
-            try:
-                name.text = unicode(each_object['name'])
-            except NameError:
-                # Py3: NameError: name 'unicode' is not defined
-                name.text = each_object['name']
-            pose = SubElement(object_item, 'pose')
-            pose.text = "Unspecified"
-            truncated = SubElement(object_item, 'truncated')
-            # if int(each_object['ymax']) == int(self.imgSize[0]) or (int(each_object['ymin'])== 1):
-            #     truncated.text = "1" # max == height or min
-            # elif (int(each_object['xmax'])==int(self.imgSize[1])) or (int(each_object['xmin'])== 1):
-            #     truncated.text = "1" # max == width or min
-            # else:
-            truncated.text = "0"
-            difficult = SubElement(object_item, 'difficult')
-            difficult.text = str( bool(each_object['difficult']) & 1 )
-            robndbox = SubElement(object_item, 'robndbox')
-            cx = SubElement(robndbox, 'cx')
-            cx.text = str(each_object['cx'])
-            cy = SubElement(robndbox, 'cy')
-            cy.text = str(each_object['cy'])
-            w = SubElement(robndbox, 'w')
-            w.text = str(each_object['w'])
-            h = SubElement(robndbox, 'h')
-            h.text = str(each_object['h'])
-            angle = SubElement(robndbox, 'angle')
-            angle.text = str(each_object['angle'])
-            extra = SubElement(object_item, 'extra')
-            try:
-                extra.text = unicode(each_object['extra'])
-            except NameError:
-                # Py3: NameError: extra 'unicode' is not defined
-                extra.text = each_object['extra']
+    def digest(self):
+        """Hash of the annotation: size, verified flag and objects, in
+        order. Writers with equal digests save the same annotations."""
+        content = repr((list(self.imgSize), bool(self.verified), self.boxlist, self.roboxlist))
+        return hashlib.sha1(content.encode(ENCODE_METHOD)).hexdigest()
+
+    def write(self, out):
+        """Write the annotation to the binary file object out in one
+        pass, indented with tabs the way lxml's pretty printer was."""
+        with etree.xmlfile(out, encoding=ENCODE_METHOD) as xf:
+            with xf.element('annotation', {'verified': 'yes'} if self.verified else {}):
+                _leaf(xf, 1, 'folder', self.foldername)
+                _leaf(xf, 1, 'filename', self.filename)
+                if self.localImgPath is not None:
+                    _leaf(xf, 1, 'path', self.localImgPath)
+                with _branch(xf, 1, 'source'):
+                    _leaf(xf, 2, 'database', self.databaseSrc)
+                with _branch(xf, 1, 'size'):
+                    _leaf(xf, 2, 'width', str(self.imgSize[1]))
+                    _leaf(xf, 2, 'height', str(self.imgSize[0]))
+                    _leaf(xf, 2, 'depth', str(self.imgSize[2]) if len(self.imgSize) == 3 else '1')
+                _leaf(xf, 1, 'segmented', '0')
+
+                height, width = int(self.imgSize[0]), int(self.imgSize[1])
+                for each_object in self.boxlist:
+                    # max == height or width, or min == 1
+                    truncated = int(each_object['ymax']) == height or int(each_object['ymin']) == 1 or \
+                        int(each_object['xmax']) == width or int(each_object['xmin']) == 1
+                    with _branch(xf, 1, 'object'):
+                        _objectHead(xf, each_object, truncated)
+                        with _branch(xf, 2, 'bndbox'):
+                            for key in ('xmin', 'ymin', 'xmax', 'ymax'):
+                                _leaf(xf, 3, key, str(each_object[key]))
+                        _leaf(xf, 2, 'extra', each_object['extra'])
+
+                for each_object in self.roboxlist:
+                    with _branch(xf, 1, 'object'):
+                        _objectHead(xf, each_object, False)
+                        with _branch(xf, 2, 'robndbox'):
+                            for key in ('cx', 'cy', 'w', 'h', 'angle'):
+                                _leaf(xf, 3, key, str(each_object[key]))
+                        _leaf(xf, 2, 'extra', each_object['extra'])
+                xf.write(_INDENT[0])
+        out.write(b'\n')
 
     def save(self, targetFile=None):
-        root = self.genXML()
-        self.appendObjects(root)
-        out_file = None
         if targetFile is None:
-            out_file = codecs.open(
-                self.filename + XML_EXT, 'w', encoding=ENCODE_METHOD)
-        else:
-            out_file = codecs.open(targetFile, 'w', encoding=ENCODE_METHOD)
+            targetFile = self.filename + XML_EXT
+        with open(targetFile, 'wb') as out_file:
+            self.write(out_file)
+
 
-        prettifyResult = self.prettify(root)
-        out_file.write(prettifyResult.decode('utf8'))
-        out_file.close()
+_INDENT = ['\n' + '\t' * depth for depth in range(4)]
+_EMPTY = {}
+
+
+def _leaf(xf, depth, tag, text):
+    xf.write(_INDENT[depth])
+    if text:
+        with xf.element(tag):
+            xf.write(text)
+    else:
+        # xmlfile would write <tag></tag>
+        empty = _EMPTY.get(tag)
+        if empty is None:
+            empty = _EMPTY[tag] = etree.Element(tag)
+        xf.write(empty)
+
+
+@contextmanager
+def _branch(xf, depth, tag):
+    xf.write(_INDENT[depth])
+    with xf.element(tag):
+        yield
+        xf.write(_INDENT[depth])
+
+
+def _objectHead(xf, each_object, truncated):
+    _leaf(xf, 2, 'name', each_object['name'])
+    _leaf(xf, 2, 'pose', 'Unspecified')
+    _leaf(xf, 2, 'truncated', '1' if truncated else '0')
+    _leaf(xf, 2, 'difficult', str(bool(each_object['difficult']) & 1))
+
+
+class PascalVocError(Exception):
+    """An annotation file that can not be read. line is the line of the
+    offending element, or None when it is not known."""
+
+    def __init__(self, filepath, reason, line=None):
+        super(PascalVocError, self).__init__(filepath, reason, line)
+        self.filepath = filepath
+        self.reason = reason
+        self.line = line
+
+    def __str__(self):
+        if self.line is None:
+            return '%s: %s' % (self.filepath, self.reason)
+        return '%s:%d: %s' % (self.filepath, self.line, self.reason)
 
 
 class PascalVocReader:
+    """Reads a VOC annotation file, raising PascalVocError when it is
+    malformed. Numbers are parsed, never evaluated."""
 
     def __init__(self, filepath):
         # shapes type:
         # [labbel, [(x1,y1), (x2,y2), (x3,y3), (x4,y4)], color, color, difficult]
         self.shapes = []
+        self.rotated = []
         self.width = 0
         self.height = 0
         self.depth = 0
         self.filepath = filepath
         self.filename = None
+        self.foldername = None
+        self.localImgPath = None
+        self.databaseSrc = None
         self.verified = False
-        try:
-            self.parseXML()
-        except:
-            pass
+        self.parseXML()
 
     def getShapes(self):
         return self.shapes
@@ -204,11 +169,45 @@ class PascalVocReader:
     def getImageFileName(self):
         return self.filename
 
+    def error(self, reason, elem=None):
+        return PascalVocError(self.filepath, reason, None if elem is None else elem.sourceline)
+
+    def children(self, elem):
+        """elem's children by tag, the first of each tag as find()
+        would, looked up without searching elem again."""
+        return {child.tag: child for child in reversed(elem)}
+
+    def child(self, parent, children, tag):
+        elem = children.get(tag)
+        if elem is None:
+            raise self.error('<%s> has no <%s>' % (parent.tag, tag), parent)
+        return elem
+
+    def number(self, parent, children, tag, cast=float):
+        """The text of parent's tag child as a finite number. Integers
+        may be written as floats, "12.0", and are truncated like the
+        writer does."""
+        elem = self.child(parent, children, tag)
+        text = elem.text
+        try:
+            if cast is int:
+                try:
+                    return int(text)
+                except ValueError:
+                    pass
+            value = float(text)
+            if math.isinf(value) or math.isnan(value):
+                raise ValueError(text)
+            return cast(value)
+        except (TypeError, ValueError):
+            raise self.error('<%s> is not a number: %r' % (tag, text), elem)
+
     def addShape(self, label, bndbox, difficult, extra=None):
-        xmin = int(eval(bndbox.find('xmin').text))
-        ymin = int(eval(bndbox.find('ymin').text))
-        xmax = int(eval(bndbox.find('xmax').text))
-        ymax = int(eval(bndbox.find('ymax').text))
+        box = self.children(bndbox)
+        xmin = self.number(bndbox, box, 'xmin', int)
+        ymin = self.number(bndbox, box, 'ymin', int)
+        xmax = self.number(bndbox, box, 'xmax', int)
+        ymax = self.number(bndbox, box, 'ymax', int)
         points = [(xmin, ymin), (xmax, ymin), (xmax, ymax), (xmin, ymax)]
         if extra is not None:
             self.shapes.append((label, points, None, None, difficult, extra))
@@ -216,69 +215,301 @@ class PascalVocReader:
             self.shapes.append((label, points, None, None, difficult))
 
     def addRotatedShape(self, label, robndbox, difficult, extra=None):
-        cx = float(robndbox.find('cx').text)
-        cy = float(robndbox.find('cy').text)
-        w = float(robndbox.find('w').text)
-        h = float(robndbox.find('h').text)
-        angle = float(robndbox.find('angle').text)
-
-        p0x,p0y = self.rotatePoint(cx,cy, cx - w/2, cy - h/2, -angle)
-        p1x,p1y = self.rotatePoint(cx,cy, cx + w/2, cy - h/2, -angle)
-        p2x,p2y = self.rotatePoint(cx,cy, cx + w/2, cy + h/2, -angle)
-        p3x,p3y = self.rotatePoint(cx,cy, cx - w/2, cy + h/2, -angle)
-
-        points = [(p0x, p0y), (p1x, p1y), (p2x, p2y), (p3x, p3y)]
+        box = self.children(robndbox)
+        cx = self.number(robndbox, box, 'cx')
+        cy = self.number(robndbox, box, 'cy')
+        w = self.number(robndbox, box, 'w')
+        h = self.number(robndbox, box, 'h')
+        angle = self.number(robndbox, box, 'angle')
+
+        # The corners are filled in by resolveRotatedShapes, for all
+        # rotated boxes of the file at once.
+        self.rotated.append((len(self.shapes), (cx, cy, w, h, angle)))
         if extra is not None:
-            self.shapes.append((label, points, None, None, difficult, True, angle, extra))
+            self.shapes.append((label, None, None, None, difficult, True, angle, extra))
         else:
-            self.shapes.append((label, points, None, None, difficult, True, angle))
-
-    def rotatePoint(self, xc,yc, xp,yp, theta):        
-        xoff = xp-xc
-        yoff = yp-yc
-
-        cosTheta = math.cos(theta)
-        sinTheta = math.sin(theta)
-        pResx = cosTheta * xoff + sinTheta * yoff
-        pResy = - sinTheta * xoff + cosTheta * yoff
-        # pRes = (xc + pResx, yc + pResy)
-        return xc+pResx,yc+pResy
+            self.shapes.append((label, None, None, None, difficult, True, angle))
+
+    def resolveRotatedShapes(self):
+        if not self.rotated:
+            return
+        indices = [i for i, _ in self.rotated]
+        corners = rotatedToCorners([box for _, box in self.rotated]).tolist()
+        for i, points in zip(indices, corners):
+            shape = self.shapes[i]
+            self.shapes[i] = shape[:1] + ([tuple(p) for p in points],) + shape[2:]
+        self.rotated = []
 
     def parseXML(self):
         assert self.filepath.endswith(XML_EXT), "Unsupport file format"
-        parser = etree.XMLParser(encoding=ENCODE_METHOD)
-        xmltree = ElementTree.parse(self.filepath, parser=parser).getroot()
-        self.filename = xmltree.find('filename').text
+        # No entities or network access, annotation files are data.
+        parser = etree.XMLParser(encoding=ENCODE_METHOD, resolve_entities=False,
+                                 no_network=True)
         try:
-            verified = xmltree.attrib['verified']
-            if verified == 'yes':
-                self.verified = True
-        except KeyError:
-            self.verified = False
-
+            xmltree = etree.parse(self.filepath, parser).getroot()
+        except etree.XMLSyntaxError as e:
+            raise PascalVocError(self.filepath, e.msg, e.lineno)
+        except (IOError, OSError) as e:
+            raise PascalVocError(self.filepath, str(e))
+        if xmltree.tag != 'annotation':
+            raise self.error('root is <%s>, not <annotation>' % xmltree.tag, xmltree)
+        self.filename = xmltree.findtext('filename')
+        self.foldername = xmltree.findtext('folder')
+        self.localImgPath = xmltree.findtext('path')
+        self.databaseSrc = xmltree.findtext('source/database')
+        self.verified = xmltree.get('verified') == 'yes'
+
+        # Other tools may leave the size out, it is then taken as 0 x 0.
         sizetag = xmltree.find('size')
-        widthtag = sizetag.find('width')
-        heighttag = sizetag.find('height')
-        depthtag = sizetag.find('depth')
-        self.width = eval(widthtag.text)
-        self.height = eval(heighttag.text)
-        self.depth = eval(depthtag.text)
-
-        for object_iter in xmltree.findall('object'):
-            bndbox = object_iter.find("bndbox")
-            if bndbox is None:
-                robndbox = object_iter.find('robndbox')
-            label = object_iter.find('name').text
+        if sizetag is not None:
+            size = self.children(sizetag)
+            self.width = self.number(sizetag, size, 'width', int)
+            self.height = self.number(sizetag, size, 'height', int)
+            self.depth = self.number(sizetag, size, 'depth', int)
+
+        for object_iter in xmltree.iterchildren('object'):
+            fields = self.children(object_iter)
+            label = self.child(object_iter, fields, 'name').text or ''
             # Add chris
             difficult = False
-            if object_iter.find('difficult') is not None:
-                difficult = bool(int(object_iter.find('difficult').text))
+            if 'difficult' in fields:
+                difficult = bool(self.number(object_iter, fields, 'difficult', int))
             extra = None
-            if object_iter.find('extra') is not None:
-                extra = object_iter.find('extra').text
-            if bndbox is None:
-                self.addRotatedShape(label, robndbox, difficult, extra)
-            else:                
-                self.addShape(label, bndbox, difficult, extra)
+            if 'extra' in fields:
+                extra = fields['extra'].text
+            if 'bndbox' in fields:
+                self.addShape(label, fields['bndbox'], difficult, extra)
+            else:
+                self.addRotatedShape(label, self.child(object_iter, fields, 'robndbox'),
+                                     difficult, extra)
 
+        self.resolveRotatedShapes()
         return True
+
+
+# Batches smaller than this are read in this process, a pool would take
+# longer to start than to parse them.
+BATCH_CHUNK = 256
+
+
+class VocColumns(object):
+    """The annotations of many files as NumPy columns.
+
+    Per file, in the order of `paths`: `filenames` (the <filename> text),
+    `width`, `height` and `depth`, 0 for files that could not be read,
+    and `verified`; `errors` maps the index of those files to their
+    PascalVocError.
+
+    Per box, files in order and boxes in file order: `image`, the index
+    of its file; `classId`, an index into `classes`, which lists labels
+    in order of first appearance; `corners`, (N, 4, 2) as
+    Shape.points; `rotated`, `angle` (0 for plain boxes), `difficult`
+    and `extra`, a list of the <extra> texts or None.
+    """
+
+    def __init__(self, paths):
+        self.paths = list(paths)
+        count = len(self.paths)
+        self.filenames = [None] * count
+        self.width = np.zeros(count, np.int64)
+        self.height = np.zeros(count, np.int64)
+        self.depth = np.zeros(count, np.int64)
+        self.verified = np.zeros(count, bool)
+        self.errors = {}
+        self.classes = []
+        self.image = np.zeros(0, np.int64)
+        self.classId = np.zeros(0, np.int32)
+        self.corners = np.zeros((0, 4, 2))
+        self.rotated = np.zeros(0, bool)
+        self.angle = np.zeros(0)
+        self.difficult = np.zeros(0, bool)
+        self.extra = []
+
+    def __len__(self):
+        return len(self.image)
+
+    def counts(self):
+        """Number of boxes of each file."""
+        return np.bincount(self.image, minlength=len(self.paths))
+
+    def offsets(self):
+        """Index of the first box of each file, and one past the last."""
+        return np.concatenate([[0], np.cumsum(self.counts())])
+
+    def shapes(self, i):
+        """The boxes of file i as PascalVocReader.getShapes() gives them."""
+        start, end = np.searchsorted(self.image, [i, i + 1]).tolist()
+        shapes = []
+        for k in range(start, end):
+            label = self.classes[self.classId[k]]
+            difficult = bool(self.difficult[k])
+            if self.rotated[k]:
+                points = [tuple(p) for p in self.corners[k].tolist()]
+                shape = (label, points, None, None, difficult, True, float(self.angle[k]))
+            else:
+                points = [tuple(p) for p in self.corners[k].astype(np.int64).tolist()]
+                shape = (label, points, None, None, difficult)
+            if self.extra[k] is not None:
+                shape += (self.extra[k],)
+            shapes.append(shape)
+        return shapes
+
+    def select(self, files):
+        """A VocColumns of the files of index files, in that order."""
+        files = np.asarray(files, np.int64).reshape(-1)
+        part = VocColumns([self.paths[i] for i in files])
+        part.filenames = [self.filenames[i] for i in files]
+        for name in ('width', 'height', 'depth', 'verified'):
+            setattr(part, name, getattr(self, name)[files])
+        part.errors = dict((j, self.errors[i]) for j, i in enumerate(files.tolist())
+                           if i in self.errors)
+        offsets = self.offsets()
+        counts = offsets[files + 1] - offsets[files]
+        if not counts.sum():
+            return part
+        # The boxes of each file, files in the new order.
+        boxes = np.repeat(offsets[files] - np.concatenate([[0], np.cumsum(counts)[:-1]]),
+                          counts) + np.arange(counts.sum())
+        part.image = np.repeat(np.arange(len(files)), counts)
+        # Classes again in order of first appearance.
+        used, first = np.unique(self.classId[boxes], return_index=True)
+        used = used[np.argsort(first)]
+        lut = np.zeros(len(self.classes), np.int32)
+        lut[used] = np.arange(len(used))
+        part.classes = [self.classes[c] for c in used.tolist()]
+        part.classId = lut[self.classId[boxes]]
+        for name in ('corners', 'rotated', 'angle', 'difficult'):
+            setattr(part, name, getattr(self, name)[boxes])
+        part.extra = [self.extra[k] for k in boxes.tolist()]
+        return part
+
+    def setBoxes(self, counts, labels, boxes, rotated, difficult, extra=None):
+        """Fill the box columns: counts[i] boxes of file i, in order.
+        A box is 5 numbers, xmin, ymin, xmax, ymax and anything, or cx,
+        cy, w, h, angle where rotated is set."""
+        if not labels:
+            return
+        self.extra = list(extra) if extra is not None else [None] * len(labels)
+        classIndex = {}
+        for label in labels:
+            if label not in classIndex:
+                classIndex[label] = len(self.classes)
+                self.classes.append(label)
+        self.image = np.repeat(np.arange(len(counts)), counts)
+        self.classId = np.array([classIndex[label] for label in labels], np.int32)
+        self.rotated = np.array(rotated, bool)
+        self.difficult = np.array(difficult, bool)
+        boxes = np.array(boxes, dtype=float)
+        xmin, ymin, xmax, ymax = boxes[:, :4].T
+        self.corners = np.stack([np.column_stack([xmin, ymin]), np.column_stack([xmax, ymin]),
+                                 np.column_stack([xmax, ymax]), np.column_stack([xmin, ymax])],
+                                axis=1)
+        self.corners[self.rotated] = rotatedToCorners(boxes[self.rotated])
+        self.angle = np.where(self.rotated, boxes[:, 4], 0.)
+
+
+class _ColumnReader(PascalVocReader):
+    """PascalVocReader that appends the boxes of a file to the lists of
+    _readChunk instead of building shape tuples. Boxes are kept as
+    5 numbers, xmin, ymin, xmax, ymax, 0 or cx, cy, w, h, angle, and
+    turned into corners once for the whole chunk."""
+
+    def __init__(self, filepath, labels, boxes, rotated, difficult, extra):
+        self.labels = labels
+        self.boxes = boxes
+        self.isRotated = rotated
+        self.isDifficult = difficult
+        self.extra = extra
+        PascalVocReader.__init__(self, filepath)
+
+    def addShape(self, label, bndbox, difficult, extra=None):
+        box = self.children(bndbox)
+        self.labels.append(label)
+        self.boxes.append((self.number(bndbox, box, 'xmin', int),
+                           self.number(bndbox, box, 'ymin', int),
+                           self.number(bndbox, box, 'xmax', int),
+                           self.number(bndbox, box, 'ymax', int), 0.))
+        self.isRotated.append(False)
+        self.isDifficult.append(difficult)
+        self.extra.append(extra)
+
+    def addRotatedShape(self, label, robndbox, difficult, extra=None):
+        box = self.children(robndbox)
+        self.labels.append(label)
+        self.boxes.append(tuple(self.number(robndbox, box, tag)
+                                for tag in ('cx', 'cy', 'w', 'h', 'angle')))
+        self.isRotated.append(True)
+        self.isDifficult.append(difficult)
+        self.extra.append(extra)
+
+    def resolveRotatedShapes(self):
+        pass
+
+
+def _readChunk(paths):
+    """Columns of the files in paths, labels as indices into a list of
+    this chunk's own."""
+    chunk = VocColumns(paths)
+    labels, boxes, rotated, difficult, extra, counts = [], [], [], [], [], []
+    for i, path in enumerate(paths):
+        start = len(labels)
+        try:
+            reader = _ColumnReader(path, labels, boxes, rotated, difficult, extra)
+        except PascalVocError as e:
+            chunk.errors[i] = e
+            # Drop what was read of the file before the error.
+            for column in (labels, boxes, rotated, difficult, extra):
+                del column[start:]
+        else:
+            chunk.filenames[i] = reader.filename
+            chunk.width[i], chunk.height[i], chunk.depth[i] = reader.getSize()
+            chunk.verified[i] = reader.verified
+        counts.append(len(labels) - start)
+    chunk.setBoxes(counts, labels, boxes, rotated, difficult, extra)
+    return chunk
+
+
+def readVocBatch(paths, processes=None, chunkSize=BATCH_CHUNK):
+    """Read the annotation files paths into one VocColumns.
+
+    Files are parsed chunkSize at a time in a pool of processes worker
+    processes, all CPUs when None. A single chunk, or processes=1, is
+    read in this process. Files that can not be read are listed in
+    VocColumns.errors rather than raising.
+    """
+    paths = list(paths)
+    chunks = [paths[i:i + chunkSize] for i in range(0, len(paths), chunkSize)]
+    return concatColumns(list(orderedMap(_readChunk, chunks, processes)))
+
+
+def concatColumns(parts):
+    """One VocColumns of the files of parts, in order."""
+    batch = VocColumns([path for part in parts for path in part.paths])
+    classIndex = {}
+    offset = 0
+    images, classIds, columns = [], [], []
+    for part in parts:
+        count = len(part.paths)
+        batch.filenames[offset:offset + count] = part.filenames
+        for name in ('width', 'height', 'depth', 'verified'):
+            getattr(batch, name)[offset:offset + count] = getattr(part, name)
+        for i, e in part.errors.items():
+            batch.errors[offset + i] = e
+        lut = np.zeros(len(part.classes), np.int32)
+        for local, label in enumerate(part.classes):
+            classId = classIndex.get(label)
+            if classId is None:
+                classId = classIndex[label] = len(batch.classes)
+                batch.classes.append(label)
+            lut[local] = classId
+        images.append(part.image + offset)
+        classIds.append(lut[part.classId])
+        columns.append((part.corners, part.rotated, part.angle, part.difficult))
+        batch.extra.extend(part.extra)
+        offset += count
+    if parts:
+        batch.image = np.concatenate(images)
+        batch.classId = np.concatenate(classIds)
+        batch.corners, batch.rotated, batch.angle, batch.difficult = \
+            [np.concatenate(column) for column in zip(*columns)]
+    return batch
@@ -0,0 +1,34 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+
+
+def orderedMap(function, items, processes=None, ahead=None):
+    """Yield function(item) for each of the list items, in order.
+
+    Items run in a pool of processes worker processes, all CPUs when
+    None, at most ahead of them (twice the workers by default) queued or
+    waiting to be collected, so memory does not grow with items. A
+    single item, or processes=1, runs in this process. function must be
+    importable by the workers.
+    """
+    if len(items) <= 1 or processes == 1:
+        for item in items:
+            yield function(item)
+        return
+    workers = processes or os.cpu_count() or 1
+    ahead = ahead or 2 * workers
+    # Workers are spawned, forking a process that runs Qt and other
+    # threads is not safe.
+    context = multiprocessing.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=context) as pool:
+        futures = [pool.submit(function, item) for item in items[:ahead]]
+        for i in range(len(items)):
+            if i + ahead < len(items):
+                futures.append(pool.submit(function, items[i + ahead]))
+            result = futures[i].result()
+            futures[i] = None
+            yield result
@@ -5,9 +5,11 @@
 from PyQt5.QtGui import *
 from PyQt5.QtCore import *
 
-from libs.lib import distance
+from libs.shapeStore import ShapeStore
+from libs.geometry import pointInRects, vertexWithin
 import sys
 import math
+from itertools import groupby
 
 DEFAULT_LINE_COLOR = QColor(0, 255, 0, 128)
 DEFAULT_FILL_COLOR = QColor(255, 0, 0, 128)
@@ -17,15 +19,78 @@ DEFAULT_VERTEX_FILL_COLOR = QColor(0, 255, 0, 255)
 DEFAULT_HVERTEX_FILL_COLOR = QColor(255, 0, 0)
 
 
+class ShapePoints(object):
+    """List-like view of the corners of one ShapeStore row as QPointFs."""
+
+    __slots__ = ('store', 'row')
+
+    def __init__(self, store, row):
+        self.store = store
+        self.row = row
+
+    def __len__(self):
+        return int(self.store.npoints[self.row])
+
+    def _index(self, i):
+        n = len(self)
+        if i < 0:
+            i += n
+        if not 0 <= i < n:
+            raise IndexError('shape point index out of range')
+        return i
+
+    def __getitem__(self, i):
+        if isinstance(i, slice):
+            return [self[j] for j in range(*i.indices(len(self)))]
+        x, y = self.store.points[self.row, self._index(i)]
+        return QPointF(x, y)
+
+    def __setitem__(self, i, p):
+        self.store.points[self.row, self._index(i)] = (p.x(), p.y())
+
+    def __iter__(self):
+        for x, y in self.store.points[self.row, :len(self)].tolist():
+            yield QPointF(x, y)
+
+    def append(self, p):
+        n = len(self)
+        self.store.points[self.row, n] = (p.x(), p.y())
+        self.store.npoints[self.row] = n + 1
+
+    def pop(self):
+        p = self[-1]
+        self.store.npoints[self.row] -= 1
+        return p
+
+
 class Shape(object):
+    """One box, stored as a row of a ShapeStore.
+
+    Geometry, label and flags live in the store; drawing state such as
+    colours, selection and highlighting stays on the object. A shape
+    created on its own gets a private one-row store, Canvas moves it into
+    its store with attach().
+    """
+
+    __slots__ = ('store', 'row', 'fill', 'selected', 'paintLabel',
+                 'highlightCorner', 'alwaysShowCorner',
+                 '_highlightIndex', '_highlightMode', '_closed',
+                 '_line_color', '_fill_color')
+
     P_SQUARE, P_ROUND = range(2)
 
     MOVE_VERTEX, NEAR_VERTEX = range(2)
 
+    # Vertex size factor and shape per highlight mode.
+    _highlightSettings = {
+        NEAR_VERTEX: (4, P_ROUND),
+        MOVE_VERTEX: (1.5, P_SQUARE),
+    }
+
     # The following class variables influence the drawing
     # of _all_ shape objects.
-    line_color = DEFAULT_LINE_COLOR
-    fill_color = DEFAULT_FILL_COLOR
+    default_line_color = DEFAULT_LINE_COLOR
+    default_fill_color = DEFAULT_FILL_COLOR
     select_line_color = DEFAULT_SELECT_LINE_COLOR
     select_fill_color = DEFAULT_SELECT_FILL_COLOR
     vertex_fill_color = DEFAULT_VERTEX_FILL_COLOR
@@ -35,44 +100,138 @@ class Shape(object):
     scale = 1.0
 
     def __init__(self, label=None, line_color=None, difficult=False, paintLabel=False, extra_label=''):
+        self.store = ShapeStore(1)
+        self.row = self.store.allocate()
+        self.store.views[self.row] = self
         self.label = label
-        self.points = []
-        self.fill = False
-        self.selected = False
         self.difficult = difficult
-        self.paintLabel = paintLabel
         self.extra_label = extra_label
+        self._initState(line_color, paintLabel)
+
+    @classmethod
+    def fromStore(cls, store, row):
+        """View on an existing row, e.g. one filled by ShapeStore.extend."""
+        shape = cls.__new__(cls)
+        shape.store = store
+        shape.row = row
+        store.views[row] = shape
+        shape._initState(None, False)
+        return shape
 
-        self.direction = 0
-        self.center = None
-        self.isRotated = True
+    def _initState(self, line_color, paintLabel):
+        self.fill = False
+        self.selected = False
+        self.paintLabel = paintLabel
 
         self.highlightCorner = False
         self.alwaysShowCorner = False
 
         self._highlightIndex = None
         self._highlightMode = self.NEAR_VERTEX
-        self._highlightSettings = {
-            self.NEAR_VERTEX: (4, self.P_ROUND),
-            self.MOVE_VERTEX: (1.5, self.P_SQUARE),
-        }
 
         self._closed = False
 
-        if line_color is not None:
-            # Override the class line_color attribute
-            # with an object attribute. Currently this
-            # is used for drawing the pending line a different color.
-            self.line_color = line_color
+        # None means the class default. A colour of its own is
+        # currently used for the label colours and for drawing the
+        # pending line a different color.
+        self._line_color = line_color
+        self._fill_color = None
+
+    def attach(self, store):
+        """Move this shape's row into store, keeping the object."""
+        moveShapes([self], store)
+
+    def detach(self):
+        """Move this shape into a private store, freeing its row."""
+        moveShapes([self], ShapeStore(1))
+
+    @property
+    def line_color(self):
+        if self._line_color is None:
+            return Shape.default_line_color
+        return self._line_color
+
+    @line_color.setter
+    def line_color(self, color):
+        self._line_color = color
+
+    @property
+    def fill_color(self):
+        if self._fill_color is None:
+            return Shape.default_fill_color
+        return self._fill_color
+
+    @fill_color.setter
+    def fill_color(self, color):
+        self._fill_color = color
+
+    @property
+    def points(self):
+        return ShapePoints(self.store, self.row)
+
+    @points.setter
+    def points(self, points):
+        points = [(p.x(), p.y()) for p in points]
+        self.store.points[self.row, :len(points)] = points
+        self.store.npoints[self.row] = len(points)
+
+    @property
+    def label(self):
+        return self.store.label(self.row)
+
+    @label.setter
+    def label(self, label):
+        self.store.classIds[self.row] = self.store.classId(label)
+
+    @property
+    def center(self):
+        x, y = self.store.centers[self.row]
+        if x != x:  # NaN, no centre yet
+            return None
+        return QPointF(x, y)
+
+    @center.setter
+    def center(self, center):
+        if center is None:
+            self.store.centers[self.row] = math.nan
+        else:
+            self.store.centers[self.row] = (center.x(), center.y())
+
+    @property
+    def direction(self):
+        return float(self.store.directions[self.row])
+
+    @direction.setter
+    def direction(self, direction):
+        self.store.directions[self.row] = direction
+
+    @property
+    def isRotated(self):
+        return bool(self.store.rotated[self.row])
+
+    @isRotated.setter
+    def isRotated(self, rotated):
+        self.store.rotated[self.row] = rotated
+
+    @property
+    def difficult(self):
+        return bool(self.store.difficult[self.row])
+
+    @difficult.setter
+    def difficult(self, difficult):
+        self.store.difficult[self.row] = difficult
+
+    @property
+    def extra_label(self):
+        return self.store.extras[self.row]
+
+    @extra_label.setter
+    def extra_label(self, extra_label):
+        self.store.extras[self.row] = extra_label
 
     def rotate(self, theta):
-        for i, p in enumerate(self.points):
-            self.points[i] = self.rotatePoint(p, theta)
-        self.direction -= theta
-        self.direction = self.direction % (2 * math.pi)
-        
         # self.direction is the angle between y axis and the dotline, clockwise
-        #print(self.direction * 180 / math.pi)
+        self.store.rotate([self.row], theta)
 
     def rotatePoint(self, p, theta):
         order = p - self.center
@@ -84,12 +243,13 @@ class Shape(object):
         return pRes    
 
     def close(self):
-        self.center = QPointF((self.points[0].x()+self.points[2].x()) / 2, (self.points[0].y()+self.points[2].y()) / 2)
+        pts = self.store.points[self.row]
+        self.store.centers[self.row] = (pts[0] + pts[2]) / 2
 
         self._closed = True
 
     def reachMaxPoints(self):
-        if len(self.points) >= 4:
+        if len(self) >= 4:
             return True
         return False
 
@@ -109,7 +269,8 @@ class Shape(object):
         self._closed = False
 
     def paint(self, painter):
-        if self.points:
+        points = list(self.points)
+        if points:
             color = self.select_line_color if self.selected else self.line_color
             pen = QPen(color)
             # Try using integer sizes for smoother drawing(?)
@@ -120,28 +281,31 @@ class Shape(object):
             line_path = QPainterPath()
             vrtx_path = QPainterPath()
             
-            line_path.moveTo(self.points[0])
+            line_path.moveTo(points[0])
             # Uncommenting the following line will draw 2 paths
             # for the 1st vertex, and make it non-filled, which
             # may be desirable.
             #self.drawVertex(vrtx_path, 0)
 
-            for i, p in enumerate(self.points):
+            for i, p in enumerate(points):
                 line_path.lineTo(p)
-                self.drawVertex(vrtx_path, i)
+                self.drawVertex(vrtx_path, i, p)
             if self.isClosed():
-                line_path.lineTo(self.points[0])
+                line_path.lineTo(points[0])
 
             painter.drawPath(line_path)
             if self.highlightCorner:
                 painter.drawPath(vrtx_path)
-                painter.fillPath(vrtx_path, self.vertex_fill_color)
+                if self._highlightIndex is not None:
+                    painter.fillPath(vrtx_path, self.hvertex_fill_color)
+                else:
+                    painter.fillPath(vrtx_path, self.vertex_fill_color)
 
             # Draw text at the top-left
             if self.paintLabel:
                 min_x = sys.maxsize
                 min_y = sys.maxsize
-                for point in self.points:
+                for point in points:
                     min_x = min(min_x, point.x())
                     min_y = min(min_y, point.y())
                 if min_x != sys.maxsize and min_y != sys.maxsize:
@@ -160,13 +324,14 @@ class Shape(object):
                 color = self.select_fill_color if self.selected else self.fill_color
                 painter.fillPath(line_path, color)
 
-            if self.center is not None and self.isRotated:
-                edgemid = (self.points[0] + self.points[1]) / 2
+            center = self.center
+            if center is not None and self.isRotated and len(points) > 1:
+                edgemid = (points[0] + points[1]) / 2
 
                 center_path = QPainterPath()
                 
                 center_path.moveTo(edgemid)
-                center_path.lineTo(self.center)
+                center_path.lineTo(center)
 
                 pen.setStyle(Qt.DotLine)
                 painter.setPen(pen)
@@ -181,25 +346,23 @@ class Shape(object):
 
 
     def paintNormalCenter(self, painter):
-        if self.center is not None:
+        center = self.center
+        if center is not None:
             center_path = QPainterPath();
             d = self.point_size / self.scale
-            center_path.addRect(self.center.x() - d / 2, self.center.y() - d / 2, d, d)
+            center_path.addRect(center.x() - d / 2, center.y() - d / 2, d, d)
             painter.drawPath(center_path)
             if not self.isRotated:
                 painter.fillPath(center_path, QColor(0, 0, 0))
 
-    def drawVertex(self, path, i):
+    def drawVertex(self, path, i, point=None):
         d = self.point_size / self.scale
         shape = self.point_type
-        point = self.points[i]
+        if point is None:
+            point = self.points[i]
         if i == self._highlightIndex:
             size, shape = self._highlightSettings[self._highlightMode]
             d *= size
-        if self._highlightIndex is not None:
-            self.vertex_fill_color = self.hvertex_fill_color
-        else:
-            self.vertex_fill_color = Shape.vertex_fill_color
         if shape == self.P_SQUARE:
             path.addRect(point.x() - d / 2, point.y() - d / 2, d, d)
         elif shape == self.P_ROUND:
@@ -208,28 +371,30 @@ class Shape(object):
             assert False, "unsupported vertex shape"
 
     def nearestVertex(self, point, epsilon):
-        for i, p in enumerate(self.points):
-            if distance(p - point) <= epsilon:
-                return i
-        return None
+        points = self.store.points[self.row:self.row + 1, :self.store.npoints[self.row]]
+        index = vertexWithin(points, point.x(), point.y(), epsilon)[0]
+        return None if index < 0 else int(index)
 
     def containsPoint(self, point):
-        return self.makePath().contains(point)
+        if self.store.npoints[self.row] < 4:
+            return self.makePath().contains(point)
+        return bool(pointInRects(self.store.points[self.row], point.x(), point.y())[0])
 
     def makePath(self):
-        path = QPainterPath(self.points[0])
-        for p in self.points[1:]:
+        points = list(self.points)
+        path = QPainterPath(points[0])
+        for p in points[1:]:
             path.lineTo(p)
         return path
 
     def boundingRect(self):
-        return self.makePath().boundingRect()
+        return QPolygonF(list(self.points)).boundingRect()
 
     def moveBy(self, offset):
-        self.points = [p + offset for p in self.points]
+        self.store.translate([self.row], offset.x(), offset.y())
 
     def moveVertexBy(self, i, offset):
-        self.points[i] = self.points[i] + offset
+        self.store.points[self.row, i] += (offset.x(), offset.y())
 
     def highlightVertex(self, i, action):
         self._highlightIndex = i
@@ -239,29 +404,44 @@ class Shape(object):
         self._highlightIndex = None
 
     def copy(self):
-        shape = Shape("%s" % self.label)
-        shape.points = [p for p in self.points]
-
-        shape.center = self.center
-        shape.direction = self.direction
-        shape.isRotated = self.isRotated
+        shape = Shape.__new__(Shape)
+        shape.store = ShapeStore(1)
+        shape.row = shape.store.copyRow(self.store, self.row)
+        shape.store.views[shape.row] = shape
+        shape._initState(None, False)
+        shape.label = "%s" % self.label
 
         shape.fill = self.fill
         shape.selected = self.selected
         shape._closed = self._closed
-        if self.line_color != Shape.line_color:
-            shape.line_color = self.line_color
-        if self.fill_color != Shape.fill_color:
-            shape.fill_color = self.fill_color
-        shape.difficult = self.difficult
-        shape.extra_label = self.extra_label
+        shape._line_color = self._line_color
+        shape._fill_color = self._fill_color
         return shape
 
     def __len__(self):
-        return len(self.points)
+        return int(self.store.npoints[self.row])
 
     def __getitem__(self, key):
         return self.points[key]
 
     def __setitem__(self, key, value):
         self.points[key] = value
+
+
+def moveShapes(shapes, store):
+    """Move the rows of shapes into store, in order, keeping the objects.
+
+    Rows are copied in bulk, one copy per run of shapes sharing a store,
+    so moving many shapes, e.g. detaching deleted ones into a single
+    ShapeStore(len(shapes)), costs a few array operations.
+    """
+    for source, run in groupby(shapes, key=lambda shape: shape.store):
+        if source is store:
+            continue
+        run = list(run)
+        rows = [shape.row for shape in run]
+        new = store.copyRows(source, rows)
+        source.releaseRows(rows)
+        for shape, row in zip(run, new.tolist()):
+            shape.store, shape.row = store, row
+            store.views[row] = shape
@@ -0,0 +1,255 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import numpy as np
+
+from .geometry import rotatePoints, pointInRects, vertexWithin
+
+
+class ShapeStore(object):
+    """Columnar storage for the shapes of one image.
+
+    Row i holds up to four (x, y) corners, the number of corners set so
+    far, the centre (NaN when unset), a class id into `classes`, the
+    direction, the rotated and difficult flags and the extra text.
+    `Shape` objects are thin views on one row each, `views[i]` is the
+    view of row i.
+
+    Rows are only ever appended, so row order is creation order, which
+    is also the paint order of Canvas.shapes. Deleted rows are marked
+    dead and dropped when the store is rebuilt for the next image.
+    """
+
+    def __init__(self, capacity=16):
+        capacity = max(1, capacity)
+        self.points = np.zeros((capacity, 4, 2))
+        self.npoints = np.zeros(capacity, np.int8)
+        self.centers = np.full((capacity, 2), np.nan)
+        self.classIds = np.full(capacity, -1, np.int32)
+        self.directions = np.zeros(capacity)
+        self.rotated = np.zeros(capacity, bool)
+        self.difficult = np.zeros(capacity, bool)
+        self.alive = np.zeros(capacity, bool)
+        self.extras = [''] * capacity
+        self.views = [None] * capacity
+        self.classes = []
+        self._classIndex = {}
+        self.size = 0
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive[:self.size]))
+
+    def _reserve(self, count):
+        capacity = len(self.alive)
+        needed = self.size + count
+        if needed <= capacity:
+            return
+        capacity = max(needed, 2 * capacity)
+        grow = capacity - len(self.alive)
+        self.points = np.concatenate([self.points, np.zeros((grow, 4, 2))])
+        self.npoints = np.concatenate([self.npoints, np.zeros(grow, np.int8)])
+        self.centers = np.concatenate([self.centers, np.full((grow, 2), np.nan)])
+        self.classIds = np.concatenate([self.classIds, np.full(grow, -1, np.int32)])
+        self.directions = np.concatenate([self.directions, np.zeros(grow)])
+        self.rotated = np.concatenate([self.rotated, np.zeros(grow, bool)])
+        self.difficult = np.concatenate([self.difficult, np.zeros(grow, bool)])
+        self.alive = np.concatenate([self.alive, np.zeros(grow, bool)])
+        self.extras.extend([''] * grow)
+        self.views.extend([None] * grow)
+
+    def classId(self, label):
+        if label is None:
+            return -1
+        cid = self._classIndex.get(label)
+        if cid is None:
+            cid = self._classIndex[label] = len(self.classes)
+            self.classes.append(label)
+        return cid
+
+    def label(self, row):
+        cid = self.classIds[row]
+        return None if cid < 0 else self.classes[cid]
+
+    def allocate(self):
+        """Append an empty row and return its index."""
+        self._reserve(1)
+        row = self.size
+        self.size += 1
+        self.points[row] = 0
+        self.npoints[row] = 0
+        self.centers[row] = np.nan
+        self.classIds[row] = -1
+        self.directions[row] = 0
+        self.rotated[row] = True
+        self.difficult[row] = False
+        self.alive[row] = True
+        self.extras[row] = ''
+        self.views[row] = None
+        return row
+
+    def copyRow(self, other, row):
+        """Append a copy of row `row` of store `other`, return the new row."""
+        return int(self.copyRows(other, [row])[0])
+
+    def copyRows(self, other, rows):
+        """Append copies of rows of store `other` in bulk, return the new
+        row indices."""
+        rows = np.asarray(rows, dtype=np.intp)
+        count = len(rows)
+        self._reserve(count)
+        new = np.arange(self.size, self.size + count)
+        self.size += count
+        self.points[new] = other.points[rows]
+        self.npoints[new] = other.npoints[rows]
+        self.centers[new] = other.centers[rows]
+        # Class ids of other to ours, the last entry maps -1 to itself.
+        ids = np.array([self.classId(c) for c in other.classes] + [-1], np.int32)
+        self.classIds[new] = ids[other.classIds[rows]]
+        self.directions[new] = other.directions[rows]
+        self.rotated[new] = other.rotated[rows]
+        self.difficult[new] = other.difficult[rows]
+        self.alive[new] = True
+        self.extras[self.size - count:self.size] = [other.extras[r] for r in rows.tolist()]
+        return new
+
+    def release(self, row):
+        self.alive[row] = False
+        self.views[row] = None
+
+    def releaseRows(self, rows):
+        self.alive[rows] = False
+        for row in np.asarray(rows).tolist():
+            self.views[row] = None
+
+    def rowBytes(self):
+        """Memory taken by one row of the columns."""
+        arrays = (self.points, self.npoints, self.centers, self.classIds,
+                  self.directions, self.rotated, self.difficult, self.alive)
+        # Plus the extras and views list slots.
+        return sum(a.nbytes // len(a) for a in arrays) + 16
+
+    def extend(self, points, labels, difficult=None, rotated=None,
+               directions=None, extras=None):
+        """Append closed four-point shapes in bulk.
+
+        points is an (M, 4, 2) array-like, the other columns are
+        sequences of length M. Returns the new row indices.
+        """
+        points = np.asarray(points, dtype=float).reshape(-1, 4, 2)
+        count = len(points)
+        self._reserve(count)
+        rows = np.arange(self.size, self.size + count)
+        self.size += count
+        self.points[rows] = points
+        self.npoints[rows] = 4
+        self.centers[rows] = (points[:, 0] + points[:, 2]) / 2
+        self.classIds[rows] = [self.classId(l) for l in labels]
+        self.directions[rows] = 0 if directions is None else directions
+        self.rotated[rows] = False if rotated is None else rotated
+        self.difficult[rows] = False if difficult is None else difficult
+        self.alive[rows] = True
+        self.extras[self.size - count:self.size] = [''] * count if extras is None else list(extras)
+        return rows
+
+    def rowState(self, row):
+        """Everything stored for row, as a dict of field name to value."""
+        n = int(self.npoints[row])
+        return {
+            'points': self.points[row, :n].copy(),
+            'center': self.centers[row].copy(),
+            'direction': float(self.directions[row]),
+            'isRotated': bool(self.rotated[row]),
+            'label': self.label(row),
+            'difficult': bool(self.difficult[row]),
+            'extra_label': self.extras[row],
+        }
+
+    def setRowState(self, row, state):
+        """Write back the fields of a (possibly partial) rowState dict."""
+        if 'points' in state:
+            points = state['points']
+            self.points[row, :len(points)] = points
+            self.npoints[row] = len(points)
+        if 'center' in state:
+            self.centers[row] = state['center']
+        if 'direction' in state:
+            self.directions[row] = state['direction']
+        if 'isRotated' in state:
+            self.rotated[row] = state['isRotated']
+        if 'label' in state:
+            self.classIds[row] = self.classId(state['label'])
+        if 'difficult' in state:
+            self.difficult[row] = state['difficult']
+        if 'extra_label' in state:
+            self.extras[row] = state['extra_label']
+
+    def rows(self):
+        """Indices of the live rows, in creation order."""
+        return np.flatnonzero(self.alive[:self.size])
+
+    def translate(self, rows, dx, dy):
+        offset = np.array([dx, dy], dtype=float)
+        self.points[rows] += offset
+        self.centers[rows] += offset
+
+    def rotate(self, rows, theta):
+        """Rotate rows about their centres by theta, the same way as
+        Shape.rotatePoint does for a single point."""
+        self.points[rows] = rotatePoints(self.points[rows], self.centers[rows], theta)
+        self.directions[rows] = (self.directions[rows] - theta) % (2 * np.pi)
+
+    def clip(self, rows, width, height):
+        """Clamp the corners of rows into the width x height image."""
+        pts = self.points[rows]
+        np.clip(pts[..., 0], 0, width, out=pts[..., 0])
+        np.clip(pts[..., 1], 0, height, out=pts[..., 1])
+        self.points[rows] = pts
+        self.centers[rows] = (pts[:, 0] + pts[:, 2]) / 2
+
+    def boundingBoxes(self, rows=None):
+        """(M, 4) array of xmin, ymin, xmax, ymax, over the set corners."""
+        if rows is None:
+            rows = self.rows()
+        pts = self.points[rows]
+        valid = np.arange(4) < self.npoints[rows][:, None]
+        inf = np.where(valid, 0, np.inf)[..., None]
+        mins = np.min(pts + inf, axis=1)
+        maxs = np.max(pts - inf, axis=1)
+        return np.concatenate([mins, maxs], axis=1)
+
+    def hitCandidates(self, x, y, epsilon=0.0):
+        """Live rows whose bounding box, grown by epsilon, contains (x, y),
+        topmost (last created) first."""
+        n = self.size
+        pts = self.points[:n]
+        # Corner by corner rather than min/max over axis 1, which is a
+        # lot slower for four elements. x narrows the rows for y.
+        xs = pts[:, :, 0]
+        hit = (np.minimum(np.minimum(xs[:, 0], xs[:, 1]), np.minimum(xs[:, 2], xs[:, 3])) - epsilon <= x) & \
+              (np.maximum(np.maximum(xs[:, 0], xs[:, 1]), np.maximum(xs[:, 2], xs[:, 3])) + epsilon >= x)
+        hit &= self.alive[:n]
+        rows = np.flatnonzero(hit)
+        ys = pts[rows, :, 1]
+        keep = (ys.min(axis=1) - epsilon <= y) & (ys.max(axis=1) + epsilon >= y)
+        # Corners that are not set yet must not count.
+        partial = self.npoints[rows] < 4
+        if partial.any():
+            boxes = self.boundingBoxes(rows[partial])
+            keep[partial] = (boxes[:, 0] - epsilon <= x) & (x <= boxes[:, 2] + epsilon) & \
+                            (boxes[:, 1] - epsilon <= y) & (y <= boxes[:, 3] + epsilon)
+        return rows[keep][::-1]
+
+    def hitTest(self, x, y, epsilon=0.0):
+        """Hit-test (x, y) against every live row at once.
+
+        Returns the candidate rows as hitCandidates does, the corner of
+        each within epsilon of the point (-1 for none) and whether the
+        point is inside each; rows still being drawn are never inside.
+        """
+        rows = self.hitCandidates(x, y, epsilon)
+        pts = self.points[rows]
+        n = self.npoints[rows]
+        valid = np.arange(4) < n[:, None]
+        vertex = vertexWithin(np.where(valid[..., None], pts, np.inf), x, y, epsilon)
+        inside = (n == 4) & pointInRects(pts, x, y)
+        return rows, vertex, inside
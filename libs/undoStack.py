@@ -0,0 +1,186 @@
+# -*- coding: utf-8 -*-
+from __future__ import absolute_import
+
+import sys
+from collections import Counter, deque
+
+import numpy as np
+
+from PyQt5.QtCore import *
+
+# Default memory budget of one image's history.
+DEFAULT_UNDO_LIMIT = 32 * 1024 * 1024
+
+# Rough fixed cost of an entry, and of a shape in it: the Shape object
+# or the change tuple.
+_ENTRY_BYTES = 200
+_SHAPE_BYTES = 150
+
+
+def _same(a, b):
+    if isinstance(a, np.ndarray):
+        return a.shape == b.shape and np.array_equal(a, b, equal_nan=True)
+    return a == b
+
+
+def _stateBytes(state):
+    size = 0
+    for value in state.values():
+        size += value.nbytes + 96 if isinstance(value, np.ndarray) else sys.getsizeof(value)
+    return size
+
+
+def shapeState(shape):
+    return shape.store.rowState(shape.row)
+
+
+def diffStates(before, after):
+    """The fields that differ, as a pair of partial states."""
+    keys = [k for k in after if k in before and not _same(before[k], after[k])]
+    return dict((k, before[k]) for k in keys), dict((k, after[k]) for k in keys)
+
+
+class UndoEntry(object):
+    """One undoable step.
+
+    kind is 'edit', 'add' or 'remove'. An edit holds (shape, before,
+    after) triples with only the fields that changed, add and remove
+    hold the shapes themselves.
+    """
+
+    EDIT, ADD, REMOVE = 'edit', 'add', 'remove'
+
+    __slots__ = ('kind', 'changes', 'shapes', 'key', 'nbytes')
+
+    def __init__(self, kind, changes=(), shapes=(), key=None):
+        self.kind = kind
+        self.changes = list(changes)
+        self.shapes = list(shapes)
+        self.key = key
+        self.nbytes = self.estimateBytes()
+
+    def estimateBytes(self):
+        size = _ENTRY_BYTES + _SHAPE_BYTES * (len(self.changes) + len(self.shapes))
+        for _, before, after in self.changes:
+            size += _stateBytes(before) + _stateBytes(after)
+        # Added and removed shapes keep their rows, removed ones in the
+        # store Canvas.removeShapes moved them to.
+        for store, count in Counter(shape.store for shape in self.shapes).items():
+            size += count * store.rowBytes()
+        return size
+
+
+class UndoStack(QObject):
+    """Undo/redo history of the shapes of one image.
+
+    Entries record deltas rather than snapshots of Canvas.shapes, so
+    undoing or redoing costs time in the number of shapes changed.
+    Edits pushed with the same key one after another are merged into a
+    single entry, and the oldest entries are dropped once the history
+    takes more than limit bytes.
+    """
+
+    changed = pyqtSignal()
+
+    def __init__(self, limit=DEFAULT_UNDO_LIMIT, parent=None):
+        super(UndoStack, self).__init__(parent)
+        self.limit = limit
+        self.undoEntries = deque()
+        self.redoEntries = []
+        self.nbytes = 0
+        self._pending = None
+
+    def clear(self):
+        self.undoEntries.clear()
+        del self.redoEntries[:]
+        self.nbytes = 0
+        self._pending = None
+        self.changed.emit()
+
+    def canUndo(self):
+        return bool(self.undoEntries)
+
+    def canRedo(self):
+        return bool(self.redoEntries)
+
+    def begin(self, shapes):
+        """Remember the state of shapes before an edit, see commit()."""
+        self._pending = [(shape, shapeState(shape)) for shape in shapes]
+
+    def commit(self, key=None):
+        """Record what changed on the shapes given to begin().
+
+        Nothing is recorded when nothing changed. With a key, an edit
+        following one with the same key on the same shapes extends it.
+        """
+        pending, self._pending = self._pending, None
+        if not pending:
+            return
+        changes = []
+        for shape, before in pending:
+            before, after = diffStates(before, shapeState(shape))
+            if after:
+                changes.append((shape, before, after))
+        if not changes:
+            return
+        top = self.undoEntries[-1] if self.undoEntries else None
+        if key is not None and not self.redoEntries and top is not None and \
+                top.kind == UndoEntry.EDIT and top.key == key and \
+                [c[0] for c in top.changes] == [c[0] for c in changes]:
+            self.undoEntries.pop()
+            self.nbytes -= top.nbytes
+            changes = self._merge(top.changes, changes)
+            if not changes:
+                self.changed.emit()
+                return
+        self.push(UndoEntry(UndoEntry.EDIT, changes=changes, key=key))
+
+    def _merge(self, older, newer):
+        merged = []
+        for (shape, before0, after0), (_, before1, after1) in zip(older, newer):
+            before = dict(before1)
+            before.update(before0)
+            after = dict(after0)
+            after.update(after1)
+            before, after = diffStates(before, after)
+            if after:
+                merged.append((shape, before, after))
+        return merged
+
+    def recordAdd(self, shapes):
+        self._pending = None
+        self.push(UndoEntry(UndoEntry.ADD, shapes=shapes))
+
+    def recordRemove(self, shapes):
+        self._pending = None
+        self.push(UndoEntry(UndoEntry.REMOVE, shapes=shapes))
+
+    def push(self, entry):
+        for old in self.redoEntries:
+            self.nbytes -= old.nbytes
+        del self.redoEntries[:]
+        self.undoEntries.append(entry)
+        self.nbytes += entry.nbytes
+        while self.nbytes > self.limit and len(self.undoEntries) > 1:
+            self.nbytes -= self.undoEntries.popleft().nbytes
+        self.changed.emit()
+
+    def undo(self):
+        """Pop the last entry for the caller to revert, or None."""
+        if not self.undoEntries:
+            return None
+        entry = self.undoEntries.pop()
+        self.redoEntries.append(entry)
+        self._pending = None
+        self.changed.emit()
+        return entry
+
+    def redo(self):
+        """Pop the last undone entry for the caller to apply again, or None."""
+        if not self.redoEntries:
+            return None
+        entry = self.redoEntries.pop()
+        self.undoEntries.append(entry)
+        self._pending = None
+        self.changed.emit()
+        return entry
@@ -0,0 +1,229 @@
+# -*- coding: utf-8 -*-
+"""Parsed annotation files, cached next to them.
+
+Each directory of annotation files gets a CACHE_NAME file holding the
+VocColumns of the files read from it, with the modification time and
+size each had. readVocCached parses only the files whose time or size
+changed since and rewrites the cache; readCached reads a single file
+from it when it is fresh. The cache of a directory is also kept in
+memory while its file is unchanged, so that switching images does not
+reload it.
+
+A cache that can not be read is rebuilt, one that can not be written,
+in a read-only directory for instance, is skipped.
+"""
+from __future__ import absolute_import
+
+import os
+import threading
+import zipfile
+
+import numpy as np
+
+from .annotationWriter import atomicWrite
+from .pascal_voc_io import PascalVocReader, PascalVocError, VocColumns, concatColumns, readVocBatch
+
+CACHE_NAME = '.labelImg2.cache.npz'
+CACHE_VERSION = 1
+
+# Caches of the directories read, by directory: (stat of the cache file,
+# _DirCache).
+_memory = {}
+_lock = threading.Lock()
+
+
+def _stat(path):
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return st.st_mtime_ns, st.st_size
+
+
+def _strings(values):
+    """values, with None, as a string array and a mask of the set ones."""
+    return (np.array([v or '' for v in values], dtype=str),
+            np.array([v is not None for v in values], bool))
+
+
+def _unstrings(values, isSet):
+    return [v if s else None for v, s in zip(values.tolist(), isSet.tolist())]
+
+
+class _DirCache(object):
+    """The cached files of a directory: columns, and the time and size
+    of each file when it was read."""
+
+    def __init__(self, columns, mtime, size):
+        self.columns = columns
+        self.mtime = mtime
+        self.size = size
+        self.index = dict((os.path.basename(p), i) for i, p in enumerate(columns.paths))
+
+    def fresh(self, path, stat):
+        i = self.index.get(os.path.basename(path))
+        if i is not None and stat is not None and \
+                (int(self.mtime[i]), int(self.size[i])) == stat:
+            return i
+        return None
+
+    def save(self, cachePath):
+        c = self.columns
+        filenames, hasFilename = _strings(c.filenames)
+        extra, hasExtra = _strings(c.extra)
+        errors = sorted(c.errors.items())
+        arrays = dict(
+            version=np.array(CACHE_VERSION),
+            names=np.array([os.path.basename(p) for p in c.paths], dtype=str),
+            mtime=np.asarray(self.mtime, np.int64), size=np.asarray(self.size, np.int64),
+            filenames=filenames, hasFilename=hasFilename,
+            width=c.width, height=c.height, depth=c.depth, verified=c.verified,
+            errorFile=np.array([i for i, _ in errors], np.int64),
+            errorReason=np.array([e.reason for _, e in errors], dtype=str),
+            errorLine=np.array([-1 if e.line is None else e.line for _, e in errors], np.int64),
+            classes=np.array(c.classes, dtype=str), image=c.image, classId=c.classId,
+            corners=c.corners, rotated=c.rotated, angle=c.angle, difficult=c.difficult,
+            extra=extra, hasExtra=hasExtra)
+        atomicWrite(cachePath, lambda f: np.savez(f, **arrays))
+
+    @staticmethod
+    def load(directory, cachePath):
+        with np.load(cachePath, allow_pickle=False) as data:
+            if int(data['version']) != CACHE_VERSION:
+                raise ValueError('version %d' % int(data['version']))
+            c = VocColumns([os.path.join(directory, name) for name in data['names'].tolist()])
+            c.filenames = _unstrings(data['filenames'], data['hasFilename'])
+            for name in ('width', 'height', 'depth', 'verified', 'image', 'classId',
+                         'corners', 'rotated', 'angle', 'difficult'):
+                setattr(c, name, data[name])
+            for i, reason, line in zip(data['errorFile'].tolist(), data['errorReason'].tolist(),
+                                       data['errorLine'].tolist()):
+                c.errors[i] = PascalVocError(c.paths[i], reason, None if line < 0 else line)
+            c.classes = data['classes'].tolist()
+            c.extra = _unstrings(data['extra'], data['hasExtra'])
+            return _DirCache(c, data['mtime'], data['size'])
+
+
+def _dirCache(directory):
+    """The cache of directory, empty when there is none or it is broken."""
+    cachePath = os.path.join(directory, CACHE_NAME)
+    stat = _stat(cachePath)
+    with _lock:
+        known = _memory.get(directory)
+    if known is not None and known[0] == stat:
+        return known[1]
+    cache = None
+    if stat is not None:
+        try:
+            cache = _DirCache.load(directory, cachePath)
+        except (IOError, OSError, KeyError, ValueError, zipfile.BadZipFile):
+            cache = None
+    if cache is None:
+        cache = _DirCache(VocColumns([]), np.zeros(0, np.int64), np.zeros(0, np.int64))
+    with _lock:
+        _memory[directory] = (stat, cache)
+    return cache
+
+
+def _update(directory, cache, keep, read, readStats):
+    """Store the files keep of cache and the VocColumns read, whose
+    files had readStats, as the cache of directory."""
+    read = read.select([i for i, stat in enumerate(readStats) if stat is not None])
+    readStats = [stat for stat in readStats if stat is not None]
+    columns = concatColumns([cache.columns.select(keep), read])
+    mtime = np.concatenate([cache.mtime[keep], [s[0] for s in readStats]]).astype(np.int64)
+    size = np.concatenate([cache.size[keep], [s[1] for s in readStats]]).astype(np.int64)
+    updated = _DirCache(columns, mtime, size)
+    cachePath = os.path.join(directory, CACHE_NAME)
+    try:
+        updated.save(cachePath)
+        stat = _stat(cachePath)
+    except (IOError, OSError):
+        stat = None
+    with _lock:
+        _memory[directory] = (stat, updated)
+
+
+def readVocCached(paths, processes=None):
+    """readVocBatch(paths), parsing only the files not cached or changed
+    since they were."""
+    paths = list(paths)
+    byDir = {}
+    for i, path in enumerate(paths):
+        byDir.setdefault(os.path.dirname(os.path.abspath(path)), []).append(i)
+
+    parts = []
+    # Where each file is: (part, index in the part).
+    where = [None] * len(paths)
+    for directory, files in byDir.items():
+        cache = _dirCache(directory)
+        hits, stale, staleStats = [], [], []
+        for i in files:
+            # Taken before parsing, a file saved meanwhile is read again.
+            stat = _stat(paths[i])
+            j = cache.fresh(paths[i], stat)
+            if j is None:
+                stale.append(i)
+                staleStats.append(stat)
+            else:
+                hits.append((i, j))
+        if stale:
+            read = readVocBatch([paths[i] for i in stale], processes)
+            # Files of the cache that were not asked for are kept.
+            names = set(os.path.basename(paths[i]) for i in stale)
+            keep = [j for j, p in enumerate(cache.columns.paths)
+                    if os.path.basename(p) not in names]
+            _update(directory, cache, keep, read, staleStats)
+            for k, i in enumerate(stale):
+                where[i] = (len(parts), k)
+            parts.append(read)
+        if hits:
+            for k, (i, _) in enumerate(hits):
+                where[i] = (len(parts), k)
+            parts.append(cache.columns.select([j for _, j in hits]))
+
+    offsets = np.cumsum([0] + [len(part.paths) for part in parts])
+    batch = concatColumns(parts).select([offsets[p] + k for p, k in where])
+    batch.paths = paths
+    for i, e in batch.errors.items():
+        batch.errors[i] = PascalVocError(paths[i], e.reason, e.line)
+    return batch
+
+
+def readCached(path):
+    """The annotation file path from the cache of its directory when it
+    is fresh there, else a PascalVocReader. A single file is not worth
+    rewriting the cache for, the next readVocCached of the directory
+    does it. Raises PascalVocError."""
+    cache = _dirCache(os.path.dirname(os.path.abspath(path)))
+    j = cache.fresh(path, _stat(path))
+    if j is None:
+        return PascalVocReader(path)
+    batch = cache.columns.select([j])
+    if 0 in batch.errors:
+        e = batch.errors[0]
+        raise PascalVocError(path, e.reason, e.line)
+    batch.paths = [path]
+    return CachedAnnotation(batch)
+
+
+class CachedAnnotation(object):
+    """The file of a one-file VocColumns, with the reading interface of
+    PascalVocReader."""
+
+    def __init__(self, batch):
+        self.filepath = batch.paths[0]
+        self.filename = batch.filenames[0]
+        self.width, self.height, self.depth = \
+            int(batch.width[0]), int(batch.height[0]), int(batch.depth[0])
+        self.verified = bool(batch.verified[0])
+        self.shapes = batch.shapes(0)
+
+    def getShapes(self):
+        return self.shapes
+
+    def getSize(self):
+        return self.width, self.height, self.depth
+
+    def getImageFileName(self):
+        return self.filename